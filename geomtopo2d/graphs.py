@@ -18,12 +18,15 @@ along with Geomtopo2d.  If not, see <http://www.gnu.org/licenses/>.
 
 from __future__ import print_function, division
 
-from scipy.spatial import Delaunay, distance, cKDTree
+from scipy.spatial import Delaunay, ConvexHull, distance, cKDTree
 from scipy.stats import norm as normal
+from scipy.sparse import coo_matrix, csr_matrix
+from scipy.sparse.csgraph import minimum_spanning_tree
 import itertools
 import math
 import numpy as np
 from numpy import linalg as la
+from .parallel import cpu_workers, process_map, shared_memory
 
 def srtedg( e ):
     """
@@ -33,30 +36,118 @@ def srtedg( e ):
         return (e[1], e[0])
     return (e[0], e[1])
 
-def delaunay_graph( points ):
+def sorted_edges( a, b, n ):
+    """
+    Small routine to make sorted and unique edges from their points, as an (m, 2) array.
+    """
+    a = np.asarray( a, dtype=np.int64 )
+    b = np.asarray( b, dtype=np.int64 )
+    keys = np.unique( np.minimum( a, b )*np.int64(n) + np.maximum( a, b ) )
+    return np.column_stack( np.divmod( keys, np.int64(n) ) )
+
+def triangulation_edges( triangulation ):
+    """
+    The edges of a Delaunay triangulation, as an (m, 2) array of sorted and
+    unique edges, each one from its lower to its upper index. An edge between
+    two triangles is taken from the first of them, so it's found once.
+    """
+    simplices = triangulation.simplices
+    neighbors = triangulation.neighbors
+    n = np.int64( len(triangulation.points) )
+    own = ( neighbors < 0 ) | ( neighbors > np.arange( len(simplices) )[:,None] )
+    a = simplices[:,[1, 2, 0]][own].astype(np.int64)
+    b = simplices[:,[2, 0, 1]][own].astype(np.int64)
+    keys = np.sort( np.minimum( a, b )*n + np.maximum( a, b ) )
+    return np.column_stack( np.divmod( keys, n ) ).astype( simplices.dtype )
+
+def adjacency_matrix( edges, n, weights=None ):
+    """
+    The adjacency matrix of a graph of n points, given its edges, as a sparse
+    CSR matrix with both directions of every edge. It is True where there is an
+    edge, or has the weights of the edges if given, for example their lengths.
+    """
+    edges = np.asarray( edges, dtype=np.int64 ).reshape((-1, 2))
+    if weights is None:
+        weights = np.ones( len(edges), dtype=bool )
+    rows = np.concatenate( [ edges[:,0], edges[:,1] ] )
+    cols = np.concatenate( [ edges[:,1], edges[:,0] ] )
+    order = np.argsort( rows*np.int64(n) + cols, kind='mergesort' )
+    indptr = np.concatenate( [ [0], np.cumsum( np.bincount( rows, minlength=n ) ) ] )
+    return csr_matrix( ( np.concatenate( [ weights, weights ] )[order], cols[order], indptr ), shape=(n, n) )
+
+def delaunay_graph( points, output="arrays", weighted=False ):
     """
     Calculates the delaunay triangulation of a set of points, and returns
-    its edges.
+    its edges, as an (m, 2) array, see triangulation_edges. With output "csr"
+    returns its adjacency matrix, with the lengths of the edges if weighted,
+    see adjacency_matrix.
     """
+    if not output in ( "arrays", "csr" ):
+        raise ValueError("Unknown output %s." % output)
     # Calculate the Delaunay triangulation.
     triangulation = Delaunay(points)
     # Get all its edges
-    edgs = set()
-    for tri in triangulation.simplices:
-        triedgs = []
-        for edg in itertools.combinations(tri,2):
-            edgs.add(srtedg(edg))
-    
-    return list(edgs)
+    edges = triangulation_edges( triangulation )
+    if output == "csr":
+        pts = triangulation.points
+        lengths = la.norm( pts[edges[:,1]] - pts[edges[:,0]], axis=1 ) if weighted else None
+        return adjacency_matrix( edges, len(pts), lengths )
+    return edges
 
-def gabriel_graph( points, matrix=None, tree_c=None, dt_c=None ):
+def gabriel_mask( triangulation, edges ):
+    """
+    Finds which edges of a Delaunay triangulation are in the gabriel graph. An
+    edge is in the gabriel graph if the vertices in front of it, in the triangles
+    at its sides, see it with an angle smaller than 90 degrees. Otherwise they
+    are inside, or on, the circle that has the edge as diameter.
+    """
+    points = triangulation.points
+    n = len(points)
+    simplices = triangulation.simplices.astype(np.int64)
+    a = simplices[:,[1, 2, 0]]
+    b = simplices[:,[2, 0, 1]]
+    va = points[a] - points[simplices]
+    vb = points[b] - points[simplices]
+    closed = np.einsum( 'ijk,ijk->ij', va, vb ) <= 0.0
+    blocked = np.sort( ( np.minimum( a, b )*n + np.maximum( a, b ) )[closed] )
+    edges = np.asarray( edges, dtype=np.int64 ).reshape((-1, 2))
+    keys = np.minimum( edges[:,0], edges[:,1] )*n + np.maximum( edges[:,0], edges[:,1] )
+    pos = np.minimum( np.searchsorted( blocked, keys ), max( len(blocked)-1, 0 ) )
+    return ( pos >= len(blocked) ) | ( blocked[pos] != keys ) if len(blocked) else np.ones( len(keys), dtype=bool )
+
+def gabriel_graph( points, matrix=None, tree_c=None, dt_c=None, engine="tree", output="lists", weighted=False ):
     """
     Calculates the gabriel graph of a set of points, and then returns
     its edges.
     The gabriel graph is the pair of points, that given a circle (sphere, hypersphere),
     with its center in the middle of the points that passes through those points,
     the circle does not contain any other point of the sample.
+    The engine "tree" looks for points in the circle of every edge in a kd-tree, and
+    "delaunay" decides all the edges at once from the triangles, see
+    ProximityGraphBuilder.
+    Both return the same edges.
+    With output "csr" returns the adjacency matrix of the graph, with the
+    lengths of the edges if weighted, see adjacency_matrix.
     """
+    if not output in ( "lists", "csr" ):
+        raise ValueError("Unknown output %s." % output)
+    if engine == "delaunay":
+        builder = ProximityGraphBuilder( points )
+        if len(builder.triangulation.coplanar):
+            # Points left out of the triangulation can only be found in the tree.
+            return gabriel_graph( points, matrix, tree_c, dt_c, output=output, weighted=weighted )
+        if dt_c is not None:
+            dt_c['dt'] = builder.edges
+        if tree_c is not None:
+            tree_c['tree'] = builder.tree
+        if matrix is not None:
+            matrix.update( zip( map( tuple, builder.edges.tolist() ), builder.lengths.tolist() ) )
+        keep = builder.gabriel_indices()
+        if output == "csr":
+            return adjacency_matrix( builder.edges[keep], len(builder.points), builder.lengths[keep] if weighted else None )
+        return list(map( tuple, builder.edges[keep].tolist() ))
+    elif engine != "tree":
+        raise ValueError("Unknown engine %s." % engine)
     if matrix is None:
         matrix = {}
     initial = delaunay_graph( points )
@@ -66,7 +157,7 @@ def gabriel_graph( points, matrix=None, tree_c=None, dt_c=None ):
     if tree_c is not None:
         tree_c['tree'] = tree
     gabriel = []
-    for e0, e1 in initial:
+    for e0, e1 in initial.tolist():
         p0 = np.array(points[e0])
         p1 = np.array(points[e1])
         mid = (p0+p1)/2.0
@@ -79,15 +170,95 @@ def gabriel_graph( points, matrix=None, tree_c=None, dt_c=None ):
                 break
         else:
             gabriel.append( ( e0, e1 ) )
+    if output == "csr":
+        return adjacency_matrix( gabriel, len(points), np.array( [ matrix[e] for e in gabriel ] ) if weighted else None )
     return gabriel
 
-def relative_neighborhood_graph( points, matrix=None, dt_c=None ):
+def ball_pairs( tree, centers, radii ):
+    """
+    Small routine to find the points of a kd-tree in some circles, as flat
+    arrays of ( circle, point ) pairs.
+    """
+    try:
+        found = tree.query_ball_point( centers, radii )
+    except TypeError:
+        # Older scipy takes a single radius.
+        found = [ tree.query_ball_point( m, r ) for m, r in zip( centers, radii ) ]
+    counts = np.fromiter( map( len, found ), dtype=np.int64, count=len(centers) )
+    cand = np.fromiter( itertools.chain.from_iterable( found ), dtype=np.int64, count=int(counts.sum()) )
+    return np.repeat( np.arange( len(centers) ), counts ), cand
+
+def lune_mask( points, edges, lengths, tree, beta=2.0 ):
+    """
+    Finds which edges have no point inside their lune, given their lengths.
+    The lune of an edge, for beta >= 1, is the intersection of the two circles of
+    radius beta*length/2 centered on the edge at both sides of its middle, and it
+    passes through both of its points. With beta=2 the circles are centered in the
+    points, and the edges left are the ones of the relative neighborhood graph.
+    Those lunes are inside a circle around the middle of the edge, so the tree
+    looks for all the circles at once, and the distances to the points found are
+    kept in flat arrays, by edge.
+    """
+    points = np.asarray( points, dtype=float )
+    edges = np.asarray( edges, dtype=np.int64 ).reshape((-1, 2))
+    lengths = np.asarray( lengths, dtype=float )
+    if not len(edges):
+        return np.ones( 0, dtype=bool )
+    mids = ( points[edges[:,0]] + points[edges[:,1]] ) / 2.0
+    if beta == 2:
+        c0 = points[edges[:,0]]
+        c1 = points[edges[:,1]]
+        inner = lengths
+        radii = lengths*math.sin(math.radians(60))
+    else:
+        axis = ( points[edges[:,1]] - points[edges[:,0]] )*( ( beta - 1.0 ) / 2.0 )
+        c0 = mids - axis
+        c1 = mids + axis
+        inner = lengths*( beta / 2.0 )
+        radii = lengths*( math.sqrt( 2.0*beta - 1.0 ) / 2.0 )
+    edge, cand = ball_pairs( tree, mids, radii )
+    d0 = la.norm( points[cand] - c0[edge], axis=1 )
+    d1 = la.norm( points[cand] - c1[edge], axis=1 )
+    closer = ( d0 < inner[edge] ) & ( d1 < inner[edge] ) & ( cand != edges[edge,0] ) & ( cand != edges[edge,1] )
+    return np.bincount( edge[closer], minlength=len(edges) ) == 0
+
+def rng_mask( points, edges, lengths, tree ):
+    """
+    Finds which edges are in the relative neighborhood graph, given their
+    lengths. An edge is not in the graph if a point is closer to both of its
+    points than they are to each other, see lune_mask.
+    """
+    return lune_mask( points, edges, lengths, tree, 2.0 )
+
+def relative_neighborhood_graph( points, matrix=None, dt_c=None, engine="tree", output="lists", weighted=False ):
     """
     Calculates the relative neighborhood graph.
     The relative neighborhood graph is the graph that
     given two points, it has an edge if there's no point
     that's closer to both of them.
+    The engine "tree" looks for the points close to every edge in a kd-tree, and
+    "delaunay" finds the gabriel edges from the triangles, and checks them all
+    at once, see ProximityGraphBuilder. Both return the same edges.
+    With output "csr" returns the adjacency matrix of the graph, with the
+    lengths of the edges if weighted, see adjacency_matrix.
     """
+    if not output in ( "lists", "csr" ):
+        raise ValueError("Unknown output %s." % output)
+    if engine == "delaunay":
+        builder = ProximityGraphBuilder( points )
+        if len(builder.triangulation.coplanar):
+            # Points left out of the triangulation can only be found in the tree.
+            return relative_neighborhood_graph( points, matrix, dt_c, output=output, weighted=weighted )
+        if dt_c is not None:
+            dt_c['dt'] = builder.edges
+        if matrix is not None:
+            matrix.update( zip( map( tuple, builder.edges.tolist() ), builder.lengths.tolist() ) )
+        keep = builder.rng_indices()
+        if output == "csr":
+            return adjacency_matrix( builder.edges[keep], len(builder.points), builder.lengths[keep] if weighted else None )
+        return list(map( tuple, builder.edges[keep].tolist() ))
+    elif engine != "tree":
+        raise ValueError("Unknown engine %s." % engine)
     if matrix is None:
         matrix = {}
     tree_c = {}
@@ -123,5 +294,993 @@ def relative_neighborhood_graph( points, matrix=None, dt_c=None ):
                     break
         else:
             rng.append( ( e0, e1 ) )
+    if output == "csr":
+        return adjacency_matrix( rng, len(points), np.array( [ matrix[e] for e in rng ] ) if weighted else None )
     return rng
 
+
+class ProximityGraphBuilder( object ):
+    """
+    Builds the proximity graphs of a set of points. The triangulation, the kd-tree,
+    the delaunay edges and their lengths are calculated the first time a graph
+    needs them and kept, so all the graphs, and the same graph with different
+    parameters, share them. Every graph is an (m, 2) array of sorted and unique
+    edges, each one from its lower to its upper index, see triangulation_edges.
+    """
+    def __init__( self, points ):
+        self.points = np.asarray( points, dtype=float )
+        self._triangulation = None
+        self._tree = None
+        self._edges = None
+        self._lengths = None
+        self._gabriel = None
+        self._rng = None
+        self._emst = None
+        self._neighbors = None
+    
+    @property
+    def triangulation( self ):
+        if self._triangulation is None:
+            self._triangulation = Delaunay( self.points )
+        return self._triangulation
+    
+    @property
+    def tree( self ):
+        if self._tree is None:
+            self._tree = cKDTree( self.points )
+        return self._tree
+    
+    @property
+    def edges( self ):
+        if self._edges is None:
+            self._edges = triangulation_edges( self.triangulation )
+        return self._edges
+    
+    @property
+    def lengths( self ):
+        """
+        The lengths of the delaunay edges, in the same order.
+        """
+        if self._lengths is None:
+            edges = self.edges
+            self._lengths = la.norm( self.points[edges[:,1]] - self.points[edges[:,0]], axis=1 )
+        return self._lengths
+    
+    def delaunay( self ):
+        """
+        The edges of the delaunay triangulation.
+        """
+        return self.edges
+    
+    def gabriel_indices( self ):
+        """
+        The positions, in the delaunay edges, of the gabriel edges, see gabriel_mask.
+        Points left out of the triangulation, repeated points, are only found
+        by looking in the circle of every edge in the kd-tree, as gabriel_graph does.
+        """
+        if self._gabriel is None:
+            triangulation = self.triangulation
+            edges = self.edges
+            mask = gabriel_mask( triangulation, edges )
+            if len(triangulation.coplanar):
+                for i in np.nonzero( mask )[0]:
+                    p0 = self.points[edges[i,0]]
+                    p1 = self.points[edges[i,1]]
+                    cls = self.tree.query_ball_point( (p0+p1)/2.0, la.norm(p1-p0)/2.0 )
+                    mask[i] = set( cls ) <= set( edges[i].tolist() )
+            self._gabriel = np.nonzero( mask )[0]
+        return self._gabriel
+    
+    def gabriel( self ):
+        """
+        The edges of the gabriel graph, that have no points in the circle that
+        has the edge as diameter.
+        """
+        return self.edges[self.gabriel_indices()]
+    
+    def rng_indices( self ):
+        """
+        The positions, in the delaunay edges, of the relative neighborhood edges,
+        the gabriel edges that have no point closer to both of their points, see rng_mask.
+        """
+        if self._rng is None:
+            gabriel = self.gabriel_indices()
+            self._rng = gabriel[rng_mask( self.points, self.edges[gabriel], self.lengths[gabriel], self.tree )]
+        return self._rng
+    
+    def rng( self ):
+        """
+        The edges of the relative neighborhood graph, see rng_indices.
+        """
+        return self.edges[self.rng_indices()]
+    
+    def beta_skeleton( self, beta ):
+        """
+        The edges of the lune based beta skeleton, for beta >= 1, the edges without
+        points inside their lune, see lune_mask. The lunes are open, so beta=2 is
+        the relative neighborhood graph, and beta=1 is the gabriel graph but for
+        the points exactly on the circles.
+        """
+        if beta < 1:
+            raise ValueError("The beta skeleton is only built for beta >= 1.")
+        if beta == 2:
+            return self.rng()
+        return self.edges[lune_mask( self.points, self.edges, self.lengths, self.tree, beta )]
+    
+    def emst( self ):
+        """
+        The edges of the euclidean minimum spanning tree, or forest if there are
+        repeated points, taken from the delaunay edges.
+        """
+        if self._emst is None:
+            n = len(self.points)
+            edges = self.edges
+            weights = coo_matrix( ( self.lengths, ( edges[:,0], edges[:,1] ) ), shape=(n, n) )
+            tree = minimum_spanning_tree( weights ).tocoo()
+            self._emst = sorted_edges( tree.row, tree.col, n ).astype( edges.dtype )
+        return self._emst
+    
+    def knn( self, k ):
+        """
+        The edges from every point to its k nearest neighbors, in both directions.
+        The neighbors are kept, so asking for fewer of them does not search again.
+        """
+        n = len(self.points)
+        if k < 1 or n < 2:
+            return np.zeros( (0, 2), dtype=np.int64 )
+        if self._neighbors is None or self._neighbors.shape[1] < k+1:
+            found = self.tree.query( self.points, k+1 )[1]
+            self._neighbors = found.reshape((n, -1))
+        found = self._neighbors[:,:k+1]
+        rows = np.arange( n )[:,None]
+        other = found != rows
+        # Repeated points may not find themselves first.
+        other[other.all( axis=1 ),-1] = False
+        other &= found < n
+        return sorted_edges( np.broadcast_to( rows, found.shape )[other], found[other], n )
+
+def hull_vertices( points, chunk=1<<20 ):
+    """
+    The vertices of the convex hull of a set of points, counterclockwise,
+    found from the hulls of chunks of the points, so only a chunk is copied
+    at once. None if the points are on a line.
+    """
+    keep = []
+    for start in range( 0, len(points), chunk ):
+        part = np.asarray( points[start:start+chunk], dtype=float )
+        try:
+            keep.append( part[ConvexHull( part ).vertices] )
+        except Exception:
+            # Points on a line keep their ends.
+            keep.append( part[[ np.argmin( part[:,0] ), np.argmax( part[:,0] ), np.argmin( part[:,1] ), np.argmax( part[:,1] ) ]] )
+    keep = np.concatenate( keep )
+    try:
+        return keep[ConvexHull( keep ).vertices]
+    except Exception:
+        return None
+
+def hull_meets( box, hull ):
+    """
+    Small routine to know if a box, ( x0, y0, x1, y1 ), touches a convex hull,
+    given its vertices counterclockwise. They don't if the box is outside one
+    of the edges of the hull.
+    """
+    corners = np.array( [ [ box[0], box[1] ], [ box[2], box[1] ], [ box[2], box[3] ], [ box[0], box[3] ] ] )
+    if ( hull[:,0].max() < box[0] or hull[:,0].min() > box[2] or
+         hull[:,1].max() < box[1] or hull[:,1].min() > box[3] ):
+        return False
+    edges = np.roll( hull, -1, axis=0 ) - hull
+    outer = np.column_stack( [ edges[:,1], -edges[:,0] ] )
+    side = np.einsum( 'ijk,ik->ij', corners[None,:,:] - hull[:,None,:], outer )
+    return not ( side > 0 ).all( axis=1 ).any()
+
+def tile_index( xy, xs, ys ):
+    """
+    Small routine to find the tile of points, given the bounds of the tiles in x and y.
+    """
+    tx = np.searchsorted( xs[1:-1], xy[:,0], side='right' )
+    ty = np.searchsorted( ys[1:-1], xy[:,1], side='right' )
+    return ty*( len(xs)-1 ) + tx
+
+class MissingTiles( Exception ):
+    """
+    Raised by tile_edges when it needs the points of a tile it was not given.
+    """
+
+def tile_edges( points, order, tile, layout, graph, known=None ):
+    """
+    Finds the edges of a proximity graph that have their middle point in a tile,
+    see tile_proximity_graph. The points are sorted by tile, and order has the
+    index of every one of them. If known is given, only the tiles in it have
+    their points, see tile_subset.
+    """
+    xs, ys, offsets, hull, halo = layout
+    nx = len(xs)-1
+    core = ( xs[tile % nx], ys[tile // nx], xs[tile % nx + 1], ys[tile // nx + 1] )
+    bounds = ( xs[0], ys[0], xs[-1], ys[-1] )
+    
+    def cells( box ):
+        cx = np.nonzero( ( xs[:-1] <= box[2] ) & ( xs[1:] >= box[0] ) )[0]
+        cy = np.nonzero( ( ys[:-1] <= box[3] ) & ( ys[1:] >= box[1] ) )[0]
+        found = ( cy[:,None]*nx + cx[None,:] ).ravel()
+        if known is not None and not known[found].all():
+            raise MissingTiles()
+        return found
+    
+    def gather( found ):
+        pos = np.concatenate( [ np.arange( offsets[c], offsets[c+1] ) for c in found ] + [ np.zeros( 0, dtype=np.int64 ) ] )
+        return pos, points[pos]
+    
+    def inside( pts, box ):
+        return ( pts[:,0] >= box[0] ) & ( pts[:,0] <= box[2] ) & ( pts[:,1] >= box[1] ) & ( pts[:,1] <= box[3] )
+    
+    def leaving( centers, radii, region ):
+        # The circles that leave the region, and their boxes inside the bounds.
+        boxes = np.column_stack( [ np.maximum( centers - radii[:,None], bounds[:2] ), np.minimum( centers + radii[:,None], bounds[2:] ) ] )
+        return np.nonzero( ~inside( boxes[:,:2], region ) | ~inside( boxes[:,2:], region ) )[0], boxes
+    
+    def outer( centers, radii, boxes, region ):
+        # The points outside the region in the circles, tile by tile, as ( circle, point ) pairs.
+        wanted = {}
+        for i, box in enumerate( boxes ):
+            for c in cells( box ):
+                wanted.setdefault( c, [] ).append( i )
+        for c, which in wanted.items():
+            pts = points[offsets[c]:offsets[c+1]]
+            pts = pts[~inside( pts, region )]
+            if not len(pts):
+                continue
+            which = np.array( which )
+            circle, cand = ball_pairs( cKDTree( pts ), centers[which], radii[which] )
+            yield which[circle], pts[cand]
+    
+    while True:
+        region = ( max( core[0]-halo, bounds[0] ), max( core[1]-halo, bounds[1] ), min( core[2]+halo, bounds[2] ), min( core[3]+halo, bounds[3] ) )
+        whole = region == bounds
+        pos, pts = gather( cells( region ) )
+        keep = inside( pts, region )
+        pos, pts = pos[keep], pts[keep]
+        try:
+            triangulation = Delaunay( pts )
+        except Exception:
+            if whole:
+                raise
+            halo *= 2
+            continue
+        if len(triangulation.coplanar):
+            return None
+        if whole:
+            break
+        if graph != "delaunay":
+            if not covered( core, halo, cKDTree( pts ), hull ):
+                halo *= 2
+                continue
+            break
+        simplices = triangulation.simplices.astype(np.int64)
+        corners = pts[simplices]
+        near = ( ( corners[:,:,0].min( axis=1 ) <= core[2] ) & ( corners[:,:,0].max( axis=1 ) >= core[0] ) &
+                 ( corners[:,:,1].min( axis=1 ) <= core[3] ) & ( corners[:,:,1].max( axis=1 ) >= core[1] ) )
+        if not near.any() and hull_meets( core, hull ):
+            halo *= 2
+            continue
+        if near.any() and not certified( triangulation, near, region, bounds, hull, outer ):
+            halo *= 2
+            continue
+        break
+    
+    edges = triangulation_edges( triangulation ).astype(np.int64)
+    mids = ( pts[edges[:,0]] + pts[edges[:,1]] ) / 2.0
+    edges = edges[tile_index( mids, xs, ys ) == tile]
+    if graph != "delaunay":
+        edges = edges[gabriel_mask( triangulation, edges )]
+        # The points outside the region can be in the circles of the longest edges.
+        mids = ( pts[edges[:,0]] + pts[edges[:,1]] ) / 2.0
+        radii = la.norm( pts[edges[:,1]] - pts[edges[:,0]], axis=1 ) / 2.0
+        out, boxes = leaving( mids, radii, region )
+        if len(out) and not whole:
+            keep = np.ones( len(edges), dtype=bool )
+            for edge, found in outer( mids[out], radii[out], boxes[out], region ):
+                edge = out[edge]
+                keep[edge[la.norm( found - mids[edge], axis=1 ) <= radii[edge]]] = False
+            edges = edges[keep]
+    if graph == "rng" and len(edges):
+        lengths = la.norm( pts[edges[:,1]] - pts[edges[:,0]], axis=1 )
+        keep = rng_mask( pts, edges, lengths, cKDTree( pts ) )
+        # The points outside the region can be in the lunes of the longest edges.
+        mids = ( pts[edges[:,0]] + pts[edges[:,1]] ) / 2.0
+        radii = lengths*math.sin(math.radians(60))
+        out, boxes = leaving( mids, radii, region )
+        if len(out) and not whole:
+            for edge, found in outer( mids[out], radii[out], boxes[out], region ):
+                edge = out[edge]
+                closer = ( ( la.norm( found - pts[edges[edge,0]], axis=1 ) < lengths[edge] ) &
+                           ( la.norm( found - pts[edges[edge,1]], axis=1 ) < lengths[edge] ) )
+                keep[edge[closer]] = False
+        edges = edges[keep]
+    ids = order[pos[edges.ravel()]].reshape((-1, 2))
+    return np.column_stack( [ ids.min( axis=1 ), ids.max( axis=1 ) ] )
+
+def covered( core, halo, tree, hull ):
+    """
+    Finds if every point of a tile inside the hull is closer than the halo to one
+    of the points in the tree. Then the edges of the gabriel graph with their
+    middle point in the tile are shorter than twice the halo, as their circle
+    is empty, and their points are in the tree. The tile is split in cells of
+    half the halo, and the distance from the center of a cell to its closest
+    point, and to its corners, bounds the distances in the cell.
+    """
+    w = core[2] - core[0]
+    h = core[3] - core[1]
+    kx = int( min( max( math.ceil( 2.0*w / halo ), 1 ), 1024 ) )
+    ky = int( min( max( math.ceil( 2.0*h / halo ), 1 ), 1024 ) )
+    cx = core[0] + ( np.arange( kx ) + 0.5 )*( w / kx )
+    cy = core[1] + ( np.arange( ky ) + 0.5 )*( h / ky )
+    centers = np.column_stack( [ np.repeat( cx, ky ), np.tile( cy, kx ) ] )
+    reach = tree.query( centers )[0] + math.hypot( w / kx, h / ky ) / 2.0
+    for x, y in centers[reach >= halo]:
+        box = ( x - w / kx / 2.0, y - h / ky / 2.0, x + w / kx / 2.0, y + h / ky / 2.0 )
+        if hull_meets( box, hull ):
+            return False
+    return True
+
+def circumcircles( points, simplices ):
+    """
+    The centers and radii of the circles through the corners of some triangles,
+    not finite for the flat ones.
+    """
+    a = points[simplices]
+    b = a[:,1] - a[:,0]
+    c = a[:,2] - a[:,0]
+    with np.errstate( divide='ignore', invalid='ignore' ):
+        d = 2.0*( b[:,0]*c[:,1] - b[:,1]*c[:,0] )
+        bb = ( b*b ).sum( axis=1 )
+        cc = ( c*c ).sum( axis=1 )
+        u = np.column_stack( [ c[:,1]*bb - b[:,1]*cc, b[:,0]*cc - c[:,0]*bb ] ) / d[:,None]
+    return a[:,0] + u, la.norm( u, axis=1 )
+
+def certified( triangulation, near, region, bounds, hull, outer ):
+    """
+    Finds if the triangles near a tile, in the triangulation of the points of a
+    region around it, are triangles of the triangulation of all the points. That
+    is, their edges on the hull are on the hull of all the points, and there's no
+    point outside the region in their circles. The circles of the triangles on the
+    hull are only searched on the side of the hull.
+    """
+    pts = triangulation.points
+    simplices = triangulation.simplices[near].astype(np.int64)
+    neighbors = triangulation.neighbors[near]
+    a = pts[simplices]
+    centers, radii = circumcircles( pts, simplices )
+    if not np.isfinite( radii ).all():
+        return False
+    lo = centers - radii[:,None]
+    hi = centers + radii[:,None]
+    
+    # Edges on the hull: the vertices of the whole hull are at their inner side.
+    tri, opp = np.nonzero( neighbors < 0 )
+    if len(tri):
+        e0 = a[tri,( opp + 1 ) % 3]
+        e1 = a[tri,( opp + 2 ) % 3]
+        inner = a[tri,opp]
+        axis = e1 - e0
+        side = np.sign( axis[:,0]*( inner[:,1] - e0[:,1] ) - axis[:,1]*( inner[:,0] - e0[:,0] ) )
+        cross = axis[:,0,None]*( hull[None,:,1] - e0[:,1,None] ) - axis[:,1,None]*( hull[None,:,0] - e0[:,0,None] )
+        if ( cross*side[:,None] < 0 ).any():
+            return False
+        # The part of the circle inside the hull is a cap over the edge.
+        normal = np.column_stack( [ -axis[:,1], axis[:,0] ] )*side[:,None]
+        normal /= la.norm( normal, axis=1 )[:,None]
+        height = radii[tri] + np.einsum( 'ij,ij->i', centers[tri] - e0, normal )
+        capped = height < radii[tri]
+        tri = tri[capped]
+        height = height[capped][:,None]
+        lo[tri] = np.maximum( lo[tri], np.minimum( e0[capped], e1[capped] ) - height )
+        hi[tri] = np.minimum( hi[tri], np.maximum( e0[capped], e1[capped] ) + height )
+    
+    lo = np.maximum( lo, bounds[:2] )
+    hi = np.minimum( hi, bounds[2:] )
+    out = np.nonzero( ( lo[:,0] < region[0] ) | ( lo[:,1] < region[1] ) | ( hi[:,0] > region[2] ) | ( hi[:,1] > region[3] ) )[0]
+    if not len(out):
+        return True
+    boxes = np.column_stack( [ lo[out], hi[out] ] )
+    for i, found in outer( centers[out], radii[out], boxes, region ):
+        if ( la.norm( found - centers[out[i]], axis=1 ) < radii[out[i]] ).any():
+            return False
+    return True
+
+def tile_proximity_graph( source, tile, layout, graph="rng" ):
+    """
+    Finds the edges of a proximity graph that have their middle point in a tile,
+    in a worker of proximity_graph_tiled. The points of the tile and of a halo
+    around it are triangulated, and the halo is doubled until the triangles that
+    touch the tile are the ones of all the points, see certified, or for the
+    gabriel and relative neighborhood graphs, until no edge of them can
+    leave the halo, see covered. The source is
+    the points, sorted by tile, and their indices, or the name of the shared
+    memory where they are, or the points around the tile, see tile_subset.
+    Returns None if there are repeated points, and False if the tile needs the
+    points of tiles that were not sent.
+    """
+    if not isinstance( source, tuple ):
+        n = int(layout[2][-1])
+        shm = shared_memory.SharedMemory( name=source )
+        points = np.ndarray( (n, 2), dtype=np.float64, buffer=shm.buf )
+        order = np.ndarray( (n,), dtype=np.int64, buffer=shm.buf, offset=n*16 )
+        try:
+            return tile_edges( points, order, tile, layout, graph )
+        finally:
+            del points, order
+            shm.close()
+    if len(source) > 2:
+        try:
+            return tile_edges( source[0], source[1], tile, layout, graph, source[2] )
+        except MissingTiles:
+            return False
+    return tile_edges( source[0], source[1], tile, layout, graph )
+
+def tile_subset( points, order, tile, layout, reach=4.0 ):
+    """
+    The points of the tiles closer to a tile than reach times the first halo,
+    to send them to a worker of proximity_graph_tiled when there is no shared
+    memory. Returns the source for tile_proximity_graph, with the points sorted
+    by tile, their indices and which tiles they are, and the layout with the
+    offsets of the tiles sent, the others empty.
+    """
+    xs, ys, offsets, hull, halo = layout
+    nx = len(xs)-1
+    core = ( xs[tile % nx], ys[tile // nx], xs[tile % nx + 1], ys[tile // nx + 1] )
+    cx = np.nonzero( ( xs[:-1] <= core[2] + reach*halo ) & ( xs[1:] >= core[0] - reach*halo ) )[0]
+    cy = np.nonzero( ( ys[:-1] <= core[3] + reach*halo ) & ( ys[1:] >= core[1] - reach*halo ) )[0]
+    sent = np.sort( ( cy[:,None]*nx + cx[None,:] ).ravel() )
+    known = np.zeros( len(offsets)-1, dtype=bool )
+    known[sent] = True
+    counts = np.zeros( len(offsets), dtype=np.int64 )
+    counts[sent+1] = offsets[sent+1] - offsets[sent]
+    ids = order[np.concatenate( [ np.arange( offsets[c], offsets[c+1] ) for c in sent ] )]
+    return ( np.asarray( points[ids], dtype=float ), ids, known ), ( xs, ys, np.cumsum( counts ), hull, halo )
+
+def proximity_graph_tiled( points, graph="rng", tile_size=250000, workers=1, halo=None ):
+    """
+    Calculates the delaunay, gabriel or relative neighborhood graph of a large
+    set of points by tiles. The points are split in square tiles of about
+    tile_size points, every tile is triangulated with a halo of points around
+    it, and keeps the edges with their middle point in it. Only the tile being
+    built, its halo, and a tile around it at once, are in memory in every worker.
+    The edges are the same of ProximityGraphBuilder, as an (m, 2) array, but for
+    the delaunay triangulation of points on a circle, that is not unique. The
+    delaunay triangles along the hull are long, so the halos of the tiles there
+    can grow large, while the gabriel and relative neighborhood graphs only
+    need a halo wider than the largest empty circle in the tile.
+    Parameters
+    ----------
+    points: array
+        The points, an (n, 2) array, or a memory map.
+    graph: str
+        "delaunay", "gabriel" or "rng".
+    tile_size: int
+        The number of points in a tile, on average.
+    workers: int
+        The number of processes, None to use all the cpus. The points are
+        shared with them in shared memory, that needs Python 3.8. Before it,
+        every worker is sent the points around its tile, see tile_subset, and
+        the tiles that need more are sent again with more tiles around them.
+    halo: float
+        The first width of the halos, four times the mean distance between points by default.
+    """
+    if graph not in ( "delaunay", "gabriel", "rng" ):
+        raise ValueError("Unknown graph %s." % graph)
+    n = len(points)
+    hull = hull_vertices( points ) if n > 2 else None
+    side = int( math.ceil( math.sqrt( max( n / float(tile_size), 1.0 ) ) ) )
+    if hull is None or side == 1:
+        return getattr( ProximityGraphBuilder( points ), graph )().astype(np.int64)
+    lo = hull.min( axis=0 )
+    hi = hull.max( axis=0 )
+    xs = np.linspace( lo[0], hi[0], side+1 )
+    ys = np.linspace( lo[1], hi[1], side+1 )
+    xs[-1], ys[-1] = hi
+    cell = np.concatenate( [ tile_index( np.asarray( points[s:s+(1<<20)], dtype=float ), xs, ys ) for s in range( 0, n, 1<<20 ) ] )
+    order = np.argsort( cell, kind='mergesort' ).astype(np.int64)
+    offsets = np.searchsorted( cell[order], np.arange( side*side+1 ) ).astype(np.int64)
+    del cell
+    if halo is None:
+        halo = 4.0*math.sqrt( ( hi[0]-lo[0] )*( hi[1]-lo[1] ) / n )
+    layout = ( xs, ys, offsets, hull, halo )
+    tiles = list(range( side*side ))
+    workers = cpu_workers( workers )
+    
+    if workers <= 1:
+        source = ( np.take( np.asarray( points, dtype=float ), order, axis=0 ), order )
+        found = [ tile_proximity_graph( source, t, layout, graph ) for t in tiles ]
+    elif shared_memory is None:
+        found = [ False for t in tiles ]
+        pending = tiles
+        reach = 4.0
+        while pending:
+            sent = [ tile_subset( points, order, t, layout, reach ) for t in pending ]
+            done = process_map( tile_proximity_graph, workers, [ x[0] for x in sent ], pending, [ x[1] for x in sent ], [ graph for t in pending ] )
+            del sent
+            for t, f in zip( pending, done ):
+                found[t] = f
+            pending = [ t for t in pending if found[t] is False ]
+            reach *= 4.0
+    else:
+        shm = shared_memory.SharedMemory( create=True, size=n*24 )
+        try:
+            for s in range( 0, n, 1<<20 ):
+                np.ndarray( (n, 2), dtype=np.float64, buffer=shm.buf )[s:s+(1<<20)] = np.asarray( points, dtype=float )[order[s:s+(1<<20)]]
+            np.ndarray( (n,), dtype=np.int64, buffer=shm.buf, offset=n*16 )[:] = order
+            found = process_map( tile_proximity_graph, workers, [ shm.name for t in tiles ], tiles, [ layout for t in tiles ], [ graph for t in tiles ] )
+        finally:
+            shm.close()
+            shm.unlink()
+    if any( f is None for f in found ):
+        # Repeated points are left out of the triangulations, see ProximityGraphBuilder.
+        return getattr( ProximityGraphBuilder( points ), graph )().astype(np.int64)
+    found = np.concatenate( found )
+    return sorted_edges( found[:,0], found[:,1], n )
+
+def triangles_gabriel( triangulation, selected ):
+    """
+    Finds which edges of some triangles of a Delaunay triangulation are in the
+    gabriel graph, as gabriel_mask, looking only at those triangles and the
+    ones next to them. Returns the edges, sorted, and if they are in the graph.
+    """
+    points = triangulation.points
+    simplices = triangulation.simplices.astype(np.int64)
+    neighbors = triangulation.neighbors
+    selected = np.asarray( selected, dtype=np.int64 )
+    tri = np.repeat( selected, 3 )
+    opp = np.tile( np.arange( 3 ), len(selected) )
+    a = simplices[tri,( opp + 1 ) % 3]
+    b = simplices[tri,( opp + 2 ) % 3]
+    c = simplices[tri,opp]
+    closed = np.einsum( 'ij,ij->i', points[a] - points[c], points[b] - points[c] ) <= 0.0
+    # The vertex in front of the edge, in the triangle at its other side.
+    other = neighbors[tri,opp]
+    side = other >= 0
+    back = np.argmax( neighbors[other[side]] == tri[side,None], axis=1 )
+    d = simplices[other[side],back]
+    closed[side] |= np.einsum( 'ij,ij->i', points[a[side]] - points[d], points[b[side]] - points[d] ) <= 0.0
+    n = np.int64( len(points) )
+    keys = np.minimum( a, b )*n + np.maximum( a, b )
+    keys, first = np.unique( keys, return_index=True )
+    return np.column_stack( np.divmod( keys, n ) ), ~closed[first]
+
+def edge_keys( edges ):
+    """
+    Small routine to give every edge, from its lower to its upper index, a number.
+    """
+    return edges[:,0]*np.int64( 1 << 32 ) + edges[:,1]
+
+def reach_index( centers, radii ):
+    """
+    Small routine to index circles of very different sizes. They are grouped by
+    the power of two of their radius, and every group has a kd-tree of its
+    centers, the indices of its circles, and its largest radius.
+    """
+    if not len(radii):
+        return []
+    exponent = np.frexp( radii )[1]
+    order = np.argsort( exponent, kind='mergesort' )
+    groups = np.split( order, np.nonzero( np.diff( exponent[order] ) )[0] + 1 )
+    return [ ( cKDTree( centers[g] ), g, radii[g].max() ) for g in groups ]
+
+def reach_pairs( index, centers, radii, pts ):
+    """
+    The circles indexed by reach_index with some points inside, as flat arrays
+    of ( circle, point ) pairs. Every group is searched with its own largest
+    radius, so the small circles are not searched as far as the large ones.
+    """
+    which = [ np.zeros( 0, dtype=np.int64 ) ]
+    point = [ np.zeros( 0, dtype=np.int64 ) ]
+    for tree, ids, radius in index:
+        found, cand = ball_pairs( tree, pts, np.full( len(pts), radius ) )
+        cand = ids[cand]
+        close = la.norm( centers[cand] - pts[found], axis=1 ) <= radii[cand]
+        which.append( cand[close] )
+        point.append( found[close] )
+    return np.concatenate( which ), np.concatenate( point )
+
+class DynamicProximityGraph( object ):
+    """
+    Keeps the gabriel and relative neighborhood graphs of a set of points while
+    points are added and removed. Only the edges of the points added, or of the
+    points around the ones removed, and the edges that have the points added or
+    removed in their circles, are checked again. The points keep their index.
+    The edges of a point are found from its triangles in the Delaunay triangulation
+    of the points around it, see stars. The gabriel edges are flat arrays, with
+    their status in the gabriel and relative neighborhood graphs by edge. The edges
+    near a point are found in kd-trees of the middles of the gabriel edges, see
+    reach_index, and the points near an edge in a kd-tree of the points. The ones
+    added after them are in small kd-trees, until they are more than the rebuild
+    fraction of the first ones and they are built again. The convex hull of the
+    points is kept, so the edges on the hull are checked against its vertices.
+    """
+    def __init__( self, points, rebuild=0.05 ):
+        self.points = np.array( points, dtype=float ).reshape((-1, 2))
+        self.alive = np.ones( len(self.points), dtype=bool )
+        self.rebuild = rebuild
+        self.reset()
+    
+    def reset( self ):
+        """
+        Finds the graphs of the points alive from the start.
+        """
+        ids = np.nonzero( self.alive )[0]
+        builder = ProximityGraphBuilder( self.points[ids] )
+        gabriel = builder.gabriel_indices()
+        self.edge_list = ids[builder.edges[gabriel]].astype(np.int64)
+        self.gabriel_status = np.ones( len(gabriel), dtype=bool )
+        self.rng_status = np.isin( gabriel, builder.rng_indices() )
+        # The box of all the points, removed or not, bounds the distances between them.
+        self.lo = self.points.min( axis=0 )
+        self.hi = self.points.max( axis=0 )
+        self.hull = self.find_hull( ids )
+        self._gabriel = None
+        self._rng = None
+        self.index_points()
+        self.index_edges()
+    
+    def find_hull( self, ids ):
+        """
+        The vertices of the convex hull of some points, counterclockwise, or all
+        of them if they are on a line.
+        """
+        try:
+            return ids[ConvexHull( self.points[ids] ).vertices]
+        except Exception:
+            return ids
+    
+    def shrink_hull( self, removed ):
+        """
+        Finds the hull of the points alive after removing some of them. The new
+        vertices are in the polygons cut from the hull by the chords between the
+        vertices left, and they are looked for in the circles around them.
+        """
+        hull = self.hull
+        gone = np.isin( hull, removed )
+        if not gone.any():
+            return
+        if len(hull) - np.count_nonzero( gone ) < 3:
+            self.hull = self.find_hull( np.nonzero( self.alive )[0] )
+            return
+        start = np.argmin( gone )
+        hull = np.roll( hull, -start )
+        gone = np.roll( gone, -start )
+        found = [ hull[~gone] ]
+        i = 0
+        while i < len(hull):
+            if not gone[i]:
+                i += 1
+                continue
+            j = i
+            while j < len(hull) and gone[j]:
+                j += 1
+            cut = self.points[hull[np.arange( i-1, j+1 ) % len(hull)]]
+            center = cut.mean( axis=0 )
+            found.append( self.near_points( center[None,:], la.norm( cut - center, axis=1 ).max( keepdims=True ) )[1] )
+            i = j
+        self.hull = self.find_hull( np.unique( np.concatenate( found ) ) )
+    
+    def index_points( self ):
+        """
+        Builds the kd-tree of the points alive.
+        """
+        self.tree_ids = np.nonzero( self.alive )[0]
+        self.point_tree = cKDTree( self.points[self.tree_ids] )
+        self.recent_points = np.zeros( 0, dtype=np.int64 )
+        self.recent_tree = None
+    
+    def index_edges( self ):
+        """
+        Builds the kd-trees of the middles of the gabriel edges, sorted by their
+        keys, see edge_keys. The edges out of the gabriel graph are left out.
+        """
+        keep = np.nonzero( self.gabriel_status )[0]
+        keys = edge_keys( self.edge_list[keep] )
+        order = np.argsort( keys )
+        keep = keep[order]
+        self.edge_list = self.edge_list[keep]
+        self.edge_keys = keys[order]
+        self.gabriel_status = np.ones( len(keep), dtype=bool )
+        self.rng_status = self.rng_status[keep]
+        p0 = self.points[self.edge_list[:,0]]
+        p1 = self.points[self.edge_list[:,1]]
+        self.edge_mids = ( p0 + p1 ) / 2.0
+        self.edge_reach = la.norm( p1 - p0, axis=1 )*math.sin(math.radians(60))
+        self.indexed = len(keep)
+        self.edge_index = reach_index( self.edge_mids, self.edge_reach )
+        self.recent_index = None
+    
+    def edge_ids( self, edges ):
+        """
+        The positions of some edges in the edge list, -1 for the ones not in it.
+        """
+        keys = edge_keys( edges )
+        ids = np.full( len(keys), -1, dtype=np.int64 )
+        indexed = self.edge_keys[:self.indexed]
+        pos = np.minimum( np.searchsorted( indexed, keys ), max( self.indexed - 1, 0 ) )
+        if self.indexed:
+            found = indexed[pos] == keys
+            ids[found] = pos[found]
+        recent = self.edge_keys[self.indexed:]
+        if len(recent):
+            order = np.argsort( recent )
+            pos = order[np.minimum( np.searchsorted( recent, keys, sorter=order ), len(recent) - 1 )]
+            found = recent[pos] == keys
+            ids[found] = self.indexed + pos[found]
+        return ids
+    
+    def append_edges( self, edges ):
+        """
+        Adds some gabriel edges to the edge list, and returns their positions.
+        """
+        first = len(self.edge_list)
+        p0 = self.points[edges[:,0]]
+        p1 = self.points[edges[:,1]]
+        self.edge_list = np.concatenate( [ self.edge_list, edges ] )
+        self.edge_keys = np.concatenate( [ self.edge_keys, edge_keys( edges ) ] )
+        self.gabriel_status = np.concatenate( [ self.gabriel_status, np.ones( len(edges), dtype=bool ) ] )
+        self.rng_status = np.concatenate( [ self.rng_status, np.zeros( len(edges), dtype=bool ) ] )
+        self.edge_mids = np.concatenate( [ self.edge_mids, ( p0 + p1 ) / 2.0 ] )
+        self.edge_reach = np.concatenate( [ self.edge_reach, la.norm( p1 - p0, axis=1 )*math.sin(math.radians(60)) ] )
+        self.recent_index = None
+        return np.arange( first, len(self.edge_list) )
+    
+    def near_points( self, centers, radii ):
+        """
+        The points alive in some circles, as ( circle, point ) pairs.
+        """
+        which, cand = ball_pairs( self.point_tree, centers, radii )
+        cand = self.tree_ids[cand]
+        if len(self.recent_points):
+            if self.recent_tree is None:
+                self.recent_tree = cKDTree( self.points[self.recent_points] )
+            circle, pos = ball_pairs( self.recent_tree, centers, radii )
+            which = np.concatenate( [ which, circle ] )
+            cand = np.concatenate( [ cand, self.recent_points[pos] ] )
+        keep = self.alive[cand]
+        return which[keep], cand[keep]
+    
+    def near_edges( self, pts ):
+        """
+        The gabriel edges with some points in the circle around their middle
+        that has their lunes, as ( edge position, point ) pairs.
+        """
+        ids, which = reach_pairs( self.edge_index, self.edge_mids, self.edge_reach, pts )
+        if len(self.edge_list) > self.indexed:
+            if self.recent_index is None:
+                self.recent_index = reach_index( self.edge_mids[self.indexed:], self.edge_reach[self.indexed:] )
+            recent, point = reach_pairs( self.recent_index, self.edge_mids[self.indexed:], self.edge_reach[self.indexed:], pts )
+            ids = np.concatenate( [ ids, self.indexed + recent ] )
+            which = np.concatenate( [ which, point ] )
+        live = self.gabriel_status[ids]
+        return ids[live], which[live]
+    
+    def stars( self, ids ):
+        """
+        Finds the edges of some points alive in the Delaunay triangulation of all
+        the points alive, and if they are in the gabriel graph, see triangles_gabriel.
+        The points in a circle around every one of them are triangulated, until
+        its triangles have no point in their circles, and go all around it, or its
+        edges on the hull have no vertex of the hull outside. The point closest to
+        the center of every circle with points, and the vertices outside, are added
+        to the next triangulation, and the circle is doubled only if there are none.
+        Returns None if points repeat.
+        """
+        ids = np.asarray( ids, dtype=np.int64 )
+        found = []
+        status = []
+        span = la.norm( self.hi - self.lo )
+        hull = self.points[self.hull]
+        k = min( 12, len(self.tree_ids) )
+        radii = np.full( len(ids), span )
+        if k > 1:
+            radii = np.clip( self.point_tree.query( self.points[ids], k )[0][:,-1], span*1e-9, span )
+        pending = np.arange( len(ids) )
+        extra = np.zeros( 0, dtype=np.int64 )
+        while len(pending):
+            centers = self.points[ids[pending]]
+            local = np.unique( np.concatenate( [ self.near_points( centers, radii[pending] )[1], ids[pending], extra ] ) )
+            try:
+                triangulation = Delaunay( self.points[local] )
+            except Exception:
+                if ( radii[pending] >= span ).all():
+                    return None
+                radii[pending] *= 2
+                continue
+            if len(triangulation.coplanar):
+                return None
+            where = np.searchsorted( local, ids[pending] )
+            owner = np.full( len(local), -1 )
+            owner[where] = np.arange( len(pending) )
+            simplices = triangulation.simplices.astype(np.int64)
+            tri, corner = np.nonzero( owner[simplices] >= 0 )
+            star = owner[simplices[tri,corner]]
+            
+            # The circles of the triangles.
+            pts = triangulation.points
+            circles, size = circumcircles( pts, simplices[tri] )
+            bad = np.zeros( len(pending), dtype=bool )
+            grown = np.zeros( len(pending), dtype=bool )
+            # The triangles with empty circles are triangles of all the points.
+            finite = np.isfinite( size )
+            bad[star[~finite]] = True
+            which, cand = self.near_points( circles[finite], size[finite]*( 1.0 - 1e-9 ) )
+            bad[star[finite][which]] = True
+            # The point closest to the center of every circle with points.
+            new = ~np.isin( cand, local )
+            which, cand = which[new], cand[new]
+            first = np.lexsort( ( la.norm( self.points[cand] - circles[finite][which], axis=1 ), which ) )
+            first = first[np.r_[True, which[first[1:]] != which[first[:-1]]]] if len(first) else first
+            grown[star[finite][which[first]]] = True
+            extra = [ extra, cand[first] ]
+            # The edges of a point on the hull are on the hull of all the points.
+            ht, hv = np.nonzero( triangulation.neighbors[tri] < 0 )
+            side = hv != corner[ht]
+            ht, hv = ht[side], hv[side]
+            if len(ht):
+                e0 = pts[simplices[tri[ht],( hv + 1 ) % 3]]
+                axis = pts[simplices[tri[ht],( hv + 2 ) % 3]] - e0
+                normal = np.column_stack( [ -axis[:,1], axis[:,0] ] )
+                normal *= np.sign( np.einsum( 'ij,ij->i', pts[simplices[tri[ht],hv]] - e0, normal ) )[:,None]
+                outside = np.einsum( 'ijk,ik->ij', hull[None,:,:] - e0[:,None,:], normal ) < 0
+                bad[star[ht[outside.any( axis=1 )]]] = True
+                outside &= ~np.isin( self.hull, local )[None,:]
+                grown[star[ht[outside.any( axis=1 )]]] = True
+                extra.append( self.hull[outside.any( axis=0 )] )
+            extra = np.unique( np.concatenate( extra ) )
+            bad &= radii[pending] < span
+            
+            done = ~bad
+            edges, gabriel = triangles_gabriel( triangulation, np.unique( tri[done[star]] ) )
+            mine = ( owner[edges[:,0]] >= 0 ) & done[np.maximum( owner[edges[:,0]], 0 )]
+            mine |= ( owner[edges[:,1]] >= 0 ) & done[np.maximum( owner[edges[:,1]], 0 )]
+            found.append( local[edges[mine]] )
+            status.append( gabriel[mine] )
+            radii[pending[bad & ~grown]] *= 2
+            pending = pending[bad]
+        return np.concatenate( found ), np.concatenate( status )
+    
+    def in_lune( self, edges ):
+        """
+        Finds which edges have a point alive in their lune, see rng_mask.
+        """
+        edges = np.asarray( edges, dtype=np.int64 ).reshape((-1, 2))
+        p0 = self.points[edges[:,0]]
+        p1 = self.points[edges[:,1]]
+        lengths = la.norm( p1 - p0, axis=1 )
+        edge, cand = self.near_points( ( p0 + p1 ) / 2.0, lengths*math.sin(math.radians(60)) )
+        closer = ( ( la.norm( self.points[cand] - p0[edge], axis=1 ) < lengths[edge] ) &
+                   ( la.norm( self.points[cand] - p1[edge], axis=1 ) < lengths[edge] ) &
+                   ( cand != edges[edge,0] ) & ( cand != edges[edge,1] ) )
+        return np.bincount( edge[closer], minlength=len(edges) ) > 0
+    
+    def check( self, edges, gabriel ):
+        """
+        Sets the edges in the gabriel graph or out of it, and the ones in it
+        in the relative neighborhood graph if they have no point in their lune.
+        An edge found twice keeps its last status.
+        """
+        edges = np.sort( np.asarray( edges, dtype=np.int64 ).reshape((-1, 2)), axis=1 )[::-1]
+        gabriel = np.asarray( gabriel, dtype=bool )[::-1]
+        last = np.unique( edge_keys( edges ), return_index=True )[1]
+        edges = edges[last]
+        gabriel = gabriel[last]
+        ids = self.edge_ids( edges )
+        out = ids[~gabriel & ( ids >= 0 )]
+        self.gabriel_status[out] = False
+        self.rng_status[out] = False
+        new = gabriel & ( ids < 0 )
+        ids[new] = self.append_edges( edges[new] )
+        ids = ids[gabriel]
+        self.gabriel_status[ids] = True
+        self.rng_status[ids] = ~self.in_lune( self.edge_list[ids] )
+    
+    def refresh( self ):
+        """
+        Builds the kd-trees again when too much was added after them, or too
+        many of the edges in them left the gabriel graph.
+        """
+        if len(self.recent_points) > self.rebuild*max( len(self.tree_ids), 1 ):
+            self.index_points()
+        changed = len(self.edge_list) - self.indexed + np.count_nonzero( ~self.gabriel_status )
+        if changed > self.rebuild*max( self.indexed, 1 ):
+            self.index_edges()
+    
+    def add_points( self, points ):
+        """
+        Adds some points, and returns their indices.
+        """
+        points = np.array( points, dtype=float ).reshape((-1, 2))
+        first = len(self.points)
+        added = np.arange( first, first + len(points) )
+        if not len(points):
+            return added
+        self._gabriel = None
+        self._rng = None
+        self.points = np.vstack( [ self.points, points ] )
+        self.alive = np.concatenate( [ self.alive, np.ones( len(points), dtype=bool ) ] )
+        self.recent_points = np.concatenate( [ self.recent_points, added ] )
+        self.recent_tree = None
+        self.lo = np.minimum( self.lo, points.min( axis=0 ) )
+        self.hi = np.maximum( self.hi, points.max( axis=0 ) )
+        self.hull = self.find_hull( np.concatenate( [ self.hull, added ] ) )
+        
+        # The edges with a new point in their circle, or in their lune, leave the graphs.
+        ids, which = self.near_edges( points )
+        edges = self.edge_list[ids]
+        p0 = self.points[edges[:,0]]
+        p1 = self.points[edges[:,1]]
+        lengths = la.norm( p1 - p0, axis=1 )
+        closed = la.norm( points[which] - ( p0 + p1 ) / 2.0, axis=1 ) <= lengths / 2.0
+        lune = ( la.norm( points[which] - p0, axis=1 ) < lengths ) & ( la.norm( points[which] - p1, axis=1 ) < lengths )
+        self.gabriel_status[ids[closed]] = False
+        self.rng_status[ids[closed | lune]] = False
+        
+        # All the new edges are edges of the new points.
+        found = self.stars( added )
+        if found is None:
+            # Repeated points, see ProximityGraphBuilder.
+            self.reset()
+            return added
+        self.check( *found )
+        self.refresh()
+        return added
+    
+    def remove_points( self, indices ):
+        """
+        Removes the points with some indices.
+        """
+        indices = np.unique( np.asarray( indices, dtype=np.int64 ) )
+        if not len(indices):
+            return
+        if not self.alive[indices].all():
+            raise ValueError("Some of the points were removed already.")
+        self._gabriel = None
+        self._rng = None
+        # The new edges are edges of the points around the removed ones.
+        found = self.stars( indices ) if np.count_nonzero( self.alive ) - len(indices) > 2 else None
+        self.alive[indices] = False
+        if found is None:
+            self.reset()
+            return
+        self.shrink_hull( indices )
+        around = np.unique( found[0] )
+        around = around[self.alive[around]]
+        dead = self.edge_ids( found[0][~( self.alive[found[0][:,0]] & self.alive[found[0][:,1]] )] )
+        dead = dead[dead >= 0]
+        self.gabriel_status[dead] = False
+        self.rng_status[dead] = False
+        found = self.stars( around )
+        if found is None:
+            self.reset()
+            return
+        # The gabriel edges that had a removed point in their lunes.
+        near = self.edge_list[self.near_edges( self.points[indices] )[0]]
+        self.check( np.concatenate( [ found[0], near ] ), np.concatenate( [ found[1], np.ones( len(near), dtype=bool ) ] ) )
+        self.refresh()
+    
+    def sorted_status( self, status ):
+        """
+        The edges with some status, sorted. The edge list has no repeated edges.
+        """
+        keys = np.sort( self.edge_keys[status] )
+        return np.column_stack( np.divmod( keys, np.int64( 1 << 32 ) ) )
+    
+    def gabriel( self ):
+        """
+        The edges of the gabriel graph, see ProximityGraphBuilder.
+        """
+        if self._gabriel is None:
+            self._gabriel = self.sorted_status( self.gabriel_status )
+        return self._gabriel
+    
+    def rng( self ):
+        """
+        The edges of the relative neighborhood graph, see ProximityGraphBuilder.
+        """
+        if self._rng is None:
+            self._rng = self.sorted_status( self.rng_status )
+        return self._rng
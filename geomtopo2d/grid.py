@@ -18,7 +18,12 @@ along with Geomtopo2d.  If not, see <http://www.gnu.org/licenses/>.
 
 from __future__ import print_function, division
 
-from .polygons import obtain_polygons
+from .polygons import obtain_polygons, permutation_cycles
+from .parallel import cpu_workers, process_map, shared_memory
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy import ndimage
+from itertools import product
 import rtree
 import math
 import numpy as np
@@ -85,99 +90,398 @@ def point_breaks( grid ):
                 points.append( (float(x), y+0.5) )
     return points
 
+def boundary_edges_array( grid ):
+    """
+    Same as boundary_edges, but for a grid given as a numpy array.
+    The changes in the four sides are found with array comparisons, and
+    the points and edges are returned as arrays, in the same order.
+    """
+    ny, nx = grid.shape
+    corners = np.array([(0.0, 0.0), (0.0, ny-1.0), (nx-1.0, ny-1.0), (nx-1.0, 0.0)])
+    # Left, bottom, right and top breaks, in the order boundary_edges finds them.
+    left = np.nonzero( grid[:-1,0] != grid[1:,0] )[0]
+    bottom = np.nonzero( grid[-1,:-1] != grid[-1,1:] )[0]
+    right = np.nonzero( grid[1:,-1] != grid[:-1,-1] )[0][::-1]
+    top = np.nonzero( grid[0,1:] != grid[0,:-1] )[0][::-1]
+    sides = [ np.column_stack( ( np.zeros(len(left)), left+0.5 ) ),
+              np.column_stack( ( bottom+0.5, np.full(len(bottom), ny-1.0) ) ),
+              np.column_stack( ( np.full(len(right), nx-1.0), right+0.5 ) ),
+              np.column_stack( ( top+0.5, np.zeros(len(top)) ) ) ]
+    points = np.concatenate( [corners] + sides )
+    
+    # Walk the corners and the breaks around the grid, joining each with the next.
+    walk = []
+    start = 4
+    for corner, side in enumerate(sides):
+        walk.append( [corner] )
+        walk.append( np.arange( start, start+len(side) ) )
+        start += len(side)
+    walk.append( [0] )
+    walk = np.concatenate( walk ).astype(int)
+    edges = np.column_stack( ( walk[:-1], walk[1:] ) )
+    return (edges, points)
+
+def point_breaks_array( grid ):
+    """
+    Same as point_breaks, but for a grid given as a numpy array.
+    Finds all the horizontal and vertical changes with array comparisons,
+    and returns the points in the same order as point_breaks.
+    """
+    ny, nx = grid.shape
+    if ny < 3 or nx < 3:
+        return np.zeros((0, 2))
+    
+    # For every inner cell, the left, top, right and bottom breaks.
+    found = np.zeros( (ny-2, nx-2, 4), dtype=bool )
+    found[:,0,0] = grid[1:-1,0] != grid[1:-1,1]
+    found[0,:,1] = grid[0,1:-1] != grid[1,1:-1]
+    found[:,:,2] = grid[1:-1,1:-1] != grid[1:-1,2:]
+    found[:,:,3] = grid[1:-1,1:-1] != grid[2:,1:-1]
+    y, x, side = np.nonzero( found )
+    dx = np.array([-0.5, 0.0, 0.5, 0.0])
+    dy = np.array([0.0, -0.5, 0.0, 0.5])
+    return np.column_stack( ( x+1.0+dx[side], y+1.0+dy[side] ) )
+
+def half_lattice_index( shape, points ):
+    """
+    Stores the points in the half lattice of a grid of the given shape.
+    The points in the middle of a horizontal pair of cells, (x+0.5, y), are
+    stored in an (ny, nx-1) array, and the ones in the middle of a vertical
+    pair, (x, y+0.5), in an (ny-1, nx) array. The rest of the lattice is empty
+    and -1 marks that there's no point.
+    """
+    ny, nx = shape
+    dtype = np.int32 if len(points) < np.iinfo(np.int32).max else np.int64
+    horizontal = np.full( (ny, max(nx-1, 0)), -1, dtype=dtype )
+    vertical = np.full( (max(ny-1, 0), nx), -1, dtype=dtype )
+    if len(points):
+        lattice = np.rint( np.asarray(points, dtype=float)*2.0 ).astype(np.int64)
+        odd = lattice % 2 == 1
+        idx = np.arange( len(lattice), dtype=dtype )
+        h = odd[:,0] & ~odd[:,1]
+        horizontal[lattice[h,1]//2, lattice[h,0]//2] = idx[h]
+        v = ~odd[:,0] & odd[:,1]
+        vertical[lattice[v,1]//2, lattice[v,0]//2] = idx[v]
+    return horizontal, vertical
+
+def create_mid_points_and_edges_array( shape, points ):
+    """
+    Same as create_mid_points_and_edges, but with the points as an (n, 2) array.
+    The points are looked up in the half lattice, and only the cells that
+    contain breaks are visited. Returns the edges as an (m, 2) array, and the
+    points, with the mid points appended, as an (n+k, 2) array.
+    """
+    ny, nx = shape
+    points = np.asarray( points, dtype=float ).reshape((-1, 2))
+    if ny < 2 or nx < 2:
+        return np.zeros( (0, 2), dtype=int ), points
+    horizontal, vertical = half_lattice_index( shape, points )
+    
+    # Count the breaks around every cell and keep the cells that have any.
+    count = ( (horizontal[1:,:] >= 0).astype(np.int8) + (vertical[:,1:] >= 0) +
+              (horizontal[:-1,:] >= 0) + (vertical[:,:-1] >= 0) )
+    y, x = np.nonzero( count )
+    count = count[y, x]
+    if np.any( count == 1 ):
+        raise Exception("error tying polygons")
+    
+    # The breaks in the bottom, right, top and left of every cell.
+    es = np.column_stack( ( horizontal[y+1, x], vertical[y, x+1], horizontal[y, x], vertical[y, x] ) ).astype(np.int64)
+    found = es >= 0
+    
+    # Cells with two breaks are joined directly.
+    pairs = count == 2
+    first = np.argsort( ~found[pairs], axis=1, kind='stable' )
+    rows = np.arange( len(first) )
+    
+    # Cells with more breaks get a point in the middle joined to every break.
+    mids = ~pairs
+    mid_idx = np.full( len(count), -1, dtype=np.int64 )
+    mid_idx[mids] = len(points) + np.arange( np.count_nonzero(mids) )
+    
+    ends = np.empty( es.shape + (2,), dtype=np.int64 )
+    ends[:,:,0] = es
+    ends[:,:,1] = mid_idx[:,None]
+    found[pairs] = False
+    found[pairs,0] = True
+    ends[pairs,0,0] = es[pairs][rows, first[:,0]]
+    ends[pairs,0,1] = es[pairs][rows, first[:,1]]
+    
+    edges = ends[found]
+    mid_points = np.column_stack( ( x[mids]+0.5, y[mids]+0.5 ) )
+    return edges, np.concatenate( ( points, mid_points ) )
+
 def create_mid_points_and_edges( grid, points ):
-    spoints = {}
-    for i, k in enumerate(points):
-        spoints[k] = i
-    edges = []
-    # Add all midpoints and append the given edges.
-    for y in range( len(grid)-1 ):
-        for x in range( len(grid[0])-1 ):
-            midx = x+0.5
-            midy = y+0.5
-            cnt = 0
-            es = []
-            for d in [ [0, 0.5], [0.5, 0], [0, -0.5], [-0.5, 0] ]:
-                ex = midx + d[0]
-                ey = midy + d[1]
-                if ( ex, ey ) in spoints:
-                    cnt += 1
-                    es.append( spoints[(ex, ey)] )
-            if cnt == 0:
-                continue
-            elif cnt == 1:
-                raise Exception("error tying polygons")
-            elif cnt == 2:
-                edges.append( (es[0], es[1]) )
-            elif cnt > 2:
-                l = len(spoints)
-                spoints[ ( midx, midy ) ] = l
-                for e in es:
-                    edges.append( (e, l) )
-
-    ret_points = [ -1 for i in range( len( spoints ) ) ]
-    for k, v in spoints.items():
-        ret_points[v] = k
-    return edges, ret_points
+    """
+    Finds the cells where the breaks meet and joins them. When three or four
+    breaks meet in a cell, a point is added in the middle.
+    """
+    edges, points = create_mid_points_and_edges_array( ( len(grid), len(grid[0]) ), points )
+    return list(map( tuple, edges.tolist() )), list(map( tuple, points.tolist() ))
 
 def classify_polygon( grid, polygon, points ):
-    for r in polygon:
-        for idx, n in enumerate(r):
-            nn = r[idx+1]
-            pn = points[n]
-            pnn = points[nn]
-            # Grid or middle node.
-            loc = (pn[0]-math.floor(pn[0]), pn[1]-math.floor(pn[1]))
-
-            # If it's an grid node, then classify grid value.
-            if loc[0] == 0.0 and loc[1] == 0.0:
-                return grid[int(pn[1])][int(pn[0])]
-            # Leaving middle nodes, classify at next.
-            if loc[0] == 0.5 and loc[1] == 0.5:
-                continue
-            # Check if it's diagonal or not.
-            v = ( pnn[0]-pn[0], pnn[1]-pn[1] )
-            if v[0] == 0.0:
-                if loc[0] == 0.0:
-                    if v[1] < 0.0:
-                        return grid[int(pn[1]-0.5)][int(pn[0])]
-                    else:
-                        return grid[int(pn[1]+0.5)][int(pn[0])]
-                if v[1] < 0.0:
-                    return grid[int(pn[1])][int(pn[0]+0.5)]
-                elif v[1] > 0.0:
-                    return grid[int(pn[1])][int(pn[0]-0.5)]
-                else:
-                    raise Exception("Error classifying polygons.")
-            elif v[1] == 0.0:
-                if loc[1] == 0.0:
-                    if v[0] < 0.0:
-                        return grid[int(pn[1])][int(pn[0]-0.5)]
-                    else:
-                        return grid[int(pn[1])][int(pn[0]+0.5)]
-                if v[0] < 0.0:
-                    return grid[int(pn[1]-0.5)][int(pn[0])]
-                elif v[0] > 0.0:
-                    return grid[int(pn[1]+0.5)][int(pn[0])]
-                else:
-                    raise Exception("Error classifying polygons.")
-            elif v[0] < 0.0:
-                if v[1] < 0.0:
-                    return grid[int(pn[1]-0.5)][int(pn[0])]
-                elif v[1] > 0.0:
-                    return grid[int(pn[1])][int(pn[0]-0.5)]
-                else:
-                    raise Exception("Error classifying polygons.")
-            elif v[0] > 0.0:
-                if v[1] < 0.0:
-                    return grid[int(pn[1])][int(pn[0]+0.5)]
-                elif v[1] > 0.0:
-                    return grid[int(pn[1]+0.5)][int(pn[0])]
-                else:
-                    raise Exception("Error classifying polygons.")
+    """
+    Finds the value of the grid inside a polygon. The polygon is at the left
+    of its outer ring, so it's the value of the cell at the left of its first edge.
+    """
+    ring = polygon[0]
+    pn = points[ring[0]]
+    pnn = points[ring[1 % len(ring)]]
+    v = ( pnn[0]-pn[0], pnn[1]-pn[1] )
+    
+    # Edges over the boundary pass through the cells they surround.
+    if v[0] == 0.0 and pn[0] == math.floor(pn[0]):
+        y = pn[1] + math.copysign( 0.5, v[1] ) if pn[1] != math.floor(pn[1]) else pn[1]
+        return grid[int(y)][int(pn[0])]
+    if v[1] == 0.0 and pn[1] == math.floor(pn[1]):
+        x = pn[0] + math.copysign( 0.5, v[0] ) if pn[0] != math.floor(pn[0]) else pn[0]
+        return grid[int(pn[1])][int(x)]
+    
+    # Other edges start or end in a break between two cells, take the one at the left.
+    for p in [pn, pnn]:
+        loc = ( p[0]-math.floor(p[0]), p[1]-math.floor(p[1]) )
+        if loc[0] == 0.5 and loc[1] == 0.0:
+            c = ( p[0]-0.5, p[1] )
+            o = ( p[0]+0.5, p[1] )
+        elif loc[0] == 0.0 and loc[1] == 0.5:
+            c = ( p[0], p[1]-0.5 )
+            o = ( p[0], p[1]+0.5 )
+        else:
+            continue
+        if v[0]*(c[1]-p[1]) - v[1]*(c[0]-p[0]) < 0.0:
+            c = o
+        return grid[int(c[1])][int(c[0])]
+    raise Exception("Error classifying polygons.")
+
+def classify_polygons( grid, indices, offsets, points ):
+    """
+    Same as classify_polygon, for all the polygons at once.
+    Parameters
+    ----------
+    grid:
+        The grid, as a list of rows or a numpy array.
+    indices, offsets: array
+        The outer rings of the polygons, one after the other, where the ring
+        of polygon i is indices[offsets[i]:offsets[i+1]].
+    points:
+        The points of the polygons.
+    Results
+    -------
+    classification: list
+        The value of the grid inside every polygon.
+    """
+    indices = np.asarray( indices, dtype=np.int64 )
+    offsets = np.asarray( offsets, dtype=np.int64 )
+    if len(offsets) < 2:
+        return []
+    sizes = offsets[1:] - offsets[:-1]
+    if np.any( sizes < 1 ):
+        raise Exception("Error classifying polygons.")
+    # Only the first edge of every ring is needed.
+    ends = np.concatenate( ( indices[offsets[:-1]], indices[offsets[:-1] + ( 1 % sizes )] ) )
+    if isinstance( points, np.ndarray ):
+        ends = points[ends]
+    else:
+        ends = [ points[i] for i in ends.tolist() ]
+    lattice = np.rint( np.asarray( ends, dtype=float ).reshape((-1, 2))*2.0 ).astype(np.int64)
+    p = lattice[:len(sizes)]
+    q = lattice[len(sizes):]
+    v = q - p
+    cx = np.full( len(p), -1, dtype=np.int64 )
+    cy = np.full( len(p), -1, dtype=np.int64 )
+    
+    # Other edges start or end in a break between two cells, take the one at the left.
+    for b in [ q, p ]:
+        hor = ( b[:,0] % 2 == 1 ) & ( b[:,1] % 2 == 0 )
+        ver = ( b[:,0] % 2 == 0 ) & ( b[:,1] % 2 == 1 )
+        ox = np.where( hor, -1, 0 )
+        oy = np.where( ver, -1, 0 )
+        flip = np.where( v[:,0]*oy - v[:,1]*ox < 0, -1, 1 )
+        brk = hor | ver
+        cx[brk] = ( b[:,0] + ox*flip )[brk]
+        cy[brk] = ( b[:,1] + oy*flip )[brk]
+    
+    # Edges over the boundary pass through the cells they surround.
+    vert = ( v[:,0] == 0 ) & ( p[:,0] % 2 == 0 )
+    cx[vert] = p[vert,0]
+    cy[vert] = ( p[:,1] + np.where( p[:,1] % 2 == 1, np.sign(v[:,1]), 0 ) )[vert]
+    hor = ( v[:,1] == 0 ) & ( p[:,1] % 2 == 0 ) & ~vert
+    cx[hor] = ( p[:,0] + np.where( p[:,0] % 2 == 1, np.sign(v[:,0]), 0 ) )[hor]
+    cy[hor] = p[hor,1]
+    if np.any( cx < 0 ):
+        raise Exception("Error classifying polygons.")
+    cx //= 2
+    cy //= 2
+    if isinstance( grid, np.ndarray ):
+        return list( grid[cy, cx] )
+    return [ grid[y][x] for y, x in zip( cy.tolist(), cx.tolist() ) ]
 
+def grid_edges_array( grid ):
+    """
+    Creates the edges between the regions of a grid given as a numpy array,
+    as polygons_from_grid does before obtaining the polygons. Returns the
+    edges as an (m, 2) array and the points as an (n, 2) array.
+    """
+    edges, points = boundary_edges_array( grid )
+    points = np.concatenate( ( points, point_breaks_array( grid ) ) )
+    edgesm, points = create_mid_points_and_edges_array( grid.shape, points )
+    return np.concatenate( ( edges, edgesm ) ), points
 
-def polygons_from_grid( grid ):
+def grid_components( grid ):
+    """
+    Labels the regions of equal values of a grid, connected by the sides of
+    the cells. Returns the label of every cell and the number of regions.
+    """
+    values, inv = np.unique( grid, return_inverse=True )
+    inv = inv.reshape( grid.shape )
+    labels = np.zeros( grid.shape, dtype=np.int64 )
+    count = 0
+    if len(values) <= 256:
+        # Few values, label each one by itself.
+        for i in range(len(values)):
+            lab, n = ndimage.label( inv == i )
+            labels[lab > 0] = lab[lab > 0] + count - 1
+            count += n
+        return labels, count
+    ny, nx = grid.shape
+    idx = np.arange( ny*nx ).reshape( grid.shape )
+    h = inv[:,:-1] == inv[:,1:]
+    v = inv[:-1,:] == inv[1:,:]
+    rows = np.concatenate( ( idx[:,:-1][h], idx[:-1,:][v] ) )
+    cols = np.concatenate( ( idx[:,1:][h], idx[1:,:][v] ) )
+    joins = coo_matrix( ( np.ones( len(rows), dtype=np.int8 ), ( rows, cols ) ), shape=( ny*nx, ny*nx ) )
+    count, labels = connected_components( joins, directed=False )
+    return labels.reshape( grid.shape ), count
+
+def trace_grid_faces( grid ):
+    """
+    Finds the faces of the edges of a grid straight from the cells. Every
+    directed edge knows the region at its left from the cells around it,
+    and the faces are followed with the same left-most turn of tie_polygons.
+    Returns
+    -------
+    points: array
+        The points, as polygons_from_grid creates them.
+    src: array
+        The point where every directed edge starts.
+    offsets, order:
+        The faces, as cycles of directed edges, see permutation_cycles.
+    face_region: array
+        The region at the left of every face, -1 for the outside.
+    face_area: array
+        Twice the signed area of every face, in the half lattice.
+    labels, count:
+        The regions of the grid, see grid_components.
+    left: array
+        The region at the left of every directed edge.
+    """
+    ny, nx = grid.shape
+    edges, points = grid_edges_array( grid )
+    labels, count = grid_components( grid )
+    lattice = np.rint( points*2.0 ).astype(np.int64)
+    m = len(edges)
+    src = np.concatenate( ( edges[:,0], edges[:,1] ) )
+    dst = np.concatenate( ( edges[:,1], edges[:,0] ) )
+    x, y = lattice[src,0], lattice[src,1]
+    dx, dy = lattice[dst,0]-x, lattice[dst,1]-y
+    
+    # Edges that start in a break take the cell at their left, the rest look at their end.
+    brk = ( x % 2 ) != ( y % 2 )
+    px = np.where( brk, x, lattice[dst,0] )
+    py = np.where( brk, y, lattice[dst,1] )
+    oddx = px % 2 == 1
+    cx = np.where( oddx, px + np.where( dy > 0, -1, 1 ), px )
+    cy = np.where( oddx, py, py + np.where( dx < 0, -1, 1 ) )
+    
+    # Edges over the boundary pass through the cells they surround.
+    vert = ( dx == 0 ) & ( x % 2 == 0 )
+    hor = ( dy == 0 ) & ( y % 2 == 0 )
+    cx[vert] = x[vert]
+    cy[vert] = ( y + np.where( y % 2 == 1, np.sign(dy), 0 ) )[vert]
+    cx[hor] = ( x + np.where( x % 2 == 1, np.sign(dx), 0 ) )[hor]
+    cy[hor] = y[hor]
+    inside = np.ones( 2*m, dtype=bool )
+    lx = x - np.sign(dy)
+    ly = y + np.sign(dx)
+    inside[vert] = ( ( lx >= 0 ) & ( lx <= 2*(nx-1) ) )[vert]
+    inside[hor] = ( ( ly >= 0 ) & ( ly <= 2*(ny-1) ) )[hor]
+    left = np.where( inside, labels[cy//2, cx//2], -1 )
+    
+    # Sort the edges leaving every point clockwise, the next of an edge is
+    # the one after its twin.
+    angle = np.arctan2( dy, dx )
+    out = np.lexsort( ( -angle, src ) )
+    degree = np.bincount( src, minlength=len(points) )
+    first = np.concatenate( ( [0], np.cumsum( degree )[:-1] ) )
+    pos = np.empty( 2*m, dtype=np.int64 )
+    pos[out] = np.arange( 2*m ) - first[src[out]]
+    twin = np.concatenate( ( np.arange( m, 2*m ), np.arange( m ) ) )
+    nxt = out[first[dst] + ( pos[twin] + 1 ) % degree[dst]]
+    
+    offsets, order = permutation_cycles( nxt )
+    face_region = left[order[offsets[:-1]]]
+    xn, yn = lattice[dst,0], lattice[dst,1]
+    face_area = np.add.reduceat( ( x*yn - y*xn )[order], offsets[:-1] ) if len(order) else np.zeros(0, dtype=np.int64)
+    return points, src, offsets, order, face_region, face_area, labels, count, left
+
+def trace_grid_regions( grid, output="lists" ):
+    """
+    The polygons of every region of a grid given as a numpy array, traced as in
+    polygons_from_grid_trace. Returns ( polygons, classification, points, graph,
+    labels ), where the polygons are numbered as the regions in labels, and the
+    points are an (n, 2) array. With output "arrays", the polygons and the graph
+    are in compressed rows, as obtain_polygons returns them, and the
+    classification is an array.
+    """
+    points, src, offsets, order, face_region, face_area, labels, count, left = trace_grid_faces( grid )
+    
+    # One outer ring for every region, then its holes.
+    faces = np.nonzero( face_region >= 0 )[0]
+    faces = faces[np.lexsort( ( face_area[faces] < 0, face_region[faces] ) )]
+    if np.count_nonzero( face_area[faces] > 0 ) != count:
+        raise Exception("Error tying polygons.")
+    sizes = offsets[faces+1] - offsets[faces]
+    ring_offsets = np.concatenate( ( [0], np.cumsum( sizes ) ) )
+    within = np.arange( ring_offsets[-1] ) - np.repeat( ring_offsets[:-1], sizes )
+    indices = src[order[np.repeat( offsets[faces], sizes ) + within]].astype(np.int32)
+    polygon_offsets = np.concatenate( ( [0], np.cumsum( np.bincount( face_region[faces], minlength=count ) ) ) )
+    
+    cells = np.zeros( count, dtype=np.int64 )
+    cells[labels.ravel()] = np.arange( labels.size )
+    classification = grid.ravel()[cells]
+    
+    # Regions at both sides of an edge are neighbours.
+    m = len(src)//2
+    pairs = np.column_stack( ( left[:m], left[m:] ) )
+    pairs = pairs[ ( pairs[:,0] >= 0 ) & ( pairs[:,1] >= 0 ) ]
+    pairs = np.unique( np.concatenate( ( pairs[:,0]*count + pairs[:,1], pairs[:,1]*count + pairs[:,0] ) ) )
+    graph_offsets = np.searchsorted( pairs, np.arange( count+1 )*count )
+    graph_indices = ( pairs % count ).astype(np.int32)
+    if output == "arrays":
+        return ( polygon_offsets, ring_offsets, indices ), classification, points, ( graph_offsets, graph_indices ), labels
+    
+    rings = [ r.tolist() for r in np.split( indices, ring_offsets[1:-1] ) ]
+    polygons = [ rings[polygon_offsets[i]:polygon_offsets[i+1]] for i in range(count) ]
+    graph = [ g.tolist() for g in np.split( graph_indices, graph_offsets[1:-1] ) ]
+    return polygons, list( classification ), points, graph, labels
+
+def polygons_from_grid_trace( grid, with_graph=False, output="lists" ):
+    """
+    Same as polygons_from_grid, but the rings of every region are traced
+    straight from the cells, see trace_grid_faces. The holes of every region
+    are the faces with the region at their left and negative area, so
+    there's no need to look for the polygons that contain them.
+    """
+    if not isinstance( grid, np.ndarray ):
+        grid = np.array( list(map( list, grid )) )
+    polygons, classification, points, graph, labels = trace_grid_regions( grid, output )
+    if output != "arrays":
+        points = list(map( tuple, points.tolist() ))
+    if with_graph:
+        return polygons, classification, points, graph
+    return polygons, classification, points
+
+def polygons_from_grid( grid, workers=1, with_graph=False, engine="planar", output="lists" ):
     """
     Given a grid in the form:
     [[A, B, A, A],
@@ -196,19 +500,980 @@ def polygons_from_grid( grid ):
     *********
     Where the left, top is [-0.5, -0.5], the right, bottom is [3.5, 3.5].
     It then returns the polygons that surround the points.
+    If the grid is a numpy array, the boundaries and breaks are found with
+    array operations.
+    With more than one worker, the grid is split in strips that are polygonized
+    in parallel, see polygons_from_grid_parallel. With with_graph, the graph of
+    neighbour polygons is returned too, as in obtain_polygons.
+    The engine "planar" passes the edges to obtain_polygons, and "trace" follows
+    the rings straight from the cells, see polygons_from_grid_trace.
+    With output "arrays", the polygons and the graph are returned in compressed
+    rows, the classification and the points as arrays, as in obtain_polygons.
     """
-    # First obtain the surrounding edges.
-    edges, points = boundary_edges( grid )
+    if not output in ( "lists", "arrays" ):
+        raise ValueError("Unknown output %s." % output)
+    if workers is None or workers > 1:
+        return polygons_from_grid_parallel( grid, workers, with_graph, engine, output )
+    if engine == "trace":
+        return polygons_from_grid_trace( grid, with_graph, output )
+    elif engine != "planar":
+        raise ValueError("Unknown engine %s." % engine)
     
+    # First obtain the surrounding edges.
     # Then obtain the points where the areas change.
-    points += point_breaks( grid )
-    
-    # Find the points where there are more than one possibility to join, and add a point in the middle. 
-    # Also create the edges in the interior.
-    edgesm, points = create_mid_points_and_edges( grid, points )
-    edges += edgesm
+    if isinstance( grid, np.ndarray ):
+        edges, points = boundary_edges_array( grid )
+        points = np.concatenate( ( points, point_breaks_array( grid ) ) )
+        
+        # Find the points where there are more than one possibility to join, and add a point in the middle. 
+        # Also create the edges in the interior.
+        edgesm, points = create_mid_points_and_edges_array( grid.shape, points )
+        edges = np.concatenate( ( edges, edgesm ) )
+    else:
+        edges, points = boundary_edges( grid )
+        points += point_breaks( grid )
+        edgesm, points = create_mid_points_and_edges( grid, points )
+        edges += edgesm
     # Pass the edges to obtain polygons and return.
-    polygons, graph, points = obtain_polygons( edges, points )
-    classification = list(map( lambda p: classify_polygon(grid, p, points), polygons ))
+    polygons, graph, points = obtain_polygons( edges, points, output )
+    if output == "arrays":
+        # Only the first edge of the outer rings is needed.
+        polygon_offsets, ring_offsets, indices = polygons
+        first = ring_offsets[polygon_offsets[:-1]]
+        ends = np.column_stack( ( first, first + ( ring_offsets[polygon_offsets[:-1]+1] - first > 1 ) ) ).ravel()
+        classification = np.asarray( classify_polygons( grid, indices[ends], np.arange( 0, len(ends)+1, 2 ), points ) )
+        if with_graph:
+            return polygons, classification, points, graph
+        return polygons, classification, points
+    sizes = [ len(p[0]) for p in polygons ]
+    outer = np.fromiter( ( i for p in polygons for i in p[0] ), dtype=np.int64, count=sum(sizes) )
+    classification = classify_polygons( grid, outer, np.concatenate( ( [0], np.cumsum( sizes, dtype=np.int64 ) ) ), points )
+    if with_graph:
+        return polygons, classification, points, graph
     return polygons, classification, points
 
+def tile_windows( size, tile ):
+    """
+    Splits the cells 0..size-1 in windows of tile cells, where every window
+    shares its last cell with the next one. The windows are returned as
+    (first, last) cells. A last window thinner than three cells is merged
+    with the previous one.
+    """
+    tile = max( int(tile), 2 )
+    windows = []
+    start = 0
+    while start < size-1:
+        stop = min( start+tile, size-1 )
+        windows.append( [start, stop] )
+        start = stop
+    if not len(windows):
+        return [(0, size-1)]
+    if len(windows) > 1 and windows[-1][1]-windows[-1][0] < 2:
+        last = windows.pop()
+        windows[-1][1] = last[1]
+    return list(map( tuple, windows ))
+
+def lattice_keys( points, offset, shape ):
+    """
+    Moves the points of a window to the grid, and numbers them in the
+    half lattice of a grid of the given shape, row by row.
+    """
+    lattice = np.rint( ( np.asarray(points, dtype=float).reshape((-1, 2)) + offset )*2.0 ).astype(np.int64)
+    return lattice[:,1]*(2*shape[1]-1) + lattice[:,0]
+
+def lattice_coordinates( keys, shape ):
+    """
+    The (x, y) positions in the half lattice of the given keys.
+    """
+    y, x = np.divmod( np.asarray(keys, dtype=np.int64), 2*shape[1]-1 )
+    return x, y
+
+def lattice_point_order( keys, shape ):
+    """
+    Sorts the keys of the half lattice in the same order polygons_from_grid
+    creates the points. First the corners and the breaks in the boundary,
+    then the breaks in the interior, and last the mid points.
+    """
+    ny, nx = shape
+    x, y = lattice_coordinates( keys, shape )
+    xodd = x % 2 == 1
+    yodd = y % 2 == 1
+    cat = np.full( len(x), 2 )
+    side = np.zeros( len(x), dtype=np.int64 )
+    pos = np.zeros( len(x), dtype=np.int64 )
+    
+    # Corners.
+    corner = ~xodd & ~yodd
+    cat[corner] = 0
+    side[corner] = np.where( x[corner] == 0, np.where( y[corner] == 0, 0, 1 ), np.where( y[corner] == 0, 3, 2 ) )
+    
+    # Breaks in the left, bottom, right and top sides.
+    for s, on, p in [ ( 0, ~xodd & (x == 0), y ), ( 1, ~yodd & (y == 2*(ny-1)), x ),
+                      ( 2, ~xodd & (x == 2*(nx-1)), -y ), ( 3, ~yodd & (y == 0), -x ) ]:
+        on = on & ~corner & ( cat == 2 )
+        cat[on] = 1
+        side[on] = s
+        pos[on] = p[on]
+    
+    # Breaks in the interior, in the order of their cell and side.
+    inner = cat == 2
+    hor = inner & xodd & ~yodd
+    cx = np.where( hor, (x-1)//2, x//2 )
+    cy = np.where( hor, y//2, (y-1)//2 )
+    slot = np.where( hor, np.where( cx == 0, 0, 2 ), np.where( cy == 0, 1, 3 ) )
+    cx = np.where( hor & (cx == 0), 1, cx )
+    cy = np.where( ~hor & (cy == 0), 1, cy )
+    pos[inner] = ( ( cy*nx + cx )*4 + slot )[inner]
+    
+    # Mid points.
+    mid = xodd & yodd
+    cat[mid] = 3
+    pos[mid] = ( (y[mid]-1)//2 )*nx + (x[mid]-1)//2
+    return np.lexsort( ( pos, side, cat ) )
+
+def next_ring_edges( a, b, group, shape, after=None, before=None ):
+    """
+    Given directed edges from a to b in the half lattice, each one in a group,
+    finds the edge that follows each one in the same group. When more than
+    one edge leaves a point, the one that turns the most to the left is next,
+    as tie_polygons does. An edge can stand for a longer path, then after and
+    before are the points after a and before b in the path, that give the
+    directions of its first and last steps.
+    """
+    verts, inv = np.unique( np.concatenate( ( a, b ) ), return_inverse=True )
+    nv = len(verts)
+    va = inv[:len(a)]
+    vb = inv[len(a):]
+    start = group*nv + va
+    order = np.argsort( start, kind='stable' )
+    start = start[order]
+    target = group*nv + vb
+    first = np.searchsorted( start, target, 'left' )
+    count = np.searchsorted( start, target, 'right' ) - first
+    if np.any( count == 0 ):
+        raise Exception("Error tying polygons.")
+    nxt = order[np.minimum( first, len(order)-1 )]
+    
+    # Points where a polygon touches itself.
+    x, y = lattice_coordinates( verts, shape )
+    ax, ay = lattice_coordinates( b if after is None else after, shape )
+    bx, by = lattice_coordinates( a if before is None else before, shape )
+    for e in np.nonzero( count > 1 )[0]:
+        back = math.atan2( by[e]-y[vb[e]], bx[e]-x[vb[e]] )
+        best = None
+        for c in order[first[e]:first[e]+count[e]]:
+            turn = ( back - math.atan2( ay[c]-y[va[c]], ax[c]-x[va[c]] ) ) % (2*math.pi)
+            if best is None or turn < best[0]:
+                best = ( turn, c )
+        nxt[e] = best[1]
+    return nxt
+
+def stitch_polygons( partial, shape, seams_x=(), seams_y=(), open_x=(), open_y=() ):
+    """
+    Joins the pieces of polygons cut by the seams between windows of a grid.
+    Parameters
+    ----------
+    partial: list
+        The pieces, as ( classification, rings ), each ring an array of half
+        lattice keys.
+    shape:
+        The shape of the whole grid.
+    seams_x, seams_y:
+        The columns and rows where the windows meet.
+    open_x, open_y:
+        The seams that still miss the windows at one side.
+    Results
+    -------
+    finished: list
+        The polygons that don't touch an open seam anymore, with the outer ring first.
+    partial: list
+        The rest of the joined pieces.
+    position: array
+        Where every piece ended, in finished or in partial.
+    """
+    if not len(partial):
+        return [], [], np.zeros( 0, dtype=np.int64 )
+    rings = [ r for c, p in partial for r in p ]
+    owner = np.repeat( np.arange( len(partial) ), [ len(p) for c, p in partial ] )
+    a = np.concatenate( rings )
+    b = np.concatenate( [ np.roll( r, -1 ) for r in rings ] )
+    owner = np.repeat( owner, [ len(r) for r in rings ] )
+    
+    # The pieces that share an edge of a seam, in opposite directions, are the same polygon.
+    x, y = lattice_coordinates( a, shape )
+    bx, by = lattice_coordinates( b, shape )
+    seam = np.nonzero( ( ( y == by ) & np.isin( y, 2*np.asarray(seams_y, dtype=np.int64) ) ) |
+                       ( ( x == bx ) & np.isin( x, 2*np.asarray(seams_x, dtype=np.int64) ) ) )[0]
+    lo = np.minimum( a[seam], b[seam] )
+    hi = np.maximum( a[seam], b[seam] )
+    order = np.lexsort( ( hi, lo ) )
+    same = ( lo[order][1:] == lo[order][:-1] ) & ( hi[order][1:] == hi[order][:-1] )
+    first = seam[order[:-1][same]]
+    second = seam[order[1:][same]]
+    joins = coo_matrix( ( np.ones(len(first)), ( owner[first], owner[second] ) ), shape=(len(partial), len(partial)) )
+    ngroups, group = connected_components( joins, directed=False )
+    keep = np.ones( len(a), dtype=bool )
+    keep[first] = False
+    keep[second] = False
+    a = a[keep]
+    b = b[keep]
+    egroup = group[owner[keep]]
+    
+    # Follow the remaining edges to close the rings again.
+    offsets, order = permutation_cycles( next_ring_edges( a, b, egroup, shape ) )
+    ring_group = egroup[order[offsets[:-1]]]
+    x, y = lattice_coordinates( a, shape )
+    bx, by = lattice_coordinates( b, shape )
+    area = np.add.reduceat( (x*by - y*bx)[order], offsets[:-1] ) if len(order) else np.zeros(0)
+    
+    # A group is still partial if it has an edge over an open seam.
+    on_open = ( ( y == by ) & np.isin( y, 2*np.asarray(open_y, dtype=np.int64) ) ) | \
+              ( ( x == bx ) & np.isin( x, 2*np.asarray(open_x, dtype=np.int64) ) )
+    still_open = np.bincount( egroup[on_open], minlength=ngroups ) > 0
+    
+    cls = [ None for i in range(ngroups) ]
+    for i, o in enumerate(group):
+        if cls[o] is None:
+            cls[o] = partial[i][0]
+        elif cls[o] != partial[i][0]:
+            raise Exception("Error stitching polygons.")
+    joined = [ [] for i in range(ngroups) ]
+    for i in np.argsort( -area, kind='stable' ):
+        joined[ring_group[i]].append( a[order[offsets[i]:offsets[i+1]]] )
+    
+    finished = []
+    remaining = []
+    position = np.zeros( ngroups, dtype=np.int64 )
+    for i in range(ngroups):
+        if still_open[i]:
+            position[i] = len(remaining)
+            remaining.append( ( cls[i], joined[i] ) )
+        else:
+            position[i] = len(finished)
+            finished.append( ( cls[i], joined[i] ) )
+    return finished, remaining, position[group]
+
+def assemble_polygons( pieces, shape ):
+    """
+    Numbers the points of polygons given in half lattice keys as polygons_from_grid
+    does, and returns its (polygons, classification, points). The corners of the
+    windows, that are not points of the whole grid, are removed.
+    """
+    ny, nx = shape
+    corners = lattice_keys( [(0.0, 0.0), (0.0, ny-1.0), (nx-1.0, ny-1.0), (nx-1.0, 0.0)], (0.0, 0.0), shape )
+    pieces = list(pieces)
+    rings = []
+    for c, p in pieces:
+        for r in p:
+            x, y = lattice_coordinates( r, shape )
+            rings.append( r[ ( x % 2 == 1 ) | ( y % 2 == 1 ) | np.isin( r, corners ) ] )
+    if not len(rings):
+        return [], [], []
+    
+    keys = np.unique( np.concatenate( rings ) )
+    order = lattice_point_order( keys, shape )
+    rank = np.empty( len(keys), dtype=np.int64 )
+    rank[order] = np.arange( len(keys) )
+    x, y = lattice_coordinates( keys[order], shape )
+    points = list(map( tuple, np.column_stack( ( x/2.0, y/2.0 ) ).tolist() ))
+    
+    polygons = []
+    cnt = 0
+    for c, p in pieces:
+        polygons.append( [ rank[np.searchsorted( keys, r )].tolist() for r in rings[cnt:cnt+len(p)] ] )
+        cnt += len(p)
+    return polygons, [ c for c, p in pieces ], points
+
+def grid_window_polygons( grid, rows, cols, shape, engine="planar" ):
+    """
+    Runs polygons_from_grid in a window of the grid, given its first and last
+    row and column, and returns the polygons as ( classification, rings ),
+    the rings in half lattice keys of the whole grid.
+    """
+    window = np.array( grid[rows[0]:rows[1]+1, cols[0]:cols[1]+1] )
+    polygons, cls, points = polygons_from_grid( window, engine=engine )
+    keys = lattice_keys( points, ( cols[0], rows[0] ), shape )
+    return [ ( c, [ keys[r] for r in p ] ) for p, c in zip( polygons, cls ) ]
+
+def polygons_from_grid_tiled( grid, tile=1024, engine="planar" ):
+    """
+    Same as polygons_from_grid, but the grid is processed in windows of
+    tile x tile cells, so it can be larger than memory. The grid can be a
+    numpy array, a np.memmap, or the name of a .npy file, that is memory mapped.
+    The polygons that cross the seams between windows are joined, so the
+    polygons, classification and points are the same as polygons_from_grid.
+    Only the order of the polygons, and where their rings start, can differ.
+    The engine polygonizes every window, as in polygons_from_grid.
+    """
+    if isinstance( grid, str ):
+        grid = np.load( grid, mmap_mode='r' )
+    shape = grid.shape
+    rows = tile_windows( shape[0], tile )
+    cols = tile_windows( shape[1], tile )
+    if len(rows) == 1 and len(cols) == 1:
+        return polygons_from_grid( np.array(grid), engine=engine )
+    
+    seams_x = np.array( [ c[0] for c in cols[1:] ], dtype=np.int64 )
+    seams_y = np.array( [ r[0] for r in rows[1:] ], dtype=np.int64 )
+    finished = []
+    partial = []
+    for i, r in enumerate(rows):
+        for c in cols:
+            for cls, rings in grid_window_polygons( grid, r, c, shape, engine ):
+                x, y = lattice_coordinates( np.concatenate( rings ), shape )
+                if np.any( np.isin( x, 2*seams_x ) ) or np.any( np.isin( y, 2*seams_y ) ):
+                    partial.append( ( cls, rings ) )
+                else:
+                    finished.append( ( cls, rings ) )
+        # Join what's done in this row of windows, the seam below is still open.
+        done, partial, position = stitch_polygons( partial, shape, seams_x, seams_y, open_y=seams_y[i:i+1] )
+        finished += done
+    return assemble_polygons( finished, shape )
+
+def lattice_rings( rings, shape, last_row=None ):
+    """
+    The rings of a polygon in half lattice keys as lists of (x, y) points. The
+    corners of the windows are removed, except the corners of the grid, where
+    last_row is the last row of the grid, if it's known.
+    """
+    ret = []
+    for r in rings:
+        x, y = lattice_coordinates( r, shape )
+        corner = ( ( x == 0 ) | ( x == 2*(shape[1]-1) ) ) & ( ( y == 0 ) | ( y == 2*last_row if last_row is not None else False ) )
+        keep = ( x % 2 == 1 ) | ( y % 2 == 1 ) | corner
+        ret.append( list(map( tuple, np.column_stack( ( x[keep]/2.0, y[keep]/2.0 ) ).tolist() )) )
+    return ret
+
+def rope_leaves( rope ):
+    """
+    The arrays in a rope, nested tuples of arrays, in order.
+    """
+    leaves = []
+    stack = [ rope ]
+    while stack:
+        r = stack.pop()
+        if isinstance( r, tuple ):
+            stack.extend( reversed(r) )
+        else:
+            leaves.append( r )
+    return leaves
+
+def rope_path( rope ):
+    """
+    The keys of a path kept as a rope of paths, each one starting where the one
+    before ends, without the last key.
+    """
+    return np.concatenate( [ l[:-1] for l in rope_leaves( rope ) ] )
+
+def join_row_pieces( opened, pieces, shape, top, bottom=None ):
+    """
+    Joins the polygons still open over the seam at row top with the pieces of the
+    next strip that touch a seam, in polygons_from_rows. An open polygon is kept as
+    ( classification, rings, arcs, seam ): a rope of the rings it closed already,
+    the paths of its open rings between their edges over the open seam, as
+    ( rope, first, second, second last, last key ), and those edges as (lo, hi)
+    keys. Every path is joined as one edge, so the rows above the seam are never
+    stitched again. bottom is the row of the seam still open, None at the end.
+    Returns the polygons that closed, as ( classification, rings ), and the open ones.
+    """
+    if not len(opened) and not len(pieces):
+        return [], []
+    arcs = [ arc for o in opened for arc in o[2] ]
+    owner = [ np.repeat( np.arange( len(opened) ), [ len(o[2]) for o in opened ] ).astype(np.int64) ]
+    a = [ np.array( [ arc[1] for arc in arcs ], dtype=np.int64 ) ]
+    after = [ np.array( [ arc[2] for arc in arcs ], dtype=np.int64 ) ]
+    before = [ np.array( [ arc[3] for arc in arcs ], dtype=np.int64 ) ]
+    b = [ np.array( [ arc[4] for arc in arcs ], dtype=np.int64 ) ]
+    for j, ( c, rings ) in enumerate(pieces):
+        for r in rings:
+            a.append( r )
+            b.append( np.roll( r, -1 ) )
+            owner.append( np.full( len(r), len(opened) + j, dtype=np.int64 ) )
+    a = np.concatenate( a )
+    b = np.concatenate( b )
+    owner = np.concatenate( owner )
+    after = np.concatenate( after + [ b[len(arcs):] ] )
+    before = np.concatenate( before + [ a[len(arcs):] ] )
+    kind = np.full( len(a), -1, dtype=np.int64 )
+    kind[:len(arcs)] = np.arange( len(arcs) )
+    x, y = lattice_coordinates( a, shape )
+    bx, by = lattice_coordinates( b, shape )
+    
+    # The pieces join the open polygons through the edges of the seam above.
+    above = ( kind < 0 ) & ( y == by ) & ( y == 2*top ) & ( top > 0 )
+    seam = [ o[3] for o in opened ] + [ np.column_stack( ( np.minimum( a[above], b[above] ), np.maximum( a[above], b[above] ) ) ) ]
+    seam_owner = np.concatenate( [ np.full( len(o[3]), i, dtype=np.int64 ) for i, o in enumerate(opened) ] + [ owner[above] ] )
+    seam = np.concatenate( seam ).reshape((-1, 2))
+    order = np.lexsort( ( seam[:,1], seam[:,0] ) )
+    same = np.all( seam[order][1:] == seam[order][:-1], axis=1 )
+    nodes = len(opened) + len(pieces)
+    joins = coo_matrix( ( np.ones( same.sum() ), ( seam_owner[order[:-1][same]], seam_owner[order[1:][same]] ) ), shape=(nodes, nodes) )
+    ngroups, group = connected_components( joins, directed=False )
+    keep = ~above
+    a, b, after, before, kind, owner = a[keep], b[keep], after[keep], before[keep], kind[keep], owner[keep]
+    egroup = group[owner]
+    below = np.zeros( len(a), dtype=bool )
+    if bottom is not None:
+        y = lattice_coordinates( a, shape )[1]
+        by = lattice_coordinates( b, shape )[1]
+        below = ( kind < 0 ) & ( y == by ) & ( y == 2*bottom )
+    
+    def path( run ):
+        # The rope of the path through some consecutive edges.
+        parts = []
+        start = 0
+        for k in np.nonzero( kind[run] >= 0 )[0]:
+            if k > start:
+                parts.append( np.append( a[run[start:k]], b[run[k-1]] ) )
+            parts.append( arcs[kind[run[k]]][0] )
+            start = k + 1
+        if start < len(run):
+            parts.append( np.append( a[run[start:]], b[run[-1]] ) )
+        return tuple(parts)
+    
+    cls = [ None for i in range(ngroups) ]
+    for i, o in enumerate(group):
+        c = opened[i][0] if i < len(opened) else pieces[i-len(opened)][0]
+        if cls[o] is None:
+            cls[o] = c
+        elif cls[o] != c:
+            raise Exception("Error stitching polygons.")
+    closed = [ [] for i in range(ngroups) ]
+    for i, o in enumerate(opened):
+        closed[group[i]].append( o[1] )
+    paths = [ [] for i in range(ngroups) ]
+    edges = [ [] for i in range(ngroups) ]
+    offsets, order = permutation_cycles( next_ring_edges( a, b, egroup, shape, after, before ) )
+    for i in range(len(offsets)-1):
+        ring = order[offsets[i]:offsets[i+1]]
+        g = egroup[ring[0]]
+        cut = np.nonzero( below[ring] )[0]
+        if not len(cut):
+            closed[g].append( rope_path( path( ring ) ) )
+            continue
+        # The paths between the edges over the open seam.
+        ring = np.roll( ring, -(cut[0]+1) )
+        cut = np.nonzero( below[ring] )[0]
+        edges[g].append( np.column_stack( ( np.minimum( a[ring[cut]], b[ring[cut]] ), np.maximum( a[ring[cut]], b[ring[cut]] ) ) ) )
+        for start, end in zip( np.append( 0, cut[:-1]+1 ), cut ):
+            if end > start:
+                run = ring[start:end]
+                paths[g].append( ( path( run ), a[run[0]], after[run[0]], before[run[-1]], b[run[-1]] ) )
+    
+    finished = []
+    remaining = []
+    for g in range(ngroups):
+        if len(paths[g]):
+            remaining.append( ( cls[g], tuple(closed[g]), paths[g], np.concatenate( edges[g] ) ) )
+            continue
+        rings = rope_leaves( tuple(closed[g]) )
+        area = []
+        for r in rings:
+            x, y = lattice_coordinates( r, shape )
+            area.append( np.sum( x*np.roll( y, -1 ) - y*np.roll( x, -1 ) ) )
+        finished.append( ( cls[g], [ rings[k] for k in np.argsort( -np.array( area ), kind='stable' ) ] ) )
+    return finished, remaining
+
+def polygons_from_rows( rows, chunk=256, engine="planar" ):
+    """
+    Polygonizes a grid that arrives row by row, as a generator. The rows are
+    read in strips of chunk rows. A polygon that still touches the last row of
+    a strip is kept as the rings it closed, the paths of its open rings and
+    their edges over that row, and the paths are joined with the next strip as
+    single edges, see join_row_pieces, so every row is stitched once. The
+    memory is the strip and the polygons still open, that grow with the height
+    of the grid when they are tall. Every polygon is yielded as soon as it
+    closes, as ( polygon, classification ), the polygon as a list of rings of
+    (x, y) points, the outer ring first. The polygons are the same as
+    polygons_from_grid, but given by their points, as the numbers of the
+    points are not known until the whole grid is read.
+    """
+    chunk = max( int(chunk), 2 )
+    buf = []
+    shape = None
+    top = 0
+    opened = []
+    rows = iter(rows)
+    while True:
+        row = next( rows, None )
+        if row is not None:
+            buf.append( np.asarray(row) )
+            # Wait for two more rows, so the last strip is never too thin.
+            if len(buf) < chunk+3:
+                continue
+        if not len(buf):
+            return
+        if shape is None and row is None:
+            # The whole grid fits in one strip.
+            polygons, cls, points = polygons_from_grid( np.array(buf), engine=engine )
+            for p, c in zip( polygons, cls ):
+                yield [ [ tuple(points[i]) for i in r ] for r in p ], c
+            return
+        
+        strip = np.array( buf if row is None else buf[:chunk+1] )
+        shape = ( 0, strip.shape[1] )
+        bottom = top + len(strip) - 1
+        polygons, cls, points = polygons_from_grid( strip, engine=engine )
+        keys = lattice_keys( points, ( 0, top ), shape )
+        seams_y = [ s for s in ( top, bottom if row is not None else None ) if s is not None and s > 0 ]
+        pieces = []
+        for p, c in zip( polygons, cls ):
+            rings = [ keys[r] for r in p ]
+            x, y = lattice_coordinates( np.concatenate( rings ), shape )
+            if np.any( np.isin( y, 2*np.array( seams_y, dtype=np.int64 ) ) ):
+                pieces.append( ( c, rings ) )
+            else:
+                yield lattice_rings( rings, shape, bottom if row is None else None ), c
+        
+        # Join the pieces through the seam above, the seam below is still open.
+        done, opened = join_row_pieces( opened, pieces, shape, top, bottom if row is not None else None )
+        for c, rings in done:
+            yield lattice_rings( rings, shape, bottom if row is None else None ), c
+        if row is None:
+            return
+        top = bottom
+        buf = buf[chunk:]
+
+def grid_strip_polygons( source, rows, shape, engine="planar" ):
+    """
+    Runs polygons_from_grid in a strip of rows of a grid, in a worker of
+    polygons_from_grid_parallel. The source is the strip itself, or the name and
+    type of the shared memory where the whole grid is. Returns the polygons in
+    compressed rows, see polygon_arrays, with the points as half lattice keys of
+    the whole grid, their classification, and the graph of neighbour polygons in
+    the strip, in compressed rows too.
+    """
+    if isinstance( source, tuple ):
+        shm = shared_memory.SharedMemory( name=source[0] )
+        try:
+            strip = np.array( np.ndarray( shape, dtype=source[1], buffer=shm.buf )[rows[0]:rows[1]+1] )
+        finally:
+            shm.close()
+    else:
+        strip = source
+    ( polygon_offsets, ring_offsets, indices ), cls, points, graph = polygons_from_grid( strip, with_graph=True, engine=engine, output="arrays" )
+    keys = lattice_keys( points, ( 0, rows[0] ), shape )
+    return ( polygon_offsets, ring_offsets, keys[indices] ), cls, graph
+
+def polygon_rows( polygon_offsets, ring_offsets, indices, which ):
+    """
+    Some of the polygons in compressed rows, in compressed rows.
+    """
+    nrings = polygon_offsets[which+1] - polygon_offsets[which]
+    rings = np.repeat( polygon_offsets[which] - np.cumsum( nrings ) + nrings, nrings ) + np.arange( nrings.sum() )
+    sizes = ring_offsets[rings+1] - ring_offsets[rings]
+    at = np.repeat( ring_offsets[rings] - np.cumsum( sizes ) + sizes, sizes ) + np.arange( sizes.sum() )
+    return ( np.concatenate( ( [0], np.cumsum( nrings ) ) ), np.concatenate( ( [0], np.cumsum( sizes ) ) ), indices[at] )
+
+def concatenate_polygon_rows( parts ):
+    """
+    Joins polygons in compressed rows, one set after the other.
+    """
+    parts = list(parts)
+    polygon_offsets = [ np.zeros( 1, dtype=np.int64 ) ]
+    ring_offsets = [ np.zeros( 1, dtype=np.int64 ) ]
+    rings = 0
+    size = 0
+    for po, ro, indices in parts:
+        polygon_offsets.append( np.asarray( po[1:], dtype=np.int64 ) + rings )
+        ring_offsets.append( np.asarray( ro[1:], dtype=np.int64 ) + size )
+        rings += int(po[-1])
+        size += int(ro[-1])
+    indices = np.concatenate( [ np.zeros( 0, dtype=np.int64 ) ] + [ p[2] for p in parts ] )
+    return np.concatenate( polygon_offsets ), np.concatenate( ring_offsets ), indices
+
+def assemble_arrays( polygon_offsets, ring_offsets, keys, shape ):
+    """
+    Same as assemble_polygons, for polygons in compressed rows of half lattice
+    keys. Returns the polygons in compressed rows of points, see polygon_arrays,
+    and the points as an (n, 2) array.
+    """
+    ny, nx = shape
+    corners = lattice_keys( [(0.0, 0.0), (0.0, ny-1.0), (nx-1.0, ny-1.0), (nx-1.0, 0.0)], (0.0, 0.0), shape )
+    x, y = lattice_coordinates( keys, shape )
+    keep = ( x % 2 == 1 ) | ( y % 2 == 1 ) | np.isin( keys, corners )
+    ring = np.repeat( np.arange( len(ring_offsets)-1 ), np.diff( ring_offsets ) )
+    ring_offsets = np.concatenate( ( [0], np.cumsum( np.bincount( ring[keep], minlength=len(ring_offsets)-1 ) ) ) )
+    unique, inverse = np.unique( keys[keep], return_inverse=True )
+    order = lattice_point_order( unique, shape )
+    rank = np.empty( len(unique), dtype=np.int64 )
+    rank[order] = np.arange( len(unique) )
+    x, y = lattice_coordinates( unique[order], shape )
+    points = np.column_stack( ( x/2.0, y/2.0 ) ).reshape((-1, 2))
+    return ( np.asarray( polygon_offsets, dtype=np.int64 ), ring_offsets, rank[inverse.ravel()].astype(np.int32) ), points
+
+def polygons_from_grid_parallel( grid, workers=None, with_graph=False, engine="planar", output="lists" ):
+    """
+    Same as polygons_from_grid, but the grid is split in a strip of rows for
+    every worker, and the strips are polygonized in a process pool, reading the
+    grid from shared memory. The polygons that cross the strips are joined,
+    as in polygons_from_grid_tiled, and so are the graphs of neighbour polygons.
+    Only the order of the polygons, and where their rings start, can differ
+    from polygons_from_grid. Shared memory needs Python 3.8, before it the
+    strips are pickled to the workers, and on Python 2 the pool is a
+    multiprocessing.Pool, see process_map. The strips come in compressed rows,
+    and only the polygons that touch a seam are joined as lists, so with output
+    "arrays" the polygons inside the strips are never lists.
+    """
+    workers = cpu_workers( workers )
+    if not isinstance( grid, np.ndarray ):
+        grid = np.array( list(map( list, grid )) )
+    shape = grid.shape
+    rows = tile_windows( shape[0], -(-shape[0] // max( workers, 1 )) )
+    if len(rows) == 1 or shape[1] < 3:
+        return polygons_from_grid( grid, with_graph=with_graph, engine=engine, output=output )
+    
+    shm = None
+    if grid.dtype.hasobject or shared_memory is None:
+        sources = [ np.array( grid[r[0]:r[1]+1] ) for r in rows ]
+    else:
+        shm = shared_memory.SharedMemory( create=True, size=max( grid.nbytes, 1 ) )
+        np.ndarray( shape, dtype=grid.dtype, buffer=shm.buf )[:] = grid
+        sources = [ ( shm.name, grid.dtype.str ) for r in rows ]
+    try:
+        strips = process_map( grid_strip_polygons, min( workers, len(rows) ), sources, rows, [ shape for r in rows ], [ engine for r in rows ] )
+    finally:
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+    
+    # Keep the polygons inside the strips, and join the ones that touch a seam.
+    seams_y = np.array( [ r[0] for r in rows[1:] ], dtype=np.int64 )
+    finished = []
+    classes = []
+    partial = []
+    ids = []
+    count = 0
+    for ( po, ro, keys ), cls, graph in strips:
+        owner = np.repeat( np.repeat( np.arange( len(po)-1 ), np.diff( po ) ), np.diff( ro ) )
+        seam = np.bincount( owner[np.isin( lattice_coordinates( keys, shape )[1], 2*seams_y )], minlength=len(po)-1 ) > 0
+        inside = np.nonzero( ~seam )[0]
+        finished.append( polygon_rows( po, ro, keys, inside ) )
+        classes.append( cls[inside] )
+        strip_ids = np.empty( len(po)-1, dtype=np.int64 )
+        strip_ids[inside] = count + np.arange( len(inside) )
+        count += len(inside)
+        for i in np.nonzero( seam )[0]:
+            strip_ids[i] = -1-len(partial)
+            partial.append( ( cls[i], [ keys[ro[j]:ro[j+1]] for j in range( po[i], po[i+1] ) ] ) )
+        ids.append( strip_ids )
+    done, rest, position = stitch_polygons( partial, shape, seams_y=seams_y )
+    for strip_ids in ids:
+        joined = strip_ids < 0
+        strip_ids[joined] = count + position[-1-strip_ids[joined]]
+    if len(done):
+        finished.append( ( np.concatenate( ( [0], np.cumsum( [ len(p) for c, p in done ] ) ) ),
+                           np.concatenate( ( [0], np.cumsum( [ len(r) for c, p in done for r in p ] ) ) ),
+                           np.concatenate( [ r for c, p in done for r in p ] ) ) )
+        classes.append( np.array( [ c for c, p in done ] ) )
+    polygons, points = assemble_arrays( *( concatenate_polygon_rows( finished ) + ( shape, ) ) )
+    classification = np.concatenate( classes )
+    npolygons = len(polygons[0]) - 1
+    
+    if with_graph:
+        # The neighbours in every strip are neighbours of the joined polygons.
+        pairs = [ np.zeros( 0, dtype=np.int64 ) ]
+        for strip_ids, ( arrays, cls, ( offsets, indices ) ) in zip( ids, strips ):
+            i = strip_ids[np.repeat( np.arange( len(offsets)-1 ), np.diff( offsets ) )]
+            j = strip_ids[indices]
+            pairs.append( ( i*npolygons + j )[i != j] )
+        pairs = np.unique( np.concatenate( pairs ) )
+        graph = ( np.concatenate( ( [0], np.cumsum( np.bincount( pairs // max( npolygons, 1 ), minlength=npolygons ) ) ) ),
+                  ( pairs % max( npolygons, 1 ) ).astype(np.int32) )
+    if output == "arrays":
+        result = ( polygons, classification, points )
+        return result + ( graph, ) if with_graph else result
+    polygon_offsets, ring_offsets, indices = polygons
+    indices = indices.tolist()
+    result = ( [ [ indices[ring_offsets[j]:ring_offsets[j+1]] for j in range( polygon_offsets[i], polygon_offsets[i+1] ) ] for i in range(npolygons) ],
+               classification.tolist(), list(map( tuple, points.tolist() )) )
+    if not with_graph:
+        return result
+    offsets, indices = graph
+    indices = indices.tolist()
+    return result + ( [ indices[offsets[i]:offsets[i+1]] for i in range(npolygons) ], )
+
+class GridPolygonizer( object ):
+    """
+    Keeps the polygons of a grid, to polygonize it again after some of its
+    cells change. The polygons, classification, points and graph are the
+    same as polygons_from_grid( grid, with_graph=True, engine="trace" ),
+    and every polygon is numbered as the region of its cells in labels.
+    When the cells change, only the polygons around them are traced again.
+    The rest of the polygons and all the points keep their numbers, the
+    polygons that go away are left as None, and the new ones are added
+    at the end. The points that are not used anymore are not removed.
+    """
+    def __init__( self, grid ):
+        if not isinstance( grid, np.ndarray ):
+            grid = np.array( list(map( list, grid )) )
+        self.grid = np.array( grid )
+        self.shape = self.grid.shape
+        polygons, classification, points, graph, labels = trace_grid_regions( self.grid )
+        self.polygons = polygons
+        self.classification = classification
+        self.points = list(map( tuple, points.tolist() ))
+        self.graph = graph
+        self.labels = labels
+        self.keys = dict( zip( lattice_keys( points, ( 0, 0 ), self.shape ).tolist(), range(len(points)) ) )
+        self.bounds = [ ( s[0].start, s[0].stop-1, s[1].start, s[1].stop-1 ) for s in ndimage.find_objects( labels+1 ) ]
+    
+    def point_indices( self, keys ):
+        """
+        The numbers of the points with the given half lattice keys, adding
+        the points that are not there yet.
+        """
+        ret = []
+        for k in keys.tolist():
+            idx = self.keys.get( k )
+            if idx is None:
+                y, x = divmod( k, 2*self.shape[1]-1 )
+                idx = self.keys[k] = len(self.points)
+                self.points.append( ( x/2.0, y/2.0 ) )
+            ret.append( idx )
+        return ret
+    
+    def update( self, cells ):
+        """
+        Changes the cells given as a dict { (row, column): value }, or a list
+        of ( (row, column), value ), and traces again the polygons around them.
+        Parameters
+        ----------
+        cells:
+            The new values of the cells.
+        Results
+        -------
+        removed: list
+            The polygons that are not there anymore, now None.
+        added: list
+            The new polygons.
+        """
+        cells = dict( cells )
+        ny, nx = self.shape
+        if not len(cells):
+            return [], []
+        where = np.array( list(cells.keys()), dtype=np.int64 ).reshape((-1, 2))
+        if np.any( where < 0 ) or np.any( where[:,0] >= ny ) or np.any( where[:,1] >= nx ):
+            raise ValueError("Cells out of the grid.")
+        values = np.array( list(cells.values()), dtype=self.grid.dtype )
+        dirty = self.grid[where[:,0], where[:,1]] != values
+        if not np.any( dirty ):
+            return [], []
+        self.grid[where[:,0], where[:,1]] = values
+        where = where[dirty]
+        
+        # The regions that have a cell around a changed cell, and the window that surrounds them.
+        near = np.concatenate( [ self.labels[np.clip( where[:,0]+dr, 0, ny-1 ), np.clip( where[:,1]+dc, 0, nx-1 )]
+                                 for dr, dc in product( (-1, 0, 1), (-1, 0, 1) ) ] )
+        affected = np.unique( near )
+        around = set( affected.tolist() )
+        bounds = np.array( [ self.bounds[a] for a in affected ] )
+        r0, r1 = max( bounds[:,0].min()-1, 0 ), min( bounds[:,1].max()+1, ny-1 )
+        c0, c1 = max( bounds[:,2].min()-1, 0 ), min( bounds[:,3].max()+1, nx-1 )
+        # Windows thinner than three cells can't be traced.
+        r0, r1 = ( max( min( r0, ny-3 ), 0 ), min( max( r1, 2 ), ny-1 ) )
+        c0, c1 = ( max( min( c0, nx-3 ), 0 ), min( max( c1, 2 ), nx-1 ) )
+        
+        # Trace the window, the regions in it that were affected are closed inside it.
+        polygons, classification, points, graph, labels = trace_grid_regions( self.grid[r0:r1+1, c0:c1+1] )
+        keys = lattice_keys( points, ( c0, r0 ), self.shape )
+        old = self.labels[r0:r1+1, c0:c1+1]
+        inside = np.isin( old, affected )
+        first = np.zeros( len(polygons), dtype=np.int64 )
+        first[labels.ravel()] = np.arange( labels.size )
+        changed = inside.ravel()[first]
+        ids = old.ravel()[first]
+        
+        def canonical( polygon ):
+            rings = [ tuple( r[r.index(min(r)):] + r[:r.index(min(r))] ) for r in polygon ]
+            return rings[:1] + sorted(rings[1:])
+        
+        # A region that ends as it was keeps its number.
+        kept = set()
+        added = []
+        regions = ndimage.find_objects( labels+1 )
+        for w in np.nonzero( changed )[0]:
+            polygon = [ self.point_indices( keys[r] ) for r in polygons[w] ]
+            c = ids[w]
+            if not c in kept and self.classification[c] == classification[w] and canonical( self.polygons[c] ) == canonical( polygon ):
+                kept.add( c )
+                continue
+            ids[w] = len(self.polygons)
+            added.append( int(ids[w]) )
+            self.polygons.append( polygon )
+            self.classification.append( classification[w] )
+            self.graph.append( [] )
+            s = regions[w]
+            self.bounds.append( ( s[0].start+r0, s[0].stop-1+r0, s[1].start+c0, s[1].stop-1+c0 ) )
+        removed = [ int(a) for a in affected if not a in kept ]
+        
+        # Update the neighbours of the regions that changed.
+        for a in affected:
+            for n in self.graph[a]:
+                if not n in around:
+                    self.graph[n] = [ g for g in self.graph[n] if not g in around ]
+        for a in removed:
+            self.polygons[a] = None
+            self.classification[a] = None
+            self.graph[a] = None
+            self.bounds[a] = None
+        # A region outside can be cut in more than one piece by the window.
+        for w in np.nonzero( changed )[0]:
+            self.graph[ids[w]] = sorted(set( int(ids[g]) for g in graph[w] ))
+            for g in graph[w]:
+                if not changed[g] and not ids[w] in self.graph[ids[g]]:
+                    self.graph[ids[g]] = sorted( self.graph[ids[g]] + [ int(ids[w]) ] )
+        old[inside] = ids[labels[inside]]
+        return removed, added
+
+def grid_polygonizer_result( gp, with_graph=False ):
+    """
+    The polygons of a GridPolygonizer as polygons_from_grid returns them,
+    without the polygons that went away and with the points numbered as
+    polygons_from_grid numbers them. Returns the result, and the number in
+    the GridPolygonizer of every polygon.
+    """
+    live = [ i for i, p in enumerate(gp.polygons) if p is not None ]
+    keys = lattice_keys( gp.points, ( 0, 0 ), gp.shape )
+    rings = [ r for i in live for r in gp.polygons[i] ]
+    flat = np.fromiter( ( j for r in rings for j in r ), dtype=np.int64 )
+    used = np.unique( flat )
+    order = used[lattice_point_order( keys[used], gp.shape )]
+    number = np.full( len(keys), -1, dtype=np.int64 )
+    number[order] = np.arange( len(order) )
+    x, y = lattice_coordinates( keys[order], gp.shape )
+    points = list(map( tuple, np.column_stack( ( x/2.0, y/2.0 ) ).tolist() ))
+    
+    # Renumber all the rings at once, and cut them again.
+    flat = number[flat].tolist()
+    cuts = np.cumsum( [0] + [ len(r) for r in rings ] ).tolist()
+    rings = [ flat[cuts[j]:cuts[j+1]] for j in range(len(rings)) ]
+    cuts = np.cumsum( [0] + [ len(gp.polygons[i]) for i in live ] ).tolist()
+    polygons = [ rings[cuts[j]:cuts[j+1]] for j in range(len(live)) ]
+    classification = [ gp.classification[i] for i in live ]
+    if not with_graph:
+        return ( polygons, classification, points ), live
+    position = dict( ( i, n ) for n, i in enumerate(live) )
+    graph = [ [ position[g] for g in gp.graph[i] ] for i in live ]
+    return ( polygons, classification, points, graph ), live
+
+def grid_stack_polygons( source, slices, shape, with_graph=False, rebuild=0.05 ):
+    """
+    Polygonizes some consecutive slices of a volume, in a worker of
+    polygons_from_grid_stack. The source is the slices themselves, or the name
+    and type of the shared memory where the whole volume is. A slice equal
+    to the one before gets the same result, and a slice with a few changed cells
+    is polygonized updating the GridPolygonizer of the one before. When more
+    than a rebuild fraction of the cells change, the slice is polygonized again.
+    Returns the results of the slices, and the polygons that are the same in
+    every slice and the next one, or None if they were not followed.
+    """
+    if isinstance( source, tuple ):
+        shm = shared_memory.SharedMemory( name=source[0] )
+        try:
+            volume = np.array( np.ndarray( shape, dtype=source[1], buffer=shm.buf )[slices[0]:slices[1]] )
+        finally:
+            shm.close()
+    else:
+        volume = source
+    results = []
+    persistence = []
+    gp = None
+    live = []
+    for k in range(len(volume)):
+        if gp is not None and np.array_equal( volume[k], gp.grid ):
+            results.append( results[-1] )
+            persistence.append( [ ( i, i ) for i in range(len(live)) ] )
+            continue
+        changed = np.argwhere( volume[k] != gp.grid ) if gp is not None else None
+        if gp is None or len(changed) > rebuild*volume[k].size:
+            gp = GridPolygonizer( volume[k] )
+            follow = None
+        else:
+            gp.update( zip( map( tuple, changed.tolist() ), volume[k][changed[:,0], changed[:,1]] ) )
+            follow = live
+        result, live = grid_polygonizer_result( gp, with_graph )
+        if k > 0:
+            if follow is None:
+                persistence.append( None )
+            else:
+                position = dict( ( i, n ) for n, i in enumerate(live) )
+                persistence.append( [ ( n, position[i] ) for n, i in enumerate(follow) if i in position ] )
+        results.append( result )
+    return results, persistence
+
+def polygons_from_grid_stack( volume, workers=1, with_graph=False ):
+    """
+    Polygonizes every slice of a volume, an array of nz grids of the same
+    shape, sharing the work between consecutive slices. The slices equal to
+    the one before are not polygonized again, and the slices where only some
+    cells change trace again only the polygons around them, see GridPolygonizer.
+    With more than one worker, runs of consecutive slices are polygonized in a
+    process pool, reading the volume from shared memory. Shared memory needs
+    Python 3.8, before it the runs are pickled to the workers, and on Python 2
+    the pool is a multiprocessing.Pool, see process_map.
+    Parameters
+    ----------
+    volume: array
+        The grids, as an (nz, ny, nx) array.
+    workers: int
+        The number of processes, None to use all the cpus.
+    with_graph: bool
+        Return the graph of neighbour polygons of every slice too.
+    Results
+    -------
+    results: list
+        The result of polygons_from_grid for every slice, the same for equal slices.
+    persistence: list
+        For every slice and the next one, the ( polygon, polygon ) pairs that
+        are the same polygon in both.
+    """
+    volume = np.asarray( volume )
+    if volume.ndim != 3:
+        raise ValueError("The volume has to be an array of grids.")
+    nz = volume.shape[0]
+    workers = cpu_workers( workers )
+    runs = [ ( int(r[0]), int(r[-1])+1 ) for r in np.array_split( np.arange( nz ), max( min( workers, nz ), 1 ) ) if len(r) ]
+    if len(runs) <= 1:
+        chunks = [ grid_stack_polygons( volume, ( 0, nz ), volume.shape, with_graph ) ]
+    else:
+        shm = None
+        if volume.dtype.hasobject or shared_memory is None:
+            sources = [ np.array( volume[r[0]:r[1]] ) for r in runs ]
+        else:
+            shm = shared_memory.SharedMemory( create=True, size=max( volume.nbytes, 1 ) )
+            np.ndarray( volume.shape, dtype=volume.dtype, buffer=shm.buf )[:] = volume
+            sources = [ ( shm.name, volume.dtype.str ) for r in runs ]
+        try:
+            chunks = process_map( grid_stack_polygons, len(runs), sources, runs, [ volume.shape for r in runs ], [ with_graph for r in runs ] )
+        finally:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+    
+    results = []
+    persistence = []
+    for i, ( res, pers ) in enumerate(chunks):
+        if i > 0:
+            persistence.append( None )
+        results += res
+        persistence += pers
+    
+    # Where the polygons were not followed, match them by their class and rings.
+    def rings( result ):
+        polygons, classification, points = result[:3]
+        ret = {}
+        for n, ( p, c ) in enumerate(zip( polygons, classification )):
+            key = []
+            for r in p:
+                r = [ points[j] for j in r ]
+                m = r.index(min(r))
+                key.append( tuple( r[m:] + r[:m] ) )
+            ret[( c, key[0], tuple(sorted(key[1:])) )] = n
+        return ret
+    for k, pers in enumerate(persistence):
+        if pers is None:
+            before = rings( results[k] )
+            after = rings( results[k+1] )
+            persistence[k] = sorted( ( n, after[key] ) for key, n in before.items() if key in after )
+    return results, persistence
@@ -0,0 +1,67 @@
+"""
+Copyright 2018 Geomodelr, Inc. 
+rserrano at geomodelr.com
+
+This file is part of Geomtopo2d. Geomtopo2d is free software: 
+you can redistribute it and/or modify it under the terms of 
+the GNU Lesser General Public License as published by the Free
+Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Geomtopo2d is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+You should have received a copy of the GNU Lesser General Public License
+along with Geomtopo2d.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+from __future__ import print_function, division
+
+import multiprocessing
+try:
+    from concurrent.futures import ProcessPoolExecutor
+except ImportError:
+    # Python 2, the pools are from multiprocessing.
+    ProcessPoolExecutor = None
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # Before Python 3.8, the data is pickled to the workers.
+    shared_memory = None
+
+def cpu_workers( workers ):
+    """
+    The number of workers, all the cpus if workers is None.
+    """
+    if workers is not None:
+        return workers
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+def star_call( call ):
+    """
+    Calls call[0] with the rest of call as its arguments, in a worker of process_map.
+    """
+    return call[0]( *call[1:] )
+
+def process_map( function, workers, *iterables ):
+    """
+    The list of the results of function with the arguments taken from iterables,
+    as map, in a pool of workers processes. The pool is a
+    concurrent.futures.ProcessPoolExecutor where there is one, and a
+    multiprocessing.Pool on Python 2. The function has to be at the top of a
+    module, so the workers can find it.
+    """
+    if ProcessPoolExecutor is not None:
+        with ProcessPoolExecutor( max_workers=workers ) as pool:
+            return list( pool.map( function, *iterables ) )
+    pool = multiprocessing.Pool( workers )
+    try:
+        return pool.map( star_call, [ ( function, ) + tuple(args) for args in zip( *iterables ) ] )
+    finally:
+        pool.close()
+        pool.join()
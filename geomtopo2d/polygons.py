@@ -19,13 +19,120 @@ along with Geomtopo2d.  If not, see <http://www.gnu.org/licenses/>.
 from __future__ import print_function, division
 
 import math
+import os
+import shutil
+import tempfile
 import numpy as np
 import rtree
+import shapely
 from numpy import linalg as la
 from shapely.geometry import Polygon
+from shapely.prepared import prep
+from shapely.strtree import STRtree
+from scipy.sparse import coo_matrix, issparse
+from scipy.sparse.csgraph import connected_components
 from .geometry import vector_angle
 
-def separate_lines(edgs):
+# Shapely 2 queries an STRtree with arrays of shapes and a predicate.
+BULK_QUERY = int( shapely.__version__.split(".")[0] ) >= 2
+
+def chain_ends( nxt ):
+    """
+    The last element reached from every element, following nxt, where -1 ends a
+    chain, and how many steps it takes, doubling the jumps. The elements in cycles
+    never reach an end, so nxt is not -1 in their last element.
+    """
+    nxt = np.asarray( nxt, dtype=np.int64 )
+    step = np.where( nxt >= 0, nxt, np.arange( len(nxt) ) )
+    after = ( nxt >= 0 ).astype(np.int64)
+    for i in range( int(len(nxt)).bit_length() + 1 ):
+        jump = step[step]
+        if np.array_equal( jump, step ):
+            break
+        after = after + after[step]
+        step = jump
+    return step, after
+
+def take_rows( offsets, indices, rows ):
+    """
+    The rows of compressed rows, in the order given, as ( offsets, indices ).
+    """
+    offsets = np.asarray( offsets, dtype=np.int64 )
+    rows = np.asarray( rows, dtype=np.int64 )
+    sizes = offsets[rows+1] - offsets[rows]
+    skip = np.repeat( np.cumsum( sizes ) - sizes - offsets[rows], sizes )
+    return np.concatenate( ( [0], np.cumsum( sizes ) ) ).astype(np.int64), np.asarray( indices )[np.arange( sizes.sum() ) - skip]
+
+def line_arrays( edges ):
+    """
+    Splits a graph, given as an (m, 2) array of edges, in lines, at the points where
+    one, three or more edges meet, as separate_lines, and returns them in
+    compressed rows, as ( offsets, indices ), where line i is
+    indices[offsets[i]:offsets[i+1]]. The closed lines repeat their first point.
+    Every edge has its two half edges, and the next of a half edge is the other
+    edge of its point if it has two. The lines are followed by doubling the jumps
+    of the next half edges, and only the one that starts at a loose end, or at the
+    smallest half edge, of the two directions of a line is kept.
+    """
+    edges = np.asarray( edges, dtype=np.int64 ).reshape((-1, 2))
+    edges = edges[edges[:,0] != edges[:,1]]
+    if not len(edges):
+        return np.zeros( 1, dtype=np.int64 ), np.zeros( 0, dtype=np.int32 )
+    n = np.int64( edges.max() + 1 )
+    keys = np.unique( np.minimum( edges[:,0], edges[:,1] )*n + np.maximum( edges[:,0], edges[:,1] ) )
+    m = len(keys)
+    src = np.concatenate( np.divmod( keys, n ) )
+    dst = np.concatenate( np.divmod( keys, n )[::-1] )
+    half = np.arange( 2*m )
+    twin = ( half + m ) % ( 2*m )
+    degree = np.bincount( src, minlength=n )
+    order = np.argsort( src, kind='mergesort' )
+    offsets = np.concatenate( [ [0], np.cumsum( degree ) ] )
+    # The next half edge goes on through the points with two edges.
+    through = np.nonzero( degree[dst] == 2 )[0]
+    first = order[offsets[dst[through]]]
+    second = order[offsets[dst[through]] + 1]
+    nxt = np.full( 2*m, -1, dtype=np.int64 )
+    nxt[through] = np.where( first == twin[through], second, first )
+    last, after = chain_ends( nxt )
+    closed = nxt[last] >= 0
+    # Of the two directions of a line, keep the one that starts at a loose end, or
+    # else at the smallest half edge.
+    start = twin[last[twin]]
+    preferred = lambda h: ( degree[src[h]] != 1 )*( 2*m ) + h
+    keep = ~closed & ( preferred( start ) < preferred( twin[last] ) )
+    
+    # The closed lines start at the smallest of their edges, in its direction.
+    cycle = np.nonzero( closed )[0]
+    if len(cycle):
+        where = np.full( 2*m, -1, dtype=np.int64 )
+        where[cycle] = np.arange( len(cycle) )
+        cnext = where[nxt[cycle]]
+        lowest = cycle.copy()
+        lowest_edge = cycle % m
+        step = cnext
+        for i in range( int(2*m).bit_length() + 1 ):
+            lowest = np.minimum( lowest, lowest[step] )
+            lowest_edge = np.minimum( lowest_edge, lowest_edge[step] )
+            step = step[step]
+        chosen = lowest == lowest_edge
+        cycle = cycle[chosen]
+        where[cycle] = np.arange( len(cycle) )
+        # The line ends before its smallest half edge.
+        cnext = np.where( nxt[cycle] == lowest[chosen], -1, where[nxt[cycle]] )
+        cafter = chain_ends( cnext )[1]
+        start[cycle] = lowest[chosen]
+        after[cycle] = cafter
+        keep[cycle] = True
+    
+    kept = np.nonzero( keep )[0]
+    kept = kept[np.lexsort( ( -after[kept], start[kept] ) )]
+    ends = np.nonzero( after[kept] == 0 )[0]
+    indices = np.insert( src[kept], ends + 1, dst[kept[ends]] )
+    offsets = np.concatenate( [ [0], ends + 2 + np.arange( len(ends) ) ] )
+    return offsets.astype(np.int64), indices.astype(np.int32)
+
+def separate_lines( edgs, engine="dict" ):
     """
     Given a general graph, as represented by edges,
     it splits the graph at the points where three or
@@ -35,10 +142,18 @@ def separate_lines(edgs):
     ----------
     edgs : dict
         A set of edges to join together.
+    engine : str
+        "dict" walks the lines through dicts and sets of the edges, "arrays" takes
+        an (m, 2) array of edges, and returns the lines in compressed rows, see
+        line_arrays.
     Results
     -------
     dict : the edges joined at the corners.
     """
+    if engine == "arrays":
+        return line_arrays( edgs )
+    elif engine != "dict":
+        raise ValueError("Unknown engine %s." % engine)
     # Find the points with respective edges.
     pnh = {}
     for edg in edgs:
@@ -51,7 +166,7 @@ def separate_lines(edgs):
     rem_edges = set(edgs)
     cor_edges = []
     end_edges = []
-
+    
     for edg in rem_edges:
         n0 = edg[0]
         n1 = edg[1]
@@ -144,7 +259,63 @@ def signed_polygon_area( polygon, points ):
         area += ( points[polygon[i]][0]*points[polygon[ni]][1] - points[polygon[i]][1]*points[polygon[ni]][0] )
     return area/2.0
 
-def tie_polygons( lines, points ):
+def ring_measures( ring_offsets, indices, points ):
+    """
+    The signed area, the bounds, as ( minx, miny, maxx, maxy ), the perimeter and the
+    centroid of every ring, given in compressed rows, not closed, all at once, adding
+    every segment of every ring with reduceat. The rings with no area have the
+    mean of their points as centroid.
+    """
+    points = np.asarray( points, dtype=np.float64 ).reshape((-1, 2))
+    ring_offsets = np.asarray( ring_offsets, dtype=np.int64 )
+    n = len(ring_offsets) - 1
+    areas = np.zeros( n )
+    bounds = np.full( ( n, 4 ), np.nan )
+    perimeters = np.zeros( n )
+    centroids = np.full( ( n, 2 ), np.nan )
+    sizes = np.diff( ring_offsets )
+    full = np.nonzero( sizes > 0 )[0]
+    if not len(full):
+        return areas, bounds, perimeters, centroids
+    
+    a = np.asarray( indices, dtype=np.int64 )
+    nxt = np.arange( len(a) ) + 1
+    nxt[ring_offsets[1:][full]-1] = ring_offsets[:-1][full]
+    p = points[a]
+    q = points[a[nxt]]
+    cross = p[:,0]*q[:,1] - p[:,1]*q[:,0]
+    starts = ring_offsets[:-1][full]
+    areas[full] = np.add.reduceat( cross, starts )/2.0
+    bounds[full,:2] = np.minimum.reduceat( p, starts )
+    bounds[full,2:] = np.maximum.reduceat( p, starts )
+    perimeters[full] = np.add.reduceat( la.norm( q - p, axis=1 ), starts )
+    
+    moments = np.add.reduceat( ( p + q )*cross[:,None], starts )
+    means = np.add.reduceat( p, starts )/sizes[full][:,None]
+    flat = areas[full] == 0.0
+    centroids[full] = np.where( flat[:,None], means, moments/np.where( flat, 1.0, 6.0*areas[full] )[:,None] )
+    return areas, bounds, perimeters, centroids
+
+def polygon_measures( polygon_offsets, ring_offsets, indices, points ):
+    """
+    The area, the bounds, the perimeter and the centroid of every polygon with holes,
+    given as polygon_arrays returns them, from ring_measures. The holes go the
+    other way around, so their areas take them out of the area and the centroid.
+    The bounds are the ones of the outer ring.
+    """
+    polygon_offsets = np.asarray( polygon_offsets, dtype=np.int64 )
+    areas, bounds, perimeters, centroids = ring_measures( ring_offsets, indices, points )
+    n = len(polygon_offsets) - 1
+    if not n:
+        return np.zeros( 0 ), np.zeros( ( 0, 4 ) ), np.zeros( 0 ), np.zeros( ( 0, 2 ) )
+    starts = polygon_offsets[:-1]
+    area = np.add.reduceat( areas, starts )
+    moments = np.add.reduceat( centroids*areas[:,None], starts )
+    flat = area == 0.0
+    centroid = np.where( flat[:,None], centroids[starts], moments/np.where( flat, 1.0, area )[:,None] )
+    return area, bounds[starts], np.add.reduceat( perimeters, starts ), centroid
+
+def tie_polygons( lines, points, engine="dict" ):
     """
     It creates a set of polygons from a set of lines, separating them and ordering using
     a right hand rule.
@@ -152,6 +323,9 @@ def tie_polygons( lines, points ):
     ----------
     lines : list
         The set of lines returned by separate lines.
+    engine : str
+        "dict" follows the lines through dicts and sets of their ends, "halfedge"
+        through arrays of half edges, see tie_halfedges.
     Results
     -------
     polygons: list
@@ -172,6 +346,11 @@ def tie_polygons( lines, points ):
             lines.append(lines[i][(leni//2):])
             lines[i] = lines[i][:(leni//2)+1]
     
+    if engine == "halfedge":
+        return tie_halfedges( lines, points )
+    elif engine != "dict":
+        raise ValueError("Unknown engine %s." % engine)
+    
     ends = {}
     for i, l in enumerate(lines):
         
@@ -255,7 +434,7 @@ def tie_polygons( lines, points ):
         #     print ls
         #     assert False
         nexts[e] = next_lines( e, ls )
-
+    
     def next_line( nend, cl ):
         for i, n in enumerate(nend):
             if n == cl:
@@ -305,7 +484,204 @@ def tie_polygons( lines, points ):
  
     return ( all_polygons, graph_conn, graph_dual )
 
-def containments_from_to( polygons, contain, contained, points ):
+def tie_halfedges( lines, points ):
+    """
+    The polygons of tie_polygons, from the faces of halfedge_rings. The lines can't
+    be loops, tie_polygons splits them before.
+    """
+    nl = len(lines)
+    sizes = np.fromiter( ( len(l) for l in lines ), dtype=np.int64, count=nl )
+    flat = np.fromiter( ( i for l in lines for i in l ), dtype=np.int64, count=int(sizes.sum()) )
+    offsets = np.concatenate( ( [0], np.cumsum( sizes ) ) )
+    ring_offsets, indices, foffsets, line, across = halfedge_rings( offsets, flat, points )
+    nf = len(foffsets) - 1
+    polygon = indices.tolist()
+    cut = ring_offsets.tolist()
+    all_polygons = [ polygon[cut[i]:cut[i+1]] + [polygon[cut[i]]] for i in range(nf) ]
+    
+    # The lines around every polygon close with its first line, and that line
+    # has the polygon twice, as in the dict engine.
+    face = np.repeat( np.arange( nf ), np.diff( foffsets ) )
+    around = line.tolist()
+    fo = foffsets.tolist()
+    graph_conn = [ around[fo[i]:fo[i+1]] + [around[fo[i]]] for i in range(nf) ]
+    dline = np.concatenate( ( line, line[foffsets[:-1]] ) )
+    dface = np.concatenate( ( face, np.arange( nf ) ) )
+    dorder = np.lexsort( ( dface, dline ) )
+    dface = dface[dorder].tolist()
+    dcut = np.concatenate( ( [0], np.cumsum( np.bincount( dline, minlength=nl ) ) ) ).tolist()
+    graph_dual = [ dface[dcut[i]:dcut[i+1]] for i in range(nl) ]
+    return ( all_polygons, graph_conn, graph_dual )
+
+def halfedge_rings( offsets, flat, points ):
+    """
+    The faces of a set of lines, given in compressed rows, with the lines as half
+    edges between their ends, in both directions. The lines that don't surround
+    anything are peeled from the loose ends, the half edges leaving every point are
+    sorted clockwise, and the next of a half edge is the one after its twin, so the
+    faces are the cycles of the next half edges, see permutation_cycles. Returns
+    ( ring_offsets, indices, face_offsets, line, across ), the rings of the faces,
+    open, in compressed rows, and the line of every half edge, face after face, with
+    the face at its other side.
+    """
+    points = np.asarray( points, dtype=np.float64 ).reshape((-1, 2))
+    offsets = np.asarray( offsets, dtype=np.int64 )
+    flat = np.asarray( flat, dtype=np.int64 )
+    nl = len(offsets) - 1
+    empty = np.zeros( 0, dtype=np.int64 )
+    if not nl:
+        return np.zeros( 1, dtype=np.int64 ), empty, np.zeros( 1, dtype=np.int64 ), empty, empty
+    sizes = np.diff( offsets )
+    nodes, ends = np.unique( np.concatenate( ( flat[offsets[:-1]], flat[offsets[1:]-1] ) ), return_inverse=True )
+    ends = ends.ravel()
+    
+    # Peel the lines with a loose end, until every end meets two lines or more.
+    src = ends
+    degree = np.bincount( src, minlength=len(nodes) )
+    leaving = np.argsort( src, kind='mergesort' )
+    first = np.concatenate( ( [0], np.cumsum( degree )[:-1] ) )
+    count = degree.copy()
+    alive = np.ones( nl, dtype=bool )
+    leaves = np.nonzero( count == 1 )[0]
+    while len(leaves):
+        size = degree[leaves]
+        skip = np.repeat( np.cumsum( size ) - size - first[leaves], size )
+        peel = np.unique( leaving[np.arange( size.sum() ) - skip] % nl )
+        peel = peel[alive[peel]]
+        alive[peel] = False
+        touched = np.concatenate( ( ends[peel], ends[peel + nl] ) )
+        np.subtract.at( count, touched, 1 )
+        leaves = np.unique( touched[count[touched] == 1] )
+    
+    keep = np.nonzero( alive )[0]
+    k = len(keep)
+    if not k:
+        return np.zeros( 1, dtype=np.int64 ), empty, np.zeros( 1, dtype=np.int64 ), empty, empty
+    
+    # The half edges of the remaining lines, forwards and then backwards, leave
+    # their start towards the second point of the line.
+    src = np.concatenate( ( ends[keep], ends[keep + nl] ) )
+    dst = np.concatenate( ( ends[keep + nl], ends[keep] ) )
+    start = np.concatenate( ( flat[offsets[keep]], flat[offsets[keep+1]-1] ) )
+    second = np.concatenate( ( flat[offsets[keep]+1], flat[offsets[keep+1]-2] ) )
+    d = points[second] - points[start]
+    angle = np.arctan2( d[:,1], d[:,0] )
+    
+    out = np.lexsort( ( -angle, src ) )
+    degree = np.bincount( src, minlength=len(nodes) )
+    first = np.concatenate( ( [0], np.cumsum( degree )[:-1] ) )
+    pos = np.empty( 2*k, dtype=np.int64 )
+    pos[out] = np.arange( 2*k ) - first[src[out]]
+    twin = np.concatenate( ( np.arange( k, 2*k ), np.arange( k ) ) )
+    nxt = out[first[dst] + ( pos[twin] + 1 ) % degree[dst]]
+    foffsets, order = permutation_cycles( nxt )
+    face = np.empty( 2*k, dtype=np.int64 )
+    face[order] = np.repeat( np.arange( len(foffsets) - 1 ), np.diff( foffsets ) )
+    
+    # The points of every half edge but its end, in the order of the faces, so
+    # every face starts at the start of its first half edge.
+    line = keep[order % k]
+    forward = order < k
+    size = sizes[line] - 1
+    skip = np.repeat( np.cumsum( size ) - size, size )
+    step = np.arange( size.sum() ) - skip
+    base = np.repeat( np.where( forward, offsets[line], offsets[line+1] - 1 ), size )
+    indices = flat[np.where( np.repeat( forward, size ), base + step, base - step )]
+    ring_offsets = np.concatenate( ( [0], np.cumsum( size ) ) )[foffsets]
+    return ring_offsets, indices, foffsets, line, face[twin[order]]
+
+def permutation_cycles( nxt ):
+    """
+    Finds the cycles of a permutation, given as the next element of every element.
+    The cycles are found by pointer jumping, so every step is an array operation.
+    Returns
+    -------
+    offsets: array
+        Where every cycle starts in order, and the end of the last one.
+    order: array
+        The elements, cycle after cycle, each cycle starting at its smallest element.
+    """
+    nxt = np.asarray( nxt, dtype=np.int64 )
+    n = len(nxt)
+    if n == 0:
+        return np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    
+    # Label every element with the smallest element of its cycle.
+    label = np.arange( n, dtype=np.int64 )
+    jump = nxt.copy()
+    steps = 1
+    while steps < n:
+        label = np.minimum( label, label[jump] )
+        jump = jump[jump]
+        steps *= 2
+    
+    # Break the cycles before their smallest element, and count the steps to the break.
+    last = nxt == label
+    dist = np.where( last, 0, 1 )
+    jump = np.where( last, np.arange(n), nxt )
+    steps = 1
+    while steps < n:
+        dist = dist + dist[jump]
+        jump = jump[jump]
+        steps *= 2
+    
+    order = np.lexsort( ( -dist, label ) )
+    starts = np.nonzero( label[order] == order )[0]
+    return np.append( starts, n ), order
+
+def contained_pairs( shells, shapes, earlier=False ):
+    """
+    The shapes in every shell, as the arrays ( shape, shell ) of the pairs where the
+    shell contains the shape. The shells are bulk loaded once in a shapely STRtree
+    and all the shapes are queried at once. Shapely before 2 queries one at a time,
+    so there the bounds are streamed to an rtree and the shells are prepared. With
+    earlier, the shells are the shapes, and only the shells before a shape are tried.
+    """
+    if not len(shells) or not len(shapes):
+        return np.zeros( 0, dtype=np.int64 ), np.zeros( 0, dtype=np.int64 )
+    if BULK_QUERY:
+        found = STRtree( shells ).query( shapes, predicate="within" )
+        shape, shell = found[0].astype(np.int64), found[1].astype(np.int64)
+        if earlier:
+            return shape[shell < shape], shell[shell < shape]
+        return shape, shell
+    else:
+        tree = rtree.index.Index( ( ( j, s.bounds, None ) for j, s in enumerate(shells) ) )
+        prepared = {}
+        pairs = []
+        for i, s in enumerate(shapes):
+            for j in tree.intersection( s.bounds ):
+                if earlier and j >= i:
+                    continue
+                if not j in prepared:
+                    prepared[j] = prep( shells[j] )
+                try:
+                    inside = prepared[j].contains( s )
+                except Exception:
+                    # Old prepared predicates fail on some rings touching themselves.
+                    inside = shells[j].contains( s )
+                if inside:
+                    pairs.append( ( i, j ) )
+        pairs = np.array( pairs, dtype=np.int64 ).reshape((-1, 2))
+        return pairs[:,0], pairs[:,1]
+
+def containments_from_to( polygons, contain, contained, points, engine="shapely" ):
+    """
+    The polygons in contained that every polygon in contain has inside, each one
+    only in one of them. The "prepared" engine finds them with contained_pairs.
+    """
+    if engine == "prepared":
+        points = np.asarray( points )
+        shape, shell = contained_pairs( [ Polygon( points[polygons[n]] ) for n in contain ], [ Polygon( points[polygons[n]] ) for n in contained ] )
+        order = np.lexsort( ( shell, shape ) )
+        shape, first = np.unique( shape[order], return_index=True )
+        containments = [ [] for p in contain ]
+        for i, j in zip( shape.tolist(), shell[order][first].tolist() ):
+            containments[j].append(i)
+        return containments
+    elif engine != "shapely":
+        raise ValueError("Unknown engine %s." % engine)
+    
     shcontain = []
     tree = rtree.index.Index()
     for i, n in enumerate(contain):
@@ -323,11 +699,25 @@ def containments_from_to( polygons, contain, contained, points ):
                 break
     return containments
 
-def containments_all( polygons, to_search, points ):
+def containments_all( polygons, to_search, points, engine="shapely" ):
     """
     Given a set of polygons with points, it finds which polygons have which holes, and substracts
-    them from them, to return holed polygons.
+    them from them, to return holed polygons. The "prepared" engine finds them with
+    contained_pairs.
     """
+    if engine == "prepared":
+        points = np.asarray( points )
+        shapes = [ Polygon( points[polygons[i]] ) for i in to_search ]
+        # Only the polygons before, larger, can contain a polygon.
+        shape, shell = contained_pairs( shapes, shapes, earlier=True )
+        order = np.lexsort( ( shape, shell ) )
+        containments = [ [] for p in to_search ]
+        for i, j in zip( shape[order].tolist(), shell[order].tolist() ):
+            containments[j].append(i)
+        return containments
+    elif engine != "shapely":
+        raise ValueError("Unknown engine %s." % engine)
+    
     shpolygons = []
     tree = rtree.index.Index()
     for i in to_search:
@@ -350,7 +740,55 @@ def containments_all( polygons, to_search, points ):
     
     return containments
 
-def topology_relations( polygons, graph_conn, graph_dual, points ):
+def hole_containers( rings, pos_polygons, neg_polygons, parent, points ):
+    """
+    The positive polygon that has every negative polygon as a hole, or -1 if it's
+    in none, for the rings of the polygons, open, in compressed rows, as ( offsets,
+    indices ). A ray goes up from the top point of every negative polygon to the
+    lowest segment of the positive polygons over it, see lowest_segments. The
+    segments of its own polygons are never over it. The negative polygon is in
+    the polygon below that segment, or, if the segment has nothing below it, in
+    the same polygon as the negative polygon around the segment.
+    """
+    points = np.asarray( points, dtype=np.float64 ).reshape((-1, 2))
+    containers = np.full( len(neg_polygons), -1, dtype=np.int64 )
+    if not len(neg_polygons) or not len(pos_polygons):
+        return containers
+    
+    offsets, indices = take_rows( rings[0], rings[1], pos_polygons )
+    segments, below, above = ring_segments( offsets, indices, pos_polygons, points )
+    a = points[segments[:,0]]
+    b = points[segments[:,1]]
+    
+    # The top point of every negative polygon.
+    offsets, indices = take_rows( rings[0], rings[1], neg_polygons )
+    ring = np.repeat( np.arange( len(neg_polygons) ), np.diff( offsets ) )
+    order = np.lexsort( ( points[indices,1], ring ) )
+    top = points[indices[order[offsets[1:]-1]]]
+    lowest = lowest_segments( a, b, segment_buckets( a, b ), top, strict=True )
+    
+    hit = lowest >= 0
+    containers[hit] = below[lowest[hit]]
+    
+    # The rest take the polygon of the negative polygon around the segment, its
+    # top is higher, so the jumps end.
+    parent = np.asarray( parent, dtype=np.int64 )
+    around = np.arange( len(neg_polygons) )
+    pending = np.nonzero( hit & ( containers < 0 ) )[0]
+    around[pending] = parent[above[lowest[pending]]]
+    done = np.ones( len(neg_polygons), dtype=bool )
+    done[pending] = False
+    for i in range( int(len(neg_polygons)).bit_length() + 1 ):
+        if not len(pending):
+            break
+        ready = done[around[pending]]
+        containers[pending[ready]] = containers[around[pending[ready]]]
+        done[pending[ready]] = True
+        pending = pending[~ready]
+        around[pending] = around[around[pending]]
+    return containers
+
+def topology_relations( polygons, graph_conn, graph_dual, points, engine="shapely" ):
     """
     From the polygons, and its connnectivity, it creates a set of
     polygons with holes, with areas, and with a graph of connectivity.
@@ -362,6 +800,10 @@ def topology_relations( polygons, graph_conn, graph_dual, points ):
         The polygon to edge connectivity.
     graph_dual:
         Edge to polygon connectivity.
+    engine: str
+        "shapely" finds the holes of the polygons with shapely contains, "prepared"
+        with shapely too, but bulk loaded, see contained_pairs, and "rays" with a
+        ray from every hole, see hole_containers.
     Results ( tuple )
     -----------------
     polygons:
@@ -389,11 +831,14 @@ def topology_relations( polygons, graph_conn, graph_dual, points ):
     neg_polygons = []
     
     areas = []
+    sizes = np.fromiter( ( len(p)-1 for p in polygons ), dtype=np.int64, count=len(polygons) )
+    indices = np.fromiter( ( i for p in polygons for i in p[:-1] ), dtype=np.int64, count=int(sizes.sum()) )
+    rings = ( np.concatenate( ( [0], np.cumsum( sizes ) ) ), indices )
+    signed = ring_measures( rings[0], rings[1], points )[0].tolist()
     # Polygons with positive are what remains,
     # Polygons with negative area are either 
     # the whole covering or the polygon holes.
-    for i, polygon in enumerate(polygons):
-        area = signed_polygon_area( polygon, points )
+    for i, area in enumerate(signed):
         if area >= 0.0:
             pos_polygons.append(i)
             areas.append(area)
@@ -422,34 +867,185 @@ def topology_relations( polygons, graph_conn, graph_dual, points ):
                 seeds.append(p)
     
     # Add the holes to its respective polygon.
-    cover_contains = containments_all( polygons, neg_polygons, points )    
+    if engine == "rays":
+        containers = hole_containers( rings, pos_polygons, neg_polygons, parent, points )
+        held = [ [] for i in neg_polygons ]
+        for hole, outpol in enumerate(containers):
+            if outpol >= 0:
+                held[parent[outpol]].append( ( outpol, hole ) )
+    elif engine in ( "shapely", "prepared" ):
+        cover_contains = containments_all( polygons, neg_polygons, points, engine=engine )
+    else:
+        raise ValueError("Unknown engine %s." % engine)
     holed_polygons = [[polygon] for polygon in polygons]
     
-    for ri, contain in enumerate(reversed(cover_contains)):
-        i = len(cover_contains)-(1+ri)
-        inside = coverings[i][1:]
-        spec_conts = containments_from_to( polygons, inside, [ neg_polygons[x] for x in contain ], points )
-        for j, conts in enumerate(spec_conts):
-            outpol = inside[j]
-            for hole in conts:
-        
-                # Organize graph.
-                inpol = neg_polygons[contain[hole]]
-                parent[inpol] = i
-                for k in graph[inpol]:
-                    parent[k] = i
-                    if graph[k] == inpol:
-                        graph[k] = outpol
-                graph[outpol] += graph[inpol]
-                graph[inpol] = []
-                # assert polygons[inpol] is not None
-                holed_polygons[outpol].append(polygons[inpol])
-                holed_polygons[inpol] = None
+    # The coverings are visited from the smallest, so a hole is taken by
+    # the innermost covering that contains it and skipped by the rest.
+    assigned = set()
+    for i in reversed(range(len(neg_polygons))):
+        if engine == "rays":
+            holes = held[i]
+        else:
+            inside = coverings[i][1:]
+            contain = [ x for x in cover_contains[i] if not x in assigned ]
+            spec_conts = containments_from_to( polygons, inside, [ neg_polygons[x] for x in contain ], points, engine=engine )
+            holes = [ ( inside[j], contain[hole] ) for j, conts in enumerate(spec_conts) for hole in conts ]
+        for outpol, hole in holes:
+            
+            # Organize graph.
+            assigned.add(hole)
+            inpol = neg_polygons[hole]
+            parent[inpol] = i
+            for k in graph[inpol]:
+                parent[k] = i
+                graph[k] = [ outpol if g == inpol else g for g in graph[k] ]
+            graph[outpol] += graph[inpol]
+            graph[inpol] = []
+            # assert polygons[inpol] is not None
+            holed_polygons[outpol].append(polygons[inpol])
+            holed_polygons[inpol] = None
     
     
     return ( holed_polygons, areas, graph, parent, neg_polygons ) 
     
-def reduce_everything( holed, areas, graph, parent, all_parents, points ):
+def reduce_arrays( holed, areas, graph, parent, all_parents, points, rows=False ):
+    """
+    reduce_everything with arrays. The parents left are found with np.unique, the
+    points left and the graph with masks, and the rings take their new points in
+    one gather over all their points. Returns the same, but with the points
+    as an (n, 2) array. With rows, the polygons are left in compressed rows, as
+    polygon_arrays returns them for closed rings, and the graph too, as graph_arrays
+    returns it.
+    """
+    n = len(holed)
+    areas = np.asarray( areas, dtype=np.float64 )
+    all_parents = np.asarray( all_parents, dtype=np.int64 )
+    used, parent = np.unique( np.asarray( parent, dtype=np.int64 ), return_inverse=True )
+    parent_info = areas[all_parents[used]]
+    keep = np.ones( n, dtype=bool )
+    keep[all_parents] = False
+    live = np.nonzero( keep )[0]
+    trans = np.cumsum( keep ) - 1
+    
+    # The graph without the negative polygons, each neighbour once.
+    sizes = np.fromiter( ( len(g) for g in graph ), dtype=np.int64, count=n )
+    nbr = np.fromiter( ( j for g in graph for j in g ), dtype=np.int64, count=int(sizes.sum()) )
+    owner = np.repeat( np.arange( n ), sizes )
+    ok = keep[owner] & keep[nbr]
+    m = np.int64( max( len(live), 1 ) )
+    keys = np.sort( trans[owner[ok]]*m + trans[nbr[ok]] )
+    owner, nbr = np.divmod( keys[np.concatenate( ( [True], keys[1:] != keys[:-1] ) )[:len(keys)]], m )
+    cut = np.concatenate( ( [0], np.cumsum( np.bincount( owner, minlength=len(live) ) ) ) )
+    if rows:
+        graph = ( cut.astype(np.int64), nbr.astype(np.int32) )
+    else:
+        nbr = nbr.tolist()
+        cut = cut.tolist()
+        graph = [ nbr[cut[i]:cut[i+1]] for i in range(len(live)) ]
+    
+    # The points left, in order, and the rings with them.
+    holed = [ holed[i] for i in live ]
+    nrings = np.fromiter( ( len(p) for p in holed ), dtype=np.int64, count=len(holed) )
+    rings = [ r for p in holed for r in p ]
+    sizes = np.fromiter( ( len(r) for r in rings ), dtype=np.int64, count=len(rings) )
+    flat = np.fromiter( ( i for r in rings for i in r ), dtype=np.int64, count=int(sizes.sum()) )
+    if rows:
+        # The rings are closed, the last point is the first one.
+        flat = np.delete( flat, np.cumsum( sizes ) - 1 )
+        sizes = sizes - 1
+    points = np.asarray( points, dtype=np.float64 ).reshape((-1, 2))
+    used = np.zeros( len(points), dtype=bool )
+    used[flat] = True
+    flat = ( np.cumsum( used ) - 1 )[flat]
+    points = points[used]
+    if rows:
+        holed = ( np.concatenate( ( [0], np.cumsum( nrings ) ) ), np.concatenate( ( [0], np.cumsum( sizes ) ) ), flat.astype(np.int32) )
+    else:
+        flat = flat.tolist()
+        cut = np.concatenate( ( [0], np.cumsum( sizes ) ) ).tolist()
+        rings = [ flat[cut[i]:cut[i+1]] for i in range(len(rings)) ]
+        cut = np.concatenate( ( [0], np.cumsum( nrings ) ) ).tolist()
+        holed = [ rings[cut[i]:cut[i+1]] for i in range(len(holed)) ]
+    return ( holed, areas[live].tolist(), graph, parent[live].tolist(), parent_info.tolist(), points )
+
+def holed_arrays( offsets, indices, points ):
+    """
+    The polygons with holes, the graph and the points of obtain_polygons with output
+    "arrays", from the lines of line_arrays, all in arrays. The loops are split in
+    two, as in tie_polygons, the faces are found with halfedge_rings and their holes
+    with hole_containers. The negative faces are taken out, as in reduce_arrays, the
+    holes go after the outer ring of their polygon, the largest first, and every
+    negative face is replaced in the graph by the polygon it's a hole of.
+    """
+    points = np.asarray( points, dtype=np.float64 ).reshape((-1, 2))
+    offsets = np.asarray( offsets, dtype=np.int64 )
+    indices = np.asarray( indices, dtype=np.int64 )
+    
+    # The second half of every loop goes after the lines.
+    sizes = np.diff( offsets )
+    loop = np.nonzero( indices[offsets[:-1]] == indices[offsets[1:]-1] )[0]
+    half = sizes[loop]//2
+    sizes[loop] = half + 1
+    starts = np.concatenate( ( offsets[:-1], offsets[loop] + half ) )
+    sizes = np.concatenate( ( sizes, np.diff( offsets )[loop] - half ) )
+    offsets = np.concatenate( ( [0], np.cumsum( sizes ) ) )
+    indices = indices[np.repeat( starts - offsets[:-1], sizes ) + np.arange( offsets[-1] )]
+    
+    ring_offsets, rings, foffsets, line, across = halfedge_rings( offsets, indices, points )
+    nf = len(ring_offsets) - 1
+    if not nf:
+        empty = np.zeros( 1, dtype=np.int64 )
+        return ( empty, empty, np.zeros( 0, dtype=np.int32 ) ), ( empty, np.zeros( 0, dtype=np.int32 ) ), points[:0]
+    face = np.repeat( np.arange( nf ), np.diff( foffsets ) )
+    pairs = np.column_stack( ( face, across ) )[face != across]
+    signed = ring_measures( ring_offsets, rings, points )[0]
+    positive = signed >= 0.0
+    pos = np.nonzero( positive )[0]
+    neg = np.nonzero( ~positive )[0]
+    neg = neg[np.argsort( signed[neg], kind='mergesort' )]
+    
+    # Every face has as parent the largest negative face of its component.
+    ncomponents, component = connected_components( coo_matrix( ( np.ones( len(pairs), dtype=np.int8 ), ( pairs[:,0], pairs[:,1] ) ), shape=( nf, nf ) ), directed=False )
+    first = np.full( ncomponents, len(neg), dtype=np.int64 )
+    np.minimum.at( first, component[neg], np.arange( len(neg) ) )
+    parent = np.where( first < len(neg), first, -1 )[component]
+    container = hole_containers( ( ring_offsets, rings ), pos, neg, parent, points )
+    
+    # The graph, with the negative faces replaced by their containers, both half
+    # edges of a line give it in both directions.
+    npolygons = len(pos)
+    rank = np.cumsum( positive ) - 1
+    target = np.where( positive, rank, -1 )
+    target[neg] = np.where( container >= 0, rank[np.maximum( container, 0 )], -1 )
+    pairs = target[pairs].reshape((-1, 2))
+    pairs = pairs[( pairs[:,0] >= 0 ) & ( pairs[:,1] >= 0 ) & ( pairs[:,0] != pairs[:,1] )]
+    m = np.int64( max( npolygons, 1 ) )
+    keys = np.sort( pairs[:,0]*m + pairs[:,1] )
+    owner, nbr = np.divmod( keys[np.concatenate( ( [True], keys[1:] != keys[:-1] ) )[:len(keys)]], m )
+    graph = ( np.concatenate( ( [0], np.cumsum( np.bincount( owner, minlength=npolygons ) ) ) ).astype(np.int64), nbr.astype(np.int32) )
+    
+    # The rings of every polygon, the outer one first, and the points they use.
+    held = np.nonzero( container >= 0 )[0]
+    ring_face = np.concatenate( ( pos, neg[held] ) )
+    ring_polygon = np.concatenate( ( np.arange( npolygons ), rank[container[held]] ) )
+    order = np.lexsort( ( np.concatenate( ( np.full( npolygons, -1 ), held ) ), ring_polygon ) )
+    ring_offsets, rings = take_rows( ring_offsets, rings, ring_face[order] )
+    polygon_offsets = np.concatenate( ( [0], np.cumsum( np.bincount( ring_polygon, minlength=npolygons ) ) ) ).astype(np.int64)
+    used = np.zeros( len(points), dtype=bool )
+    used[rings] = True
+    rings = ( np.cumsum( used ) - 1 )[rings]
+    return ( polygon_offsets, ring_offsets, rings.astype(np.int32) ), graph, points[used]
+
+def reduce_everything( holed, areas, graph, parent, all_parents, points, engine="lists" ):
+    """
+    Takes the negative polygons out, and the points that no polygon uses, and
+    numbers again the polygons, the graph, the parents and the points. The "arrays"
+    engine does it with arrays, see reduce_arrays.
+    """
+    if engine == "arrays":
+        return reduce_arrays( holed, areas, graph, parent, all_parents, points )
+    elif engine != "lists":
+        raise ValueError("Unknown engine %s." % engine)
     len_start = len(holed)
     len_parents = len(all_parents)
     rem_parents = sorted(list(set(parent))) # Fuck the police.
@@ -512,18 +1108,691 @@ def reduce_everything( holed, areas, graph, parent, all_parents, points ):
     # assert (len(holed) + len_parents) == len_start
     return ( holed, areas, graph, parent, parent_info, [points[i] for i in rem_points] )
 
-def obtain_polygons( edges, points ):
+def polygon_arrays( polygons, closed=False ):
+    """
+    The polygons with holes in compressed rows. Returns ( polygon_offsets,
+    ring_offsets, indices ), where polygon i has the rings from polygon_offsets[i]
+    to polygon_offsets[i+1], the outer ring first, and ring j is
+    indices[ring_offsets[j]:ring_offsets[j+1]]. If the rings are closed,
+    repeating their first point at the end, the last point is left out.
+    """
+    nrings = [ len(p) for p in polygons ]
+    sizes = np.fromiter( ( len(r) for p in polygons for r in p ), dtype=np.int64, count=sum(nrings) )
+    indices = np.fromiter( ( i for p in polygons for r in p for i in r ), dtype=np.int32, count=int(sizes.sum()) )
+    if closed:
+        ends = np.cumsum( sizes ) - 1
+        indices = np.delete( indices, ends )
+        sizes = sizes - 1
+    polygon_offsets = np.concatenate( ( [0], np.cumsum( nrings, dtype=np.int64 ) ) )
+    ring_offsets = np.concatenate( ( [0], np.cumsum( sizes ) ) )
+    return polygon_offsets, ring_offsets, indices
+
+def graph_arrays( graph ):
+    """
+    The graph of neighbour polygons in compressed rows, as ( offsets, indices ),
+    where the neighbours of polygon i are indices[offsets[i]:offsets[i+1]].
+    """
+    sizes = [ len(g) for g in graph ]
+    indices = np.fromiter( ( j for g in graph for j in g ), dtype=np.int32, count=sum(sizes) )
+    return np.concatenate( ( [0], np.cumsum( sizes, dtype=np.int64 ) ) ), indices
+
+def matrix_edges( matrix ):
+    """
+    The edges of a graph given as a sparse adjacency matrix, as sorted ( i, j )
+    tuples, with i < j. Every pair stored in the matrix, in any direction, is an edge.
+    """
+    coo = matrix.tocoo()
+    n = np.int64( max( matrix.shape ) )
+    a = np.minimum( coo.row, coo.col ).astype(np.int64)
+    b = np.maximum( coo.row, coo.col ).astype(np.int64)
+    keys = np.unique( ( a*n + b )[a != b] )
+    return list(map( tuple, np.column_stack( np.divmod( keys, n ) ).tolist() ))
+
+def obtain_polygons( edges, points, output="lists", measures=False, engine=None, holes="rays" ):
     """
     Given a graph in 2D space, with their points attached,
     it obtains a set of polygons in the given graph.
     It also discards the edges that don't suround anything.
+    The graph can be a sparse adjacency matrix too, see matrix_edges.
+    The engine "dict" splits the graph in lines and ties them in polygons with
+    dicts and sets, and "arrays" with arrays, see line_arrays and tie_halfedges.
+    By default, the edges given as an (m, 2) array, or any edges with output
+    "arrays", take "arrays", and the rest "dict". The holes are found with the
+    engine holes of topology_relations, "rays", "shapely" or "prepared". With the
+    engine "arrays", output "arrays" and holes "rays", no list is made for the
+    lines or the polygons, see holed_arrays.
+    With output "arrays", the polygons are returned in compressed rows, see
+    polygon_arrays, the graph too, see graph_arrays, and the points as an
+    (n, 2) array. With output "subdivision", they are returned as a Subdivision, to
+    locate points in them. With measures, the areas, bounds, perimeters and
+    centroids of the polygons are returned last, see polygon_measures, or kept in
+    the Subdivision. For graphs larger than memory, see obtain_polygons_tiled.
     """
+    if not output in ( "lists", "arrays", "subdivision" ):
+        raise ValueError("Unknown output %s." % output)
+    if engine is None:
+        engine = "arrays" if isinstance( edges, np.ndarray ) or output == "arrays" else "dict"
+    if not engine in ( "dict", "arrays" ):
+        raise ValueError("Unknown engine %s." % engine)
+    if not holes in ( "rays", "shapely", "prepared" ):
+        raise ValueError("Unknown engine %s." % holes)
+    if issparse( edges ):
+        edges = matrix_edges( edges )
     if type(points) != np.array:
         points = np.array(points)
-    lines = separate_lines( edges )
-    polygons, conn, dual = tie_polygons( lines, points )
-    holed, areas, graph, parent, all_parents = topology_relations( polygons, conn, dual, points )
+    if engine == "arrays":
+        offsets, indices = separate_lines( np.asarray( edges if isinstance( edges, np.ndarray ) else list(edges), dtype=np.int64 ).reshape((-1, 2)), engine="arrays" )
+        if output == "arrays" and holes == "rays":
+            arrays, graph, points = holed_arrays( offsets, indices, points )
+            if measures:
+                return ( arrays, graph, points, polygon_measures( arrays[0], arrays[1], arrays[2], points ) )
+            return ( arrays, graph, points )
+        offsets = offsets.tolist()
+        indices = indices.tolist()
+        lines = [ indices[offsets[i]:offsets[i+1]] for i in range(len(offsets)-1) ]
+    else:
+        lines = separate_lines( edges )
+    polygons, conn, dual = tie_polygons( lines, points, engine="halfedge" if engine == "arrays" else "dict" )
+    holed, areas, graph, parent, all_parents = topology_relations( polygons, conn, dual, points, engine=holes )
+    if output == "arrays":
+        arrays, areas, graph, parent, parent_info, points = reduce_arrays( holed, areas, graph, parent, all_parents, points, rows=True )
+        if measures:
+            return ( arrays, graph, points, polygon_measures( arrays[0], arrays[1], arrays[2], points ) )
+        return ( arrays, graph, points )
     holed, areas, graph, parent, parent_info, points = reduce_everything( holed, areas, graph, parent, all_parents, points )
     holed = list(map( lambda p: list(map( lambda r: r[:-1], p )), holed ))
+    if output == "subdivision":
+        subdivision = Subdivision( holed, graph, points )
+        if measures:
+            subdivision.measures
+        return subdivision
+    if measures:
+        return ( holed, graph, list(map( tuple, points )), polygon_measures( *( polygon_arrays( holed ) + ( points, ) ) ) )
     return ( holed, graph, list(map( tuple, points )) )
 
+
+def ring_segments( ring_offsets, indices, owner, points ):
+    """
+    The segments of a set of rings, in compressed rows with the polygon that owns
+    every ring, kept once each, as an (m, 2) array of sorted and unique points, with
+    the polygon below every segment, the owner of the ring where it goes from right
+    to left, or -1, and the polygon above it, the owner of the ring where it goes
+    from left to right, or -1. The outer rings go counterclockwise and the holes
+    clockwise, so their polygon is always at their left.
+    """
+    a = np.asarray( indices, dtype=np.int64 )
+    sizes = np.diff( ring_offsets )
+    polygon = np.repeat( np.asarray( owner, dtype=np.int64 ), sizes )
+    nxt = np.arange( len(a) ) + 1
+    nxt[ring_offsets[1:][sizes > 0]-1] = ring_offsets[:-1][sizes > 0]
+    b = a[nxt]
+    
+    left = points[b,0] < points[a,0]
+    n = np.int64( len(points) )
+    keys = np.minimum( a, b )*n + np.maximum( a, b )
+    keys, inv = np.unique( keys[a != b], return_inverse=True )
+    inv = inv.ravel()
+    below = np.full( len(keys), -1, dtype=np.int64 )
+    np.maximum.at( below, inv, np.where( left, polygon, -1 )[a != b] )
+    above = np.full( len(keys), -1, dtype=np.int64 )
+    np.maximum.at( above, inv, np.where( left, -1, polygon )[a != b] )
+    return np.column_stack( np.divmod( keys, n ) ), below, above
+
+def segment_buckets( a, b ):
+    """
+    A grid of buckets of the segments from a to b, as ( origin, size, shape, offsets,
+    order, up ). Every segment is in the cells of its bounds, offsets and order are
+    the segments in every cell in compressed rows, and up is the first cell with
+    segments over every cell, in its column, or the number of rows.
+    """
+    lo = np.minimum( a, b )
+    hi = np.maximum( a, b )
+    origin = lo.min( axis=0 ) if len(lo) else np.zeros(2)
+    extent = np.maximum( hi.max( axis=0 ) - origin if len(hi) else np.zeros(2), 1e-12 )
+    cells = max( len(a), 1 )
+    size = max( math.sqrt( extent[0]*extent[1]/cells ), extent.max()/cells )
+    shape = np.minimum( np.ceil( extent/size ).astype(np.int64), cells ) + 1
+    first = np.minimum( ( ( lo - origin )/size ).astype(np.int64), shape - 1 )
+    last = np.minimum( ( ( hi - origin )/size ).astype(np.int64), shape - 1 )
+    
+    # Every segment in every cell of its bounds.
+    span = last - first + 1
+    count = span[:,0]*span[:,1]
+    segment = np.repeat( np.arange( len(a) ), count )
+    step = np.arange( count.sum() ) - np.repeat( np.cumsum( count ) - count, count )
+    cx = first[segment,0] + step % span[segment,0]
+    cy = first[segment,1] + step // span[segment,0]
+    cell = cy*shape[0] + cx
+    order = segment[np.argsort( cell, kind='mergesort' )]
+    offsets = np.concatenate( ( [0], np.cumsum( np.bincount( cell, minlength=shape[0]*shape[1] ) ) ) )
+    
+    full = ( np.diff( offsets ) > 0 ).reshape( ( shape[1], shape[0] ) )
+    rows = np.where( full, np.arange( shape[1] )[:,None], shape[1] )
+    up = np.minimum.accumulate( rows[::-1], axis=0 )[::-1]
+    return ( origin, size, shape, offsets, order, up )
+
+def lowest_segments( a, b, buckets, points, strict=False, chunk=1<<18 ):
+    """
+    The lowest of the segments from a to b over every point, or -1, going up through
+    the cells of segment_buckets until one is over it. Every segment covers the x from
+    its left end, and not its right end. With strict, the segments through the
+    point are not over it.
+    """
+    points = np.asarray( points, dtype=np.float64 ).reshape((-1, 2))
+    lowest = np.full( len(points), -1, dtype=np.int64 )
+    if not len(a):
+        return lowest
+    origin, size, shape, offsets, order, up = buckets
+    for start in range( 0, len(points), chunk ):
+        query = points[start:start+chunk]
+        cx = np.floor( ( query[:,0] - origin[0] )/size ).astype(np.int64)
+        cy = np.clip( np.floor( ( query[:,1] - origin[1] )/size ), 0, shape[1] ).astype(np.int64)
+        active = np.nonzero( ( cx >= 0 ) & ( cx < shape[0] ) & ( cy < shape[1] ) )[0]
+        row = up[cy[active], cx[active]]
+        
+        while len(active):
+            going = row < shape[1]
+            active = active[going]
+            row = row[going]
+            if not len(active):
+                break
+            cell = row*shape[0] + cx[active]
+            count = offsets[cell+1] - offsets[cell]
+            pair = np.repeat( np.arange( len(active) ), count )
+            seg = order[np.repeat( offsets[cell], count ) + np.arange( count.sum() ) - np.repeat( np.cumsum( count ) - count, count )]
+            q = query[active[pair]]
+            pa, pb = a[seg], b[seg]
+            crosses = ( np.minimum( pa[:,0], pb[:,0] ) <= q[:,0] ) & ( q[:,0] < np.maximum( pa[:,0], pb[:,0] ) )
+            t = np.where( crosses, ( q[:,0] - pa[:,0] )/np.where( crosses, pb[:,0] - pa[:,0], 1.0 ), 0.0 )
+            y = pa[:,1] + t*( pb[:,1] - pa[:,1] )
+            top = origin[1] + ( row[pair] + 1 )*size
+            over = ( y > q[:,1] ) if strict else ( y >= q[:,1] )
+            over = np.nonzero( crosses & over & ( ( y <= top ) | ( row[pair] == shape[1] - 1 ) ) )[0]
+            over = over[np.lexsort( ( y[over], pair[over] ) )]
+            found, firsts = np.unique( pair[over], return_index=True )
+            lowest[start + active[found]] = seg[over[firsts]]
+            
+            # The rest go on to the next cell with segments over this one.
+            rest = np.ones( len(active), dtype=bool )
+            rest[found] = False
+            active = active[rest]
+            nxt = np.minimum( row[rest] + 1, shape[1] - 1 )
+            row = np.where( row[rest] + 1 < shape[1], up[nxt, cx[active]], shape[1] )
+    return lowest
+
+class Subdivision( object ):
+    """
+    The polygons of a planar subdivision, as obtain_polygons returns them, with their
+    points and their graph of neighbours, kept to locate points in them. The segments
+    of the rings, see ring_segments, are put in a grid of buckets the first time
+    points are located, and a point is in the polygon below the first segment over it.
+    """
+    def __init__( self, polygons, graph, points ):
+        self.polygons = polygons
+        self.graph = graph
+        self.points = np.array( points, dtype=np.float64 ).reshape((-1, 2))
+        self._segments = None
+        self._below = None
+        self._buckets = None
+        self._measures = None
+    
+    @property
+    def measures( self ):
+        """
+        The areas, bounds, perimeters and centroids of the polygons, see polygon_measures.
+        """
+        if self._measures is None:
+            self._measures = polygon_measures( *( polygon_arrays( self.polygons ) + ( self.points, ) ) )
+        return self._measures
+    
+    @property
+    def segments( self ):
+        """
+        The segments of the rings, as an (m, 2) array of sorted and unique points.
+        """
+        if self._segments is None:
+            polygon_offsets, ring_offsets, indices = polygon_arrays( self.polygons )
+            owner = np.repeat( np.arange( len(self.polygons) ), np.diff( polygon_offsets ) )
+            self._segments, self._below, above = ring_segments( ring_offsets, indices, owner, self.points )
+        return self._segments
+    
+    @property
+    def below( self ):
+        """
+        The polygon below every segment, -1 if there's none.
+        """
+        self.segments
+        return self._below
+    
+    @property
+    def buckets( self ):
+        """
+        The grid of buckets of the segments, see segment_buckets.
+        """
+        if self._buckets is None:
+            segments = self.segments
+            self._buckets = segment_buckets( self.points[segments[:,0]], self.points[segments[:,1]] )
+        return self._buckets
+    
+    def locate( self, points, chunk=1<<18 ):
+        """
+        The polygon that contains every point, -1 for the points outside all of them.
+        The points over a segment can be in any of the polygons at its sides.
+        """
+        segments = self.segments
+        lowest = lowest_segments( self.points[segments[:,0]], self.points[segments[:,1]], self.buckets, points, chunk=chunk )
+        return np.append( self.below, -1 )[lowest]
+
+def edge_chunks( edges, chunk=1<<22 ):
+    """
+    The edges in (k, 2) arrays of at most chunk edges. The edges can be an (m, 2)
+    array, a np.memmap, the name of a .npy file, that is memory mapped, or an
+    iterator of (k, 2) arrays, that are given as they come.
+    """
+    if isinstance( edges, str ):
+        edges = np.load( edges, mmap_mode='r' )
+    if hasattr( edges, "shape" ):
+        for start in range( 0, len(edges), chunk ):
+            yield np.asarray( edges[start:start+chunk], dtype=np.int64 ).reshape((-1, 2))
+    else:
+        for e in edges:
+            yield np.asarray( e, dtype=np.int64 ).reshape((-1, 2))
+
+def point_tiles( points, tile, chunk, work ):
+    """
+    The tile of every point, in a square grid of tiles over the bounds of the points,
+    with about tile points in every tile, memory mapped in work. Returns the tiles and
+    how many there are.
+    """
+    n = len(points)
+    lo = np.full( 2, np.inf )
+    hi = np.full( 2, -np.inf )
+    for start in range( 0, n, chunk ):
+        p = np.asarray( points[start:start+chunk], dtype=np.float64 )
+        lo = np.minimum( lo, p.min( axis=0 ) )
+        hi = np.maximum( hi, p.max( axis=0 ) )
+    side = max( int( math.ceil( math.sqrt( n/float(tile) ) ) ), 1 )
+    size = np.maximum( ( hi - lo )/side, 1e-12 )
+    part = np.lib.format.open_memmap( os.path.join( work, "part.npy" ), mode='w+', dtype=np.int32, shape=(n,) )
+    for start in range( 0, n, chunk ):
+        p = np.asarray( points[start:start+chunk], dtype=np.float64 )
+        cell = np.clip( np.floor( ( p - lo )/size ), 0, side - 1 ).astype(np.int64)
+        part[start:start+chunk] = cell[:,1]*side + cell[:,0]
+    return part, side*side
+
+def spill_edges( edges, part, n, work, chunk ):
+    """
+    Writes every edge, as the key lo*n + hi with lo < hi, to the file of the tile of
+    each of its points in work, so every tile has all the edges of its points. The
+    loops of one point are left out.
+    """
+    n = np.int64( n )
+    for e in edge_chunks( edges, chunk ):
+        e = e[e[:,0] != e[:,1]]
+        lo = np.minimum( e[:,0], e[:,1] )
+        hi = np.maximum( e[:,0], e[:,1] )
+        keys = lo*n + hi
+        tl = np.asarray( part[lo] )
+        th = np.asarray( part[hi] )
+        tiles = np.concatenate( ( tl, th[th != tl] ) )
+        keys = np.concatenate( ( keys, keys[th != tl] ) )
+        order = np.argsort( tiles, kind='mergesort' )
+        tiles = tiles[order]
+        keys = keys[order]
+        bounds = np.nonzero( np.diff( tiles ) )[0] + 1
+        for start, end in zip( np.append( 0, bounds ), np.append( bounds, len(tiles) ) ):
+            with open( os.path.join( work, "edges_%d.bin" % tiles[start] ), "ab" ) as f:
+                keys[start:end].tofile( f )
+
+def tile_degrees( t, work, n, part, degree ):
+    """
+    Removes the repeated edges of tile t, saving its keys sorted, and counts the
+    edges of the points of the tile.
+    """
+    spilled = os.path.join( work, "edges_%d.bin" % t )
+    if os.path.exists( spilled ):
+        keys = np.unique( np.fromfile( spilled, dtype=np.int64 ) )
+        os.remove( spilled )
+    else:
+        keys = np.zeros( 0, dtype=np.int64 )
+    np.save( os.path.join( work, "edges_%d.npy" % t ), keys )
+    lo, hi = np.divmod( keys, np.int64( n ) )
+    ends = np.concatenate( ( lo[np.asarray( part[lo] ) == t], hi[np.asarray( part[hi] ) == t] ) )
+    points, counts = np.unique( ends, return_counts=True )
+    degree[points] = counts
+
+def peel_tile( t, work, n, part, degree, alive ):
+    """
+    Removes the points of tile t that don't surround anything, the points with one
+    edge, in rounds, until there are none. The degrees and the points still alive
+    are shared by all tiles. Returns the other tiles that got points with one edge.
+    """
+    keys = np.load( os.path.join( work, "edges_%d.npy" % t ) )
+    lo, hi = np.divmod( keys, np.int64( n ) )
+    src = np.concatenate( ( lo, hi ) )
+    dst = np.concatenate( ( hi, lo ) )
+    own = np.asarray( part[src] ) == t
+    order = np.argsort( src[own], kind='mergesort' )
+    src = src[own][order]
+    dst = dst[own][order]
+    leaves = np.unique( src )
+    leaves = leaves[np.asarray( degree[leaves] ) == 1]
+    touched = set()
+    while len(leaves):
+        start = np.searchsorted( src, leaves, 'left' )
+        count = np.searchsorted( src, leaves, 'right' ) - start
+        near = dst[np.repeat( start, count ) + np.arange( count.sum() ) - np.repeat( np.cumsum( count ) - count, count )]
+        near = near[np.asarray( alive[near] )]
+        alive[leaves] = False
+        np.subtract.at( degree, near, 1 )
+        degree[leaves] = 0
+        near = np.unique( near )
+        alive[near[np.asarray( degree[near] ) <= 0]] = False
+        near = near[( np.asarray( degree[near] ) == 1 ) & np.asarray( alive[near] )]
+        mine = np.asarray( part[near] ) == t
+        touched.update( np.unique( part[near[~mine]] ).tolist() )
+        leaves = near[mine]
+    return touched
+
+def group_sums( values, offsets ):
+    """
+    The sums of values from offsets[i] to offsets[i+1], for offsets without empty groups.
+    """
+    if len(offsets) < 2:
+        return np.zeros( 0, dtype=values.dtype )
+    return np.add.reduceat( values, offsets[:-1] )
+
+def group_tops( y, offsets ):
+    """
+    Where y is highest from offsets[i] to offsets[i+1], for offsets without empty groups.
+    """
+    group = np.repeat( np.arange( len(offsets) - 1 ), np.diff( offsets ) )
+    return np.lexsort( ( y, group ) )[offsets[1:] - 1]
+
+def trace_tile( t, work, n, part, alive, points ):
+    """
+    Traces the faces of tile t with the half edges that leave its points alive. A half
+    edge from lo to hi, with lo < hi, is 2*key, and 2*key + 1 the other way, and its
+    face is at its left. The next half edge of a face is known where the half edge
+    arrives, so the faces that stay in the tile are closed, and the rest are chains
+    from a half edge that enters the tile to one that leaves it. Saves the half edges,
+    the faces and the chains, with their doubled signed areas and highest points.
+    """
+    keys = np.load( os.path.join( work, "edges_%d.npy" % t ) )
+    lo, hi = np.divmod( keys, np.int64( n ) )
+    live = np.asarray( alive[lo] ) & np.asarray( alive[hi] )
+    keys, lo, hi = keys[live], lo[live], hi[live]
+    own_lo = np.asarray( part[lo] ) == t
+    own_hi = np.asarray( part[hi] ) == t
+    hid = np.concatenate( ( 2*keys[own_lo], 2*keys[own_hi] + 1 ) )
+    src = np.concatenate( ( lo[own_lo], hi[own_hi] ) )
+    dst = np.concatenate( ( hi[own_lo], lo[own_hi] ) )
+    order = np.argsort( hid )
+    hid, src, dst = hid[order], src[order], dst[order]
+    k = len(hid)
+    ps = np.asarray( points[src], dtype=np.float64 ).reshape((-1, 2))
+    pd = np.asarray( points[dst], dtype=np.float64 ).reshape((-1, 2))
+    
+    # The half edge after every one around its point, clockwise, as in tie_halfedges.
+    angle = np.arctan2( pd[:,1] - ps[:,1], pd[:,0] - ps[:,0] )
+    vertex, vloc = np.unique( src, return_inverse=True )
+    vloc = vloc.ravel()
+    out = np.lexsort( ( -angle, vloc ) )
+    degree = np.bincount( vloc, minlength=len(vertex) )
+    first = np.cumsum( degree ) - degree
+    pos = np.empty( k, dtype=np.int64 )
+    pos[out] = np.arange( k ) - first[vloc[out]]
+    after = out[first[vloc] + ( pos + 1 ) % degree[vloc]] if k else np.zeros( 0, dtype=np.int64 )
+    
+    # The next of a half edge comes after its twin, if the twin leaves this tile.
+    twin = np.minimum( np.searchsorted( hid, hid ^ 1 ), max( k - 1, 0 ) )
+    has = hid[twin] == ( hid ^ 1 ) if k else np.zeros( 0, dtype=bool )
+    nxt = np.where( has, after[twin], -1 )
+    crossing = np.nonzero( ~has )[0]
+    entry = np.full( k, -1, dtype=np.int64 )
+    entry[after[crossing]] = hid[crossing] ^ 1
+    
+    last, steps = chain_ends( nxt )
+    chained = nxt[last] < 0
+    members = np.nonzero( chained )[0]
+    chains = members[np.lexsort( ( -steps[members], last[members] ) )]
+    starts = np.nonzero( np.diff( np.append( -1, last[chains] ) ) != 0 )[0]
+    chain_offsets = np.append( starts, len(chains) )
+    
+    cycle = np.nonzero( ~chained )[0]
+    where = np.full( k, -1, dtype=np.int64 )
+    where[cycle] = np.arange( len(cycle) )
+    face_offsets, corder = permutation_cycles( where[nxt[cycle]] )
+    faces = cycle[corder]
+    
+    cross = ps[:,0]*pd[:,1] - ps[:,1]*pd[:,0]
+    chain_top = chains[group_tops( ps[chains,1], chain_offsets )]
+    np.savez( os.path.join( work, "faces_%d.npz" % t ), hid=hid, src=src, crossing=crossing,
+              face_offsets=face_offsets, faces=faces, chain_offsets=chain_offsets, chains=chains,
+              chain_entry=entry[chains[starts]], chain_exit=hid[last[chains[starts]]],
+              face_area=group_sums( cross[faces], face_offsets ), chain_area=group_sums( cross[chains], chain_offsets ),
+              face_top=src[faces[group_tops( ps[faces,1], face_offsets )]],
+              chain_top=src[chain_top], chain_top_y=ps[chain_top,1] )
+
+def obtain_polygons_tiled( edges, points, directory=None, tile=1<<20, chunk=1<<22 ):
+    """
+    Same as obtain_polygons with output "arrays", for graphs larger than memory. The
+    edges can be an (m, 2) array, a np.memmap, the name of a .npy file, or an iterator
+    of (k, 2) arrays, see edge_chunks, and the points an (n, 2) array, a np.memmap or
+    the name of a .npy file. The points are split in tiles of about tile points, and
+    the edges are read chunk at a time and written to the tiles of their points, in a
+    work directory inside directory, that is removed at the end.
+    
+    The edges that don't surround anything are removed tile by tile, and the faces
+    are traced in every tile, see trace_tile. The faces that cross tiles are joined
+    from their chains, and the holes are found shooting rays up, as in
+    hole_containers, tile by tile. The results are written in directory, a new
+    temporary one if it's None, as .npy files, and returned memory mapped as
+    ( ( polygon_offsets, ring_offsets, indices ), ( graph_offsets, graph_indices ),
+    points ). They are the same as obtain_polygons, only the order of the polygons,
+    and where their rings start, can differ.
+    """
+    if isinstance( points, str ):
+        points = np.load( points, mmap_mode='r' )
+    if directory is None:
+        directory = tempfile.mkdtemp()
+    elif not os.path.isdir( directory ):
+        os.makedirs( directory )
+    work = tempfile.mkdtemp( dir=directory )
+    try:
+        build_polygons_tiled( edges, points, directory, work, tile, chunk )
+    finally:
+        shutil.rmtree( work )
+    load = lambda name: np.load( os.path.join( directory, name + ".npy" ), mmap_mode='r' )
+    return ( ( load("polygon_offsets"), load("ring_offsets"), load("indices") ),
+             ( load("graph_offsets"), load("graph_indices") ), load("points") )
+
+def build_polygons_tiled( edges, points, directory, work, tile, chunk ):
+    """
+    Writes the results of obtain_polygons_tiled in directory, using work for the
+    files of the tiles.
+    """
+    n = len(points)
+    index = np.int32 if n < 2**31 else np.int64
+    part, tiles = point_tiles( points, tile, chunk, work )
+    spill_edges( edges, part, n, work, chunk )
+    degree = np.lib.format.open_memmap( os.path.join( work, "degree.npy" ), mode='w+', dtype=np.int32, shape=(n,) )
+    for t in range( tiles ):
+        tile_degrees( t, work, n, part, degree )
+    alive = np.lib.format.open_memmap( os.path.join( work, "alive.npy" ), mode='w+', dtype=bool, shape=(n,) )
+    for start in range( 0, n, chunk ):
+        alive[start:start+chunk] = degree[start:start+chunk] > 0
+    dirty = set( range( tiles ) )
+    while dirty:
+        dirty |= peel_tile( dirty.pop(), work, n, part, degree, alive )
+    for t in range( tiles ):
+        trace_tile( t, work, n, part, alive, points )
+    
+    # Join the chains, every chain goes on in the chain that enters where it leaves.
+    closed = np.zeros( tiles, dtype=np.int64 )
+    chain_count = np.zeros( tiles, dtype=np.int64 )
+    fields = ( "chain_entry", "chain_exit", "chain_area", "chain_top", "chain_top_y", "face_area", "face_top" )
+    found = dict( ( f, [] ) for f in fields + ( "chain_size", "face_size" ) )
+    for t in range( tiles ):
+        with np.load( os.path.join( work, "faces_%d.npz" % t ) ) as d:
+            closed[t] = len(d["face_offsets"]) - 1
+            chain_count[t] = len(d["chain_entry"])
+            for f in fields:
+                found[f].append( d[f] )
+            found["chain_size"].append( np.diff( d["chain_offsets"] ) )
+            found["face_size"].append( np.diff( d["face_offsets"] ) )
+    found = dict( ( f, np.concatenate( v ) ) for f, v in found.items() )
+    chain_first = np.cumsum( chain_count ) - chain_count
+    entering = np.argsort( found["chain_entry"] )
+    following = entering[np.searchsorted( found["chain_entry"][entering], found["chain_exit"] )] if len(entering) else entering
+    cross_offsets, corder = permutation_cycles( following )
+    base = np.cumsum( closed ) - closed
+    nclosed = int(closed.sum())
+    chain_face = np.empty( len(corder), dtype=np.int64 )
+    chain_face[corder] = nclosed + np.repeat( np.arange( len(cross_offsets) - 1 ), np.diff( cross_offsets ) )
+    chain_size = found["chain_size"]
+    area = np.concatenate( ( found["face_area"], group_sums( found["chain_area"][corder], cross_offsets ) ) )
+    top = np.concatenate( ( found["face_top"], found["chain_top"][corder][group_tops( found["chain_top_y"][corder], cross_offsets )] ) )
+    size = np.concatenate( ( found["face_size"], group_sums( chain_size[corder], cross_offsets ) ) )
+    face_offsets = np.concatenate( ( [0], np.cumsum( size ) ) )
+    chain_start = np.empty( len(corder), dtype=np.int64 )
+    within = np.cumsum( chain_size[corder] ) - chain_size[corder]
+    chain_start[corder] = face_offsets[chain_face[corder]] + within - np.repeat( within[cross_offsets[:-1]], np.diff( cross_offsets ) )
+    
+    # The points of every face, and the face of every half edge.
+    face_points = np.lib.format.open_memmap( os.path.join( work, "face_points.npy" ), mode='w+', dtype=index, shape=(int(face_offsets[-1]),) )
+    cross_ids = []
+    cross_faces = []
+    for t in range( tiles ):
+        with np.load( os.path.join( work, "faces_%d.npz" % t ) ) as d:
+            src, faces, chains = d["src"], d["faces"], d["chains"]
+            face_points[face_offsets[base[t]]:face_offsets[base[t]+closed[t]]] = src[faces]
+            sizes = np.diff( d["chain_offsets"] )
+            start = np.repeat( chain_start[chain_first[t]:chain_first[t]+chain_count[t]], sizes )
+            face_points[start + np.arange( len(chains) ) - np.repeat( d["chain_offsets"][:-1], sizes )] = src[chains]
+            hface = np.empty( len(src), dtype=np.int64 )
+            hface[faces] = base[t] + np.repeat( np.arange( closed[t] ), np.diff( d["face_offsets"] ) )
+            hface[chains] = np.repeat( chain_face[chain_first[t]:chain_first[t]+chain_count[t]], sizes )
+            np.save( os.path.join( work, "hface_%d.npy" % t ), hface )
+            cross_ids.append( d["hid"][d["crossing"]] )
+            cross_faces.append( hface[d["crossing"]] )
+    cross_ids = np.concatenate( cross_ids )
+    order = np.argsort( cross_ids )
+    cross_ids = cross_ids[order]
+    cross_faces = np.concatenate( cross_faces )[order]
+    
+    # The face below the lowest segment over the highest point of every negative face.
+    positive = area >= 0.0
+    negs = np.nonzero( ~positive )[0]
+    query = np.asarray( points[top[negs]], dtype=np.float64 ).reshape((-1, 2))
+    best = np.full( len(negs), np.inf )
+    hit = np.full( len(negs), -1, dtype=np.int64 )
+    for t in range( tiles ):
+        keys = np.load( os.path.join( work, "edges_%d.npy" % t ) )
+        lo, hi = np.divmod( keys, np.int64( n ) )
+        keep = ( np.asarray( part[lo] ) == t ) & np.asarray( alive[lo] ) & np.asarray( alive[hi] )
+        keys, lo, hi = keys[keep], lo[keep], hi[keep]
+        with np.load( os.path.join( work, "faces_%d.npz" % t ) ) as d:
+            hid = d["hid"]
+        hface = np.load( os.path.join( work, "hface_%d.npy" % t ) )
+        f0 = hface[np.searchsorted( hid, 2*keys )]
+        local = np.asarray( part[hi] ) == t
+        f1 = np.empty( len(keys), dtype=np.int64 )
+        f1[local] = hface[np.searchsorted( hid, 2*keys[local] + 1 )]
+        f1[~local] = cross_faces[np.searchsorted( cross_ids, 2*keys[~local] + 1 )]
+        np.save( os.path.join( work, "pairs_%d.npy" % t ), np.column_stack( ( f0, f1 ) )[f0 != f1] )
+        
+        a = np.asarray( points[lo], dtype=np.float64 ).reshape((-1, 2))
+        b = np.asarray( points[hi], dtype=np.float64 ).reshape((-1, 2))
+        lowest = lowest_segments( a, b, segment_buckets( a, b ), query, strict=True )
+        at = np.nonzero( lowest >= 0 )[0]
+        seg = lowest[at]
+        y = a[seg,1] + ( query[at,0] - a[seg,0] )/( b[seg,0] - a[seg,0] )*( b[seg,1] - a[seg,1] )
+        better = y < best[at]
+        best[at[better]] = y[better]
+        hit[at[better]] = np.where( b[seg,0] < a[seg,0], f0[seg], f1[seg] )[better]
+    
+    # Below a negative face is its container, or another negative face with the same one.
+    negative = np.full( len(area), -1, dtype=np.int64 )
+    negative[negs] = np.arange( len(negs) )
+    container = np.where( ( hit >= 0 ) & positive[np.maximum( hit, 0 )], hit, -1 )
+    link = np.where( ( hit >= 0 ) & ~positive[np.maximum( hit, 0 )], negative[np.maximum( hit, 0 )], -1 )
+    while np.any( link >= 0 ):
+        going = np.nonzero( link >= 0 )[0]
+        to = link[going]
+        container[going] = np.where( link[to] < 0, container[to], container[going] )
+        link[going] = link[to]
+    
+    # The graph, the negative faces are replaced by their containers, in buckets of polygons.
+    npolygons = int(positive.sum())
+    rank = np.cumsum( positive ) - 1
+    target = np.where( positive, rank, -1 )
+    target[negs] = np.where( container >= 0, rank[np.maximum( container, 0 )], -1 )
+    buckets = max( int( math.ceil( npolygons/float(chunk) ) ), 1 )
+    for t in range( tiles ):
+        pairs = target[np.load( os.path.join( work, "pairs_%d.npy" % t ) )].reshape((-1, 2))
+        pairs = pairs[( pairs[:,0] >= 0 ) & ( pairs[:,1] >= 0 ) & ( pairs[:,0] != pairs[:,1] )]
+        pairs = np.concatenate( ( pairs, pairs[:,::-1] ) )
+        which = pairs[:,0] // chunk
+        order = np.argsort( which, kind='mergesort' )
+        pairs, which = pairs[order], which[order]
+        bounds = np.nonzero( np.diff( which ) )[0] + 1
+        for start, end in zip( np.append( 0, bounds ), np.append( bounds, len(which) ) ):
+            if end > start:
+                with open( os.path.join( work, "graph_%d.bin" % which[start] ), "ab" ) as f:
+                    pairs[start:end].tofile( f )
+    counts = np.zeros( npolygons, dtype=np.int64 )
+    for i in range( buckets ):
+        spilled = os.path.join( work, "graph_%d.bin" % i )
+        keys = np.zeros( 0, dtype=np.int64 )
+        if os.path.exists( spilled ):
+            pairs = np.fromfile( spilled, dtype=np.int64 ).reshape((-1, 2))
+            keys = np.unique( pairs[:,0]*np.int64( max( npolygons, 1 ) ) + pairs[:,1] )
+            os.remove( spilled )
+        np.save( os.path.join( work, "graph_%d.npy" % i ), keys )
+        counts += np.bincount( keys // max( npolygons, 1 ), minlength=npolygons )
+    graph_offsets = np.concatenate( ( [0], np.cumsum( counts ) ) )
+    np.save( os.path.join( directory, "graph_offsets.npy" ), graph_offsets )
+    graph_indices = np.lib.format.open_memmap( os.path.join( directory, "graph_indices.npy" ), mode='w+', dtype=np.int32 if npolygons < 2**31 else np.int64, shape=(int(graph_offsets[-1]),) )
+    start = 0
+    for i in range( buckets ):
+        keys = np.load( os.path.join( work, "graph_%d.npy" % i ) )
+        graph_indices[start:start+len(keys)] = keys % max( npolygons, 1 )
+        start += len(keys)
+    del graph_indices
+    
+    # The rings of every polygon, the outer one first, and the points they use.
+    held = np.nonzero( container >= 0 )[0]
+    ring_face = np.concatenate( ( np.nonzero( positive )[0], negs[held] ) )
+    ring_polygon = np.concatenate( ( rank[positive], rank[container[held]] ) )
+    order = np.lexsort( ( ring_face, np.arange( len(ring_face) ) >= npolygons, ring_polygon ) )
+    ring_face = ring_face[order]
+    np.save( os.path.join( directory, "polygon_offsets.npy" ), np.concatenate( ( [0], np.cumsum( np.bincount( ring_polygon, minlength=npolygons ) ) ) ) )
+    ring_offsets = np.concatenate( ( [0], np.cumsum( size[ring_face] ) ) )
+    np.save( os.path.join( directory, "ring_offsets.npy" ), ring_offsets )
+    indices = np.lib.format.open_memmap( os.path.join( directory, "indices.npy" ), mode='w+', dtype=index, shape=(int(ring_offsets[-1]),) )
+    blocks = np.unique( np.append( np.searchsorted( ring_offsets, np.arange( 0, ring_offsets[-1], chunk ) ), len(ring_face) ) )
+    for first, last in zip( blocks[:-1], blocks[1:] ):
+        sizes = size[ring_face[first:last]]
+        at = np.repeat( face_offsets[ring_face[first:last]] - ring_offsets[first:last], sizes ) + np.arange( ring_offsets[first], ring_offsets[last] )
+        indices[ring_offsets[first]:ring_offsets[last]] = face_points[at]
+    
+    used = np.lib.format.open_memmap( os.path.join( work, "used.npy" ), mode='w+', dtype=bool, shape=(n,) )
+    for start in range( 0, len(indices), chunk ):
+        used[indices[start:start+chunk]] = True
+    renumber = np.lib.format.open_memmap( os.path.join( work, "renumber.npy" ), mode='w+', dtype=index, shape=(n,) )
+    kept = 0
+    for start in range( 0, n, chunk ):
+        u = np.asarray( used[start:start+chunk] )
+        renumber[start:start+chunk] = kept + np.cumsum( u ) - 1
+        kept += int(u.sum())
+    for start in range( 0, len(indices), chunk ):
+        indices[start:start+chunk] = renumber[indices[start:start+chunk]]
+    del indices
+    reduced = np.lib.format.open_memmap( os.path.join( directory, "points.npy" ), mode='w+', dtype=np.float64, shape=(kept, 2) )
+    kept = 0
+    for start in range( 0, n, chunk ):
+        u = np.asarray( used[start:start+chunk] )
+        reduced[kept:kept+int(u.sum())] = np.asarray( points[start:start+chunk], dtype=np.float64 )[u]
+        kept += int(u.sum())
+    del reduced
@@ -23,18 +23,51 @@ import math
 import numpy as np
 from numpy import linalg as la
 import numpy.random as nprnd
-import cProfile, pstats, StringIO
+import cProfile, pstats
 import sys
+import os
+import tempfile
+import copy
+import time
 
-import graphs
-import polygons
-import geometry
-import grid 
-from shapely.geometry import Polygon
+from geomtopo2d import graphs
+from geomtopo2d import polygons
+from geomtopo2d import geometry
+from geomtopo2d import grid
+from shapely.geometry import Polygon, Point
+from scipy.spatial import Delaunay, distance
+from scipy.sparse.csgraph import minimum_spanning_tree
 from itertools import product
+import itertools
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
 
 PROFILE = False
 
+def canonical_polygons( polygons, cls, points ):
+    """
+    The polygons as coordinates, with the rings in their smallest rotation, a
+    point can be twice around a bridge, and the holes sorted, to compare results
+    that number them differently.
+    """
+    ret = []
+    for p, c in zip( polygons, cls ):
+        rings = []
+        for r in p:
+            r = [ tuple(map( float, points[i] )) for i in r ]
+            rings.append( min( tuple( r[m:] + r[:m] ) for m in range(len(r)) ) )
+        ret.append( ( c, rings[0], tuple(sorted(rings[1:])) ) )
+    return sorted(ret)
+
+def canonical_graph( polygons, cls, points, graph ):
+    """
+    The graph of neighbour polygons, with the polygons as in canonical_polygons.
+    """
+    keys = [ canonical_polygons( [p], [c], points )[0] for p, c in zip( polygons, cls ) ]
+    return sorted( ( keys[i], sorted( keys[j] for j in g ) ) for i, g in enumerate(graph) )
+
 class Test(unittest.TestCase):
     
     def setUp(self):
@@ -47,11 +80,11 @@ class Test(unittest.TestCase):
         if PROFILE:
             # Print profiling of GeoModelR.
             self.pr.disable()
-            s = StringIO.StringIO()
+            s = StringIO()
             sortby = 'cumulative'
             ps = pstats.Stats(self.pr, stream=s).sort_stats(sortby)
             ps.print_stats()
-            print >> sys.stderr, s.getvalue()
+            print( s.getvalue(), file=sys.stderr )
     
     def test_vector_angle(self):
         self.assertAlmostEqual(geometry.vector_angle( [0, 1], [ 0,-1] ), 0.0)
@@ -72,11 +105,11 @@ class Test(unittest.TestCase):
         self.assertEqual(type(holed[0][0][0]), type(int()))
         self.assertEqual(type(holed[-1][-1][-1]), type(int()))
         self.assertEqual(len(graph), len(holed))
-        for i in xrange(len(graph)):
+        for i in range(len(graph)):
             if len(graph[i]):
                 self.assertIn(i, graph[graph[i][0]])
             else:
-                print i, "g", graph[i], "p", holed[i]
+                print( i, "g", graph[i], "p", holed[i] )
     
     def test_grid( self ):
         ex = ["ABAA",
@@ -100,9 +133,9 @@ class Test(unittest.TestCase):
         self.assertEqual(len(set(pointse+pointsb)-set(pointsm)), 0)
         self.assertEqual(edgesm, [(8, 7), (9, 6), (10, 9), (12, 8), (13, 11), (10, 11), (4, 16), (14, 16), (12, 16), (15, 17), (13, 17), (14, 17), (5, 15)])
         
+        # The order of the polygons, and where their rings start, depend on the order of sets.
         polygons, cls, points = grid.polygons_from_grid( ex )
-        self.assertEqual(cls, ['A', 'B', 'A', 'C'])
-        self.assertEqual(polygons, [[[9, 6, 3, 5, 15, 17, 13, 11, 10]], [[10, 11, 13, 17, 14, 16, 12, 8, 7, 6, 9]], [[16, 4, 1, 0, 7, 8, 12]], [[14, 17, 15, 5, 2, 4, 16]]])
+        self.assertEqual(canonical_polygons(polygons, cls, points), canonical_polygons([[[9, 6, 3, 5, 15, 17, 13, 11, 10]], [[10, 11, 13, 17, 14, 16, 12, 8, 7, 6, 9]], [[16, 4, 1, 0, 7, 8, 12]], [[14, 17, 15, 5, 2, 4, 16]]], ['A', 'B', 'A', 'C'], points))
         ex = ["ABA",
               "ABB",
               "ABA",
@@ -110,15 +143,13 @@ class Test(unittest.TestCase):
         polygons, cls, points = grid.polygons_from_grid( ex )
         self.assertEqual(points, [(0.0, 0.0), (0.0, 3.0), (2.0, 3.0), (2.0, 0.0), (0.5, 3.0), (2.0, 2.5), (2.0, 1.5), (2.0, 0.5), 
                                   (1.5, 0.0), (0.5, 0.0), (0.5, 1.0), (0.5, 2.0), (1.5, 2.0), (1.0, 2.5), (0.5, 2.5), (1.5, 2.5)])
-        self.assertEqual(polygons, [[[11, 10, 9, 8, 7, 6, 12, 15, 13, 14]], [[13, 15, 5, 2, 4, 14]], [[8, 3, 7]], [[14, 4, 1, 0, 9, 10, 11]], [[6, 5, 15, 12]]])
-        self.assertEqual(cls, ['B', 'C', 'A', 'A', 'A'])
+        self.assertEqual(canonical_polygons(polygons, cls, points), canonical_polygons([[[11, 10, 9, 8, 7, 6, 12, 15, 13, 14]], [[13, 15, 5, 2, 4, 14]], [[8, 3, 7]], [[14, 4, 1, 0, 9, 10, 11]], [[6, 5, 15, 12]]], ['B', 'C', 'A', 'A', 'A'], points))
         ex = ["ABAA",
               "ABBA",
               "ABAA"]
         
         polygons, cls, points = grid.polygons_from_grid( ex )
-        self.assertEqual(polygons, [[[6, 3, 2, 5, 11, 10, 9]], [[5, 4, 8, 7, 6, 9, 10, 11]], [[4, 1, 0, 7, 8]]])
-        self.assertEqual(cls, ['A', 'B', 'A'])
+        self.assertEqual(canonical_polygons(polygons, cls, points), canonical_polygons([[[6, 3, 2, 5, 11, 10, 9]], [[5, 4, 8, 7, 6, 9, 10, 11]], [[4, 1, 0, 7, 8]]], ['A', 'B', 'A'], points))
         self.assertEqual(points, [(0.0, 0.0), (0.0, 2.0), (3.0, 2.0), (3.0, 0.0), (0.5, 2.0), (1.5, 2.0), (1.5, 0.0), (0.5, 0.0), (0.5, 1.0), (2.0, 0.5), (2.5, 1.0), (2.0, 1.5)])
         ex = ["AAAA",
               "ABCA",
@@ -126,15 +157,622 @@ class Test(unittest.TestCase):
               "CCAA",
               "CCCC"]
         polygons, cls, points = grid.polygons_from_grid( ex )
-        self.assertEqual(polygons, [[[17, 9, 6, 7, 16, 8]], [[4, 0, 3, 5, 15, 14, 13], [9, 17, 12, 11, 10, 16, 7, 6]], [[16, 10, 11, 12, 17, 8]], [[4, 13, 14, 15, 5, 2, 1]]])
+        self.assertEqual(canonical_polygons(polygons, cls, points), canonical_polygons([[[17, 9, 6, 7, 16, 8]], [[4, 0, 3, 5, 15, 14, 13], [9, 17, 12, 11, 10, 16, 7, 6]], [[16, 10, 11, 12, 17, 8]], [[4, 13, 14, 15, 5, 2, 1]]], ['B', 'A', 'C', 'C'], points))
         self.assertEqual(points, [(0.0, 0.0), (0.0, 4.0), (3.0, 4.0), (3.0, 0.0), (0.0, 2.5), (3.0, 3.5), (0.5, 1.0), (1.0, 0.5), (1.5, 1.0), 
                                   (1.0, 1.5), (2.0, 0.5), (2.5, 1.0), (2.0, 1.5), (1.0, 2.5), (1.5, 3.0), (2.0, 3.5), (1.5, 0.5), (1.5, 1.5)])
-        self.assertEqual(cls, ['B', 'A', 'C', 'C'])
-        print grid.visi
+    
+    def test_grid_array( self ):
+        for i in range(50):
+            ny, nx = nprnd.randint(1, 12, 2)
+            ex = nprnd.randint(0, 3, (ny, nx))
+            edgese, pointse = grid.boundary_edges( ex.tolist() )
+            edgesa, pointsa = grid.boundary_edges_array( ex )
+            self.assertEqual( list(map( tuple, edgesa.tolist() )), edgese )
+            self.assertEqual( list(map( tuple, pointsa.tolist() )), pointse )
+            pointsb = grid.point_breaks_array( ex )
+            self.assertEqual( list(map( tuple, pointsb.tolist() )), grid.point_breaks( ex.tolist() ) )
+            if ny < 3 or nx < 3:
+                continue
+            edgesm, pointsm = grid.create_mid_points_and_edges( ex.tolist(), pointse + grid.point_breaks( ex.tolist() ) )
+            edgesma, pointsma = grid.create_mid_points_and_edges_array( ex.shape, np.concatenate( ( pointsa, pointsb ) ) )
+            self.assertEqual( list(map( tuple, edgesma.tolist() )), edgesm )
+            self.assertEqual( list(map( tuple, pointsma.tolist() )), pointsm )
+        
+        ex = ["ABAA",
+              "ABBA",
+              "ABAA",
+              "ACCC"]
+        polygons, cls, points = grid.polygons_from_grid( ex )
+        polygonsa, clsa, pointsa = grid.polygons_from_grid( np.array([list(r) for r in ex]) )
+        # The array grids split their edges in lines with arrays, so the rings can start elsewhere.
+        self.assertEqual( canonical_polygons( polygonsa, clsa, pointsa ), canonical_polygons( polygons, cls, points ) )
+        self.assertEqual( pointsa, points )
+    
+    def test_grid_classification( self ):
+        ex = ["AAAAAAA",
+              "ABBBBBA",
+              "ABCCCBA",
+              "ABCDCBA",
+              "ABCCCBA",
+              "ABBBBBA",
+              "AAAAAAA"]
+        polygons, cls, points = grid.polygons_from_grid( ex )
+        # Every ring goes only to the polygon right around it.
+        self.assertEqual( sorted( zip( cls, map( len, polygons ) ) ), [('A', 2), ('B', 2), ('C', 2), ('D', 1)] )
+        ex = ["AABAA",
+              "AABAB",
+              "AAAAB"]
+        polygons, cls, points = grid.polygons_from_grid( ex )
+        for p, c in zip( polygons, cls ):
+            pol = Polygon( [ points[i] for i in p[0] ] )
+            for y, row in enumerate(ex):
+                for x, v in enumerate(row):
+                    if pol.buffer(-1e-6).contains( Polygon( [(x-0.1, y-0.1), (x+0.1, y-0.1), (x+0.1, y+0.1), (x-0.1, y+0.1)] ) ):
+                        self.assertEqual( v, c )
+    
+    def test_grid_tiled( self ):
+        for i in range(40):
+            ny, nx = nprnd.randint(3, 25, 2)
+            if i % 2:
+                ex = nprnd.randint(0, 3, (ny, nx))
+            else:
+                ex = np.kron( nprnd.randint(0, 3, (ny//3+1, nx//3+1)), np.ones((3, 3), dtype=int) )[:ny,:nx]
+            tile = nprnd.randint(2, 8)
+            self.assertEqual( canonical_polygons( *grid.polygons_from_grid_tiled( ex, tile ) ),
+                              canonical_polygons( *grid.polygons_from_grid( ex ) ) )
+            self.assertEqual( grid.polygons_from_grid_tiled( ex, tile )[2], list(map( tuple, grid.polygons_from_grid( ex )[2] )) )
+        
+        # Rings inside rings, through many windows, read from a file.
+        y, x = np.mgrid[:41,:41]
+        ex = ( np.maximum( abs(y-20), abs(x-20) ) // 4 ) % 3
+        fname = os.path.join( tempfile.mkdtemp(), "grid.npy" )
+        np.save( fname, ex )
+        polygons, cls, points = grid.polygons_from_grid_tiled( fname, 7 )
+        self.assertEqual( canonical_polygons( polygons, cls, points ), canonical_polygons( *grid.polygons_from_grid( ex ) ) )
+        self.assertEqual( sorted(map( len, polygons )), [1] + [2]*5 )
+    
+    def test_grid_parallel( self ):
+        for i in range(10):
+            ny, nx = nprnd.randint(3, 30, 2)
+            ex = np.kron( nprnd.randint(0, 3, (ny//3+1, nx//3+1)), np.ones((3, 3), dtype=int) )[:ny,:nx]
+            ex[nprnd.uniform(size=ex.shape) < 0.1] = 3
+            result = grid.polygons_from_grid( ex, with_graph=True )
+            presult = grid.polygons_from_grid( ex, workers=3, with_graph=True )
+            self.assertEqual( canonical_polygons( *presult[:3] ), canonical_polygons( *result[:3] ) )
+            self.assertEqual( canonical_graph( *presult ), canonical_graph( *result ) )
+            for j, g in enumerate(result[3]):
+                for k in g:
+                    self.assertIn( j, result[3][k] )
+            
+            # The arrays come from the strips in compressed rows.
+            ( po, ro, indices ), cls, points, ( go, gi ) = grid.polygons_from_grid( ex, workers=3, with_graph=True, output="arrays" )
+            polygons_ = [ [ indices[ro[r]:ro[r+1]].tolist() for r in range( po[k], po[k+1] ) ] for k in range(len(po)-1) ]
+            graph = [ gi[go[k]:go[k+1]].tolist() for k in range(len(go)-1) ]
+            self.assertEqual( indices.dtype, np.int32 )
+            self.assertEqual( canonical_graph( polygons_, cls.tolist(), points, graph ), canonical_graph( *result ) )
+    
+    def test_grid_trace( self ):
+        ex = ["AAAA",
+              "ABCA",
+              "AAAA",
+              "CCAA",
+              "CCCC"]
+        polygons, cls, points = grid.polygons_from_grid( ex, engine="trace" )
+        self.assertEqual( points, [(0.0, 0.0), (0.0, 4.0), (3.0, 4.0), (3.0, 0.0), (0.0, 2.5), (3.0, 3.5), (0.5, 1.0), (1.0, 0.5), (1.5, 1.0), 
+                                   (1.0, 1.5), (2.0, 0.5), (2.5, 1.0), (2.0, 1.5), (1.0, 2.5), (1.5, 3.0), (2.0, 3.5), (1.5, 0.5), (1.5, 1.5)] )
+        self.assertEqual( canonical_polygons( polygons, cls, points ), canonical_polygons( *grid.polygons_from_grid( ex ) ) )
+        for i in range(30):
+            ny, nx = nprnd.randint(3, 25, 2)
+            if i % 2:
+                ex = nprnd.randint(0, 4, (ny, nx))
+            else:
+                ex = np.kron( nprnd.randint(0, 3, (ny//3+1, nx//3+1)), np.ones((3, 3), dtype=int) )[:ny,:nx]
+            result = grid.polygons_from_grid( ex, with_graph=True )
+            tresult = grid.polygons_from_grid( ex, with_graph=True, engine="trace" )
+            self.assertEqual( canonical_polygons( *tresult[:3] ), canonical_polygons( *result[:3] ) )
+            self.assertEqual( canonical_graph( *tresult ), canonical_graph( *result ) )
+        self.assertEqual( canonical_polygons( *grid.polygons_from_grid_tiled( ex, 5, engine="trace" ) ), canonical_polygons( *result[:3] ) )
+        self.assertEqual( canonical_graph( *grid.polygons_from_grid( ex, workers=2, with_graph=True, engine="trace" ) ), canonical_graph( *result ) )
+    
+    def test_grid_rows( self ):
+        for i in range(30):
+            ny, nx = nprnd.randint(3, 25, 2)
+            ex = np.kron( nprnd.randint(0, 3, (ny//3+1, nx//3+1)), np.ones((3, 3), dtype=int) )[:ny,:nx]
+            ex[nprnd.uniform(size=ex.shape) < 0.1] = 3
+            streamed = list( grid.polygons_from_rows( iter(ex), nprnd.randint(2, 6) ) )
+            points = sorted( set( q for p, c in streamed for r in p for q in r ) )
+            index = dict( ( q, j ) for j, q in enumerate(points) )
+            polygons = [ [ [ index[q] for q in r ] for r in p ] for p, c in streamed ]
+            self.assertEqual( canonical_polygons( polygons, [ c for p, c in streamed ], points ),
+                              canonical_polygons( *grid.polygons_from_grid( ex ) ) )
+        
+        # The polygons at the top come out before the last rows are read.
+        read = []
+        def rows():
+            for r in range(40):
+                read.append( r )
+                yield [ r // 4 ] * 10
+        first = next( grid.polygons_from_rows( rows(), 8 ) )
+        self.assertIn( first[1], ( 0, 1 ) )
+        self.assertLess( len(read), 20 )
+        
+        # Stripes through all the strips, and rings inside rings.
+        y, x = np.mgrid[:60,:9]
+        for ex in [ np.tile( np.arange(9) % 2, (60, 1) ), ( np.maximum( abs(y-30), abs(x-4) ) // 2 ) % 3 ]:
+            streamed = list( grid.polygons_from_rows( iter(ex), 3 ) )
+            points = sorted( set( q for p, c in streamed for r in p for q in r ) )
+            index = dict( ( q, j ) for j, q in enumerate(points) )
+            polygons = [ [ [ index[q] for q in r ] for r in p ] for p, c in streamed ]
+            self.assertEqual( canonical_polygons( polygons, [ c for p, c in streamed ], points ),
+                              canonical_polygons( *grid.polygons_from_grid( ex ) ) )
+    
+    def test_grid_update( self ):
+        for i in range(20):
+            ny, nx = nprnd.randint(3, 20, 2)
+            ex = np.kron( nprnd.randint(0, 3, (ny//3+1, nx//3+1)), np.ones((3, 3), dtype=int) )[:ny,:nx]
+            gp = grid.GridPolygonizer( ex )
+            for j in range(4):
+                polygons = list(gp.polygons)
+                points = list(gp.points)
+                cells = [ ( ( nprnd.randint(ny), nprnd.randint(nx) ), nprnd.randint(0, 4) ) for k in range(nprnd.randint(1, 4)) ]
+                removed, added = gp.update( cells )
+                for k, p in enumerate(polygons):
+                    if not k in removed:
+                        self.assertEqual( gp.polygons[k], p )
+                self.assertEqual( gp.points[:len(points)], points )
+                
+                # The polygons that are left are the same as polygonizing again.
+                live = [ k for k, p in enumerate(gp.polygons) if p is not None ]
+                number = dict( ( k, n ) for n, k in enumerate(live) )
+                result = ( [ gp.polygons[k] for k in live ], [ gp.classification[k] for k in live ], gp.points,
+                           [ [ number[g] for g in gp.graph[k] ] for k in live ] )
+                self.assertEqual( canonical_graph( *result ), canonical_graph( *grid.polygons_from_grid( gp.grid, with_graph=True ) ) )
+                for k in added:
+                    self.assertTrue( np.all( gp.grid[gp.labels == k] == gp.classification[k] ) )
+    
+    def test_grid_classify( self ):
+        for i in range(30):
+            ny, nx = nprnd.randint(3, 15, 2)
+            ex = nprnd.randint(0, 4, (ny, nx))
+            polygons, cls, points = grid.polygons_from_grid( ex )
+            # Start the rings in every kind of point, in the boundary, in breaks and in mid points.
+            for j in range(3):
+                rings = [ np.roll( p[0], -nprnd.randint(len(p[0])) ).tolist() for p in polygons ]
+                offsets = np.cumsum( [0] + list(map( len, rings )) )
+                batch = grid.classify_polygons( ex, np.concatenate( rings ), offsets, points )
+                self.assertEqual( batch, [ grid.classify_polygon( ex, [r], points ) for r in rings ] )
+                self.assertEqual( batch, cls )
+    
+    def test_grid_stack( self ):
+        ny, nx = nprnd.randint(3, 20, 2)
+        volume = [ np.kron( nprnd.randint(0, 3, (ny//3+1, nx//3+1)), np.ones((3, 3), dtype=int) )[:ny,:nx] ]
+        for k in range(8):
+            volume.append( volume[-1].copy() )
+            if k % 3 == 1:
+                volume[-1][nprnd.randint(ny), nprnd.randint(nx)] = 3
+            elif k % 3 == 2:
+                volume[-1] = nprnd.randint(0, 3, (ny, nx))
+        volume = np.array( volume )
+        for workers in [1, 3]:
+            results, persistence = grid.polygons_from_grid_stack( volume, workers=workers, with_graph=True )
+            self.assertEqual( len(results), len(volume) )
+            self.assertEqual( len(persistence), len(volume)-1 )
+            for k, result in enumerate(results):
+                expected = grid.polygons_from_grid( volume[k], with_graph=True )
+                self.assertEqual( result[2], expected[2] )
+                self.assertEqual( canonical_graph( *result ), canonical_graph( *expected ) )
+            
+            # The polygons that persist are the ones equal in both slices.
+            for k, pairs in enumerate(persistence):
+                before = [ canonical_polygons( [p], [c], results[k][2] ) for p, c in zip( *results[k][:2] ) ]
+                after = [ canonical_polygons( [p], [c], results[k+1][2] ) for p, c in zip( *results[k+1][:2] ) ]
+                self.assertEqual( sorted(pairs), [ ( i, j ) for i, b in enumerate(before) for j, a in enumerate(after) if a == b ] )
+    
+    def test_arrays( self ):
+        def rings( arrays ):
+            polygon_offsets, ring_offsets, indices = arrays
+            self.assertEqual( indices.dtype, np.int32 )
+            rings = [ indices[ring_offsets[j]:ring_offsets[j+1]].tolist() for j in range(len(ring_offsets)-1) ]
+            return [ rings[polygon_offsets[i]:polygon_offsets[i+1]] for i in range(len(polygon_offsets)-1) ]
+        def neighbours( arrays ):
+            offsets, indices = arrays
+            return [ sorted( indices[offsets[i]:offsets[i+1]].tolist() ) for i in range(len(offsets)-1) ]
+        
+        points = nprnd.uniform(0.0, 512.0, (300,2))
+        edges = graphs.relative_neighborhood_graph(points)
+        # A square with a square hole, and a triangle in it, away from the rest.
+        n = len(points)
+        points = np.vstack( ( points, [ (600, 0), (700, 0), (700, 100), (600, 100), (630, 30), (670, 30), (670, 70), (630, 70), (640, 40), (660, 40), (650, 60) ] ) )
+        edges += [ (n+i, n+(i+1)%4) for i in range(4) ] + [ (n+4+i, n+4+(i+1)%4) for i in range(4) ] + [ (n+8, n+9), (n+9, n+10), (n+10, n+8) ]
+        holed, graph, rpoints = polygons.obtain_polygons( edges, points, engine="arrays" )
+        aholed, agraph, apoints = polygons.obtain_polygons( edges, points, output="arrays" )
+        self.assertEqual( rings( aholed ), holed )
+        self.assertEqual( neighbours( agraph ), list(map( sorted, graph )) )
+        self.assertEqual( apoints.dtype, np.float64 )
+        self.assertEqual( apoints.tolist(), list(map( list, rpoints )) )
+        # The same polygons as with the dict engine, numbered in another way.
+        holed, graph, rpoints = polygons.obtain_polygons( edges, points, engine="dict" )
+        self.assertEqual( canonical_graph( rings( aholed ), [0]*len(holed), apoints, neighbours( agraph ) ), canonical_graph( holed, [0]*len(holed), rpoints, graph ) )
+        
+        for i in range(10):
+            ny, nx = nprnd.randint(3, 15, 2)
+            ex = nprnd.randint(0, 3, (ny, nx))
+            for engine in [ "planar", "trace" ]:
+                polygons_, cls, points, graph = grid.polygons_from_grid( ex, with_graph=True, engine=engine )
+                apolygons, acls, apoints, agraph = grid.polygons_from_grid( ex, with_graph=True, engine=engine, output="arrays" )
+                self.assertEqual( rings( apolygons ), polygons_ )
+                self.assertEqual( acls.tolist(), list(cls) )
+                self.assertEqual( list(map( tuple, apoints.tolist() )), points )
+                self.assertEqual( neighbours( agraph ), list(map( sorted, graph )) )
+    
+    def test_delaunay( self ):
+        points = nprnd.uniform(0.0, 512.0, (1000,2))
+        edges = graphs.delaunay_graph( points )
+        self.assertEqual( edges.shape[1], 2 )
+        expected = set()
+        for tri in Delaunay( points ).simplices:
+            for e in product( tri, tri ):
+                if e[0] < e[1]:
+                    expected.add( ( int(e[0]), int(e[1]) ) )
+        self.assertEqual( list(map( tuple, edges.tolist() )), sorted(expected) )
+    
+    def test_gabriel( self ):
+        for i in range(10):
+            points = nprnd.uniform(0.0, 512.0, (nprnd.randint(4, 2000),2))
+            self.assertEqual( graphs.gabriel_graph( points, engine="delaunay" ), graphs.gabriel_graph( points ) )
+        # Points on a lattice have many edges with points right on their circles.
+        points = nprnd.randint(0, 20, (500,2)).astype(float)
+        self.assertEqual( graphs.gabriel_graph( points, engine="delaunay" ), graphs.gabriel_graph( points ) )
+    
+    def test_rng( self ):
+        for i in range(10):
+            points = nprnd.uniform(0.0, 512.0, (nprnd.randint(4, 2000),2))
+            self.assertEqual( graphs.relative_neighborhood_graph( points, engine="delaunay" ), graphs.relative_neighborhood_graph( points ) )
+        # Thin clouds have points in the lune far from the Delaunay neighbours of the edge.
+        points = nprnd.normal(0.0, 1.0, (2000,2))*[1.0, 0.01]
+        self.assertEqual( graphs.relative_neighborhood_graph( points, engine="delaunay" ), graphs.relative_neighborhood_graph( points ) )
+    
+    def test_builder( self ):
+        for i in range(5):
+            points = nprnd.uniform(0.0, 512.0, (nprnd.randint(4, 300),2))
+            builder = graphs.ProximityGraphBuilder( points )
+            triangulation = builder.triangulation
+            self.assertEqual( list(map( tuple, builder.gabriel().tolist() )), graphs.gabriel_graph( points ) )
+            self.assertEqual( list(map( tuple, builder.rng().tolist() )), graphs.relative_neighborhood_graph( points ) )
+            self.assertTrue( builder.triangulation is triangulation )
+            dist = distance.squareform( distance.pdist( points ) )
+            for beta in [1.5, 2.5]:
+                lune = []
+                for e0, e1 in itertools.combinations( range(len(points)), 2 ):
+                    c0 = points[e0] + ( points[e1] - points[e0] )*( 1.0 - beta/2.0 )
+                    c1 = points[e0] + ( points[e1] - points[e0] )*( beta/2.0 )
+                    rad = dist[e0, e1]*beta/2.0
+                    inside = ( la.norm( points - c0, axis=1 ) < rad ) & ( la.norm( points - c1, axis=1 ) < rad )
+                    inside[[e0, e1]] = False
+                    if not inside.any():
+                        lune.append( ( e0, e1 ) )
+                self.assertEqual( list(map( tuple, builder.beta_skeleton( beta ).tolist() )), lune )
+            emst = builder.emst()
+            self.assertEqual( len(emst), len(points)-1 )
+            self.assertAlmostEqual( dist[emst[:,0], emst[:,1]].sum(), minimum_spanning_tree( dist ).sum() )
+            for k in [3, 1]:
+                near = np.argsort( dist, axis=1 )[:,1:k+1]
+                knn = set( tuple(sorted(( a, int(b) ))) for a in range(len(points)) for b in near[a] )
+                self.assertEqual( set( map( tuple, builder.knn( k ).tolist() ) ), knn )
+        # Repeated points are left out of the triangulation.
+        points = np.vstack( [ points, points[:3] ] )
+        builder = graphs.ProximityGraphBuilder( points )
+        self.assertEqual( list(map( tuple, builder.gabriel().tolist() )), graphs.gabriel_graph( points ) )
+        self.assertEqual( list(map( tuple, builder.rng().tolist() )), graphs.relative_neighborhood_graph( points ) )
+    
+    def test_graph_tiled( self ):
+        for i in range(6):
+            points = nprnd.uniform(0.0, 512.0, (nprnd.randint(500, 3000),2))
+            if i % 2:
+                # A lake without points, crossed by long edges.
+                points = points[la.norm( points - 256.0, axis=1 ) > 150.0]
+            builder = graphs.ProximityGraphBuilder( points )
+            for graph in ["delaunay", "gabriel", "rng"]:
+                tiled = graphs.proximity_graph_tiled( points, graph, tile_size=nprnd.randint(50, 400) )
+                self.assertTrue( np.array_equal( tiled, getattr( builder, graph )() ) )
+        tiled = graphs.proximity_graph_tiled( points, "rng", tile_size=200, workers=2 )
+        self.assertTrue( np.array_equal( tiled, builder.rng() ) )
+        # Without shared memory the workers are sent the points around their tiles.
+        shared, graphs.shared_memory = graphs.shared_memory, None
+        try:
+            for graph in ["delaunay", "rng"]:
+                tiled = graphs.proximity_graph_tiled( points, graph, tile_size=200, workers=2 )
+                self.assertTrue( np.array_equal( tiled, getattr( builder, graph )() ) )
+        finally:
+            graphs.shared_memory = shared
+        points = np.vstack( [ points, points[:3] ] )
+        self.assertTrue( np.array_equal( graphs.proximity_graph_tiled( points, "gabriel", tile_size=200 ), graphs.ProximityGraphBuilder( points ).gabriel() ) )
+    
+    def test_adjacency( self ):
+        points = nprnd.uniform(0.0, 512.0, (500,2))
+        dist = distance.squareform( distance.pdist( points ) )
+        graphs_ = [ ( graphs.delaunay_graph( points ).tolist(), lambda **k: graphs.delaunay_graph( points, **k ) ) ]
+        for function in [ graphs.gabriel_graph, graphs.relative_neighborhood_graph ]:
+            for engine in [ "tree", "delaunay" ]:
+                graphs_.append( ( function( points, engine=engine ), lambda function=function, engine=engine, **k: function( points, engine=engine, **k ) ) )
+        for edges, function in graphs_:
+            edges = np.array( edges )
+            adjacency = function( output="csr" )
+            self.assertEqual( adjacency.format, "csr" )
+            self.assertEqual( adjacency.shape, (500, 500) )
+            self.assertEqual( adjacency.nnz, 2*len(edges) )
+            self.assertTrue( adjacency[edges[:,0], edges[:,1]].all() and adjacency[edges[:,1], edges[:,0]].all() )
+            weighted = function( output="csr", weighted=True )
+            self.assertTrue( np.allclose( np.asarray( weighted[edges[:,0], edges[:,1]] ).ravel(), dist[edges[:,0], edges[:,1]] ) )
+            self.assertEqual( ( weighted != weighted.T ).nnz, 0 )
+        
+        edges = graphs.relative_neighborhood_graph( points )
+        adjacency = graphs.relative_neighborhood_graph( points, output="csr", weighted=True )
+        self.assertEqual( polygons.obtain_polygons( adjacency, points ), polygons.obtain_polygons( edges, points ) )
+        self.assertRaises( ValueError, graphs.gabriel_graph, points, output="coo" )
+    
+    def test_dynamic_graph( self ):
+        for i in range(10):
+            dynamic = graphs.DynamicProximityGraph( nprnd.uniform(0.0, 512.0, (nprnd.randint(10, 400),2)) )
+            for step in range(6):
+                if step % 2:
+                    alive = np.nonzero( dynamic.alive )[0]
+                    dynamic.remove_points( nprnd.choice( alive, nprnd.randint(1, 20), replace=False ) )
+                else:
+                    # Some points outside the hull too.
+                    added = dynamic.add_points( nprnd.uniform(-64.0, 576.0, (nprnd.randint(1, 50),2)) )
+                    self.assertEqual( added[-1], len(dynamic.points)-1 )
+                alive = np.nonzero( dynamic.alive )[0]
+                builder = graphs.ProximityGraphBuilder( dynamic.points[alive] )
+                self.assertTrue( np.array_equal( dynamic.gabriel(), alive[builder.gabriel()] ) )
+                self.assertTrue( np.array_equal( dynamic.rng(), alive[builder.rng()] ) )
+    
+    def test_dynamic_cost( self ):
+        # A batch of points, inside the hull or around it, costs much less than
+        # building the graphs again.
+        points = nprnd.uniform(0.0, 1.0, (50000,2))
+        start = time.time()
+        dynamic = graphs.DynamicProximityGraph( points )
+        rebuild = time.time() - start
+        for batch in [ nprnd.uniform(0.2, 0.8, (300,2)), nprnd.uniform(-0.1, 1.1, (300,2)) ]:
+            start = time.time()
+            dynamic.add_points( batch )
+            self.assertLess( time.time() - start, rebuild / 4 )
+        start = time.time()
+        dynamic.remove_points( nprnd.choice( len(points), 300, replace=False ) )
+        self.assertLess( time.time() - start, rebuild / 2 )
+    
+    def test_line_arrays( self ):
+        points = nprnd.uniform(0.0, 512.0, (500,2))
+        # Some loose cycles, one of them touching a line.
+        edges = graphs.relative_neighborhood_graph( points ) + [ (600, 601), (601, 602), (602, 600), (700, 701), (701, 702), (702, 703), (703, 700), (701, 704) ]
+        offsets, indices = polygons.separate_lines( np.array( edges ), engine="arrays" )
+        degree = np.bincount( np.array( edges ).ravel() )
+        lines = [ indices[offsets[i]:offsets[i+1]].tolist() for i in range(len(offsets)-1) ]
+        self.assertEqual( sorted( tuple(sorted(e)) for l in lines for e in zip( l[:-1], l[1:] ) ), sorted( tuple(sorted(e)) for e in edges ) )
+        for line in lines:
+            self.assertTrue( ( degree[line[1:-1]] == 2 ).all() )
+            if line[0] != line[-1] or degree[line[0]] != 2:
+                self.assertTrue( degree[line[0]] != 2 and degree[line[-1]] != 2 )
+        self.assertEqual( [ l for l in lines if l[0] in [600, 601, 602] ], [ [600, 601, 602, 600] ] )
+        self.assertRaises( ValueError, polygons.separate_lines, edges, engine="lists" )
+        
+        # The whole of obtain_polygons, with the graph in a square around it.
+        n = len(points)
+        points = np.vstack( ( points, [ (-10, -10), (600, -10), (600, 600), (-10, 600) ] ) )
+        edges = graphs.relative_neighborhood_graph( points[:n] ) + [ (n, n+1), (n+1, n+2), (n+2, n+3), (n+3, n) ]
+        holed, graph, pts = polygons.obtain_polygons( edges, points, engine="dict" )
+        aholed, agraph, apts = polygons.obtain_polygons( np.array( edges ), points )
+        self.assertEqual( apts, pts )
+        self.assertEqual( canonical_graph( aholed, [0]*len(aholed), apts, agraph ), canonical_graph( holed, [0]*len(holed), pts, graph ) )
+        self.assertEqual( max( len(p) for p in aholed ), 2 )
+        self.assertRaises( ValueError, polygons.obtain_polygons, edges, points, engine="sets" )
+    
+    def test_tie_halfedges( self ):
+        def rings( result ):
+            # The polygons as their smallest rotation, a point can be twice around a
+            # bridge, with their lines.
+            polys, conn, dual = result
+            keys = [ min( tuple( p[i:-1] + p[:i] ) for i in range(len(p)-1) ) for p in polys ]
+            return sorted( zip( keys, [ sorted( c[:-1] ) for c in conn ] ) ), [ sorted( set( keys[f] for f in d ) ) for d in dual ]
+        
+        for i in range(10):
+            points = nprnd.uniform(0.0, 512.0, (nprnd.randint(10, 300),2))
+            n = len(points)
+            # A loop with a loose tree hanging from it.
+            points = np.vstack( ( points, [ [600, 600], [700, 600], [700, 700], [800, 800], [900, 900], [650, 620] ] ) )
+            edges = graphs.relative_neighborhood_graph( points[:n] ) + [ (n, n+1), (n+1, n+2), (n+2, n), (n+2, n+3), (n+3, n+4), (n+1, n+5), (0, n+4) ]
+            lines = polygons.separate_lines( set(edges) )
+            dct = polygons.tie_polygons( [ l[:] for l in lines ], points )
+            half = polygons.tie_polygons( [ l[:] for l in lines ], points, engine="halfedge" )
+            self.assertEqual( rings( half ), rings( dct ) )
+            # The whole of obtain_polygons.
+            holed, graph, pts = polygons.obtain_polygons( edges, points, engine="dict" )
+            aholed, agraph, apts = polygons.obtain_polygons( edges, points, engine="arrays" )
+            self.assertEqual( canonical_graph( aholed, [0]*len(aholed), apts, agraph ), canonical_graph( holed, [0]*len(holed), pts, graph ) )
+        self.assertRaises( ValueError, polygons.tie_polygons, lines, points, engine="lists" )
+    
+    def test_subdivision( self ):
+        # Nested squares, the middle one with a triangle as hole.
+        points = [ (0, 0), (10, 0), (10, 10), (0, 10), (3, 3), (6, 3), (6, 6), (3, 6), (4, 4), (5, 4), (5, 5) ]
+        edges = [ (0, 1), (1, 2), (2, 3), (3, 0), (4, 5), (5, 6), (6, 7), (7, 4), (8, 9), (9, 10), (10, 8) ]
+        sub = polygons.obtain_polygons( edges, points, output="subdivision" )
+        located = sub.locate( [ (1, 1), (11, 5), (5, -1), (5, 11), (-1, 5) ] )
+        self.assertEqual( sorted( map( tuple, sub.points[sub.polygons[located[0]][0]].tolist() ) ), [ (0, 0), (0, 10), (10, 0), (10, 10) ] )
+        self.assertTrue( ( located[1:] == -1 ).all() )
+        self.assertEqual( len( set( sub.locate( [ (1, 1), (3.5, 3.5), (4.6, 4.2) ] ) ) ), 3 )
+        
+        points = nprnd.uniform(0.0, 512.0, (300,2))
+        sub = polygons.obtain_polygons( graphs.relative_neighborhood_graph( points ), points, output="subdivision" )
+        query = nprnd.uniform(-32.0, 544.0, (500,2))
+        shapes = [ Polygon( sub.points[p[0]], [ sub.points[r] for r in p[1:] ] ) for p in sub.polygons ]
+        expected = [ ( [ i for i, s in enumerate(shapes) if s.contains( Point(q) ) ] + [-1] )[0] for q in query ]
+        self.assertEqual( sub.locate( query ).tolist(), expected )
+        self.assertTrue( ( polygons.obtain_polygons( [], [], output="subdivision" ).locate( query ) == -1 ).all() )
+    
+    def test_hole_rays( self ):
+        # A square split in cells, with clusters in some cells and one outside.
+        points = [ (x, y) for x in [0, 100, 200] for y in [0, 100, 200] ]
+        edges = [ (0, 1), (1, 2), (3, 4), (4, 5), (6, 7), (7, 8), (0, 3), (3, 6), (1, 4), (4, 7), (2, 5), (5, 8) ]
+        for x, y in [ (10, 10), (110, 10), (110, 110), (250, 250) ]:
+            cluster = nprnd.uniform(0.0, 80.0, (30,2)) + (x, y)
+            edges += [ (a+len(points), b+len(points)) for a, b in graphs.delaunay_graph( cluster ).tolist() ]
+            points += list(map( tuple, cluster ))
+        points = np.array( points )
+        lines = polygons.separate_lines( set(edges) )
+        polys, conn, dual = polygons.tie_polygons( lines, points )
+        results = []
+        for engine in [ "shapely", "prepared", "rays" ]:
+            holed, areas, graph, parent, all_parents = polygons.topology_relations( polys, conn, dual, points, engine=engine )
+            holed = [ p if p is None else [ p[0] ] + sorted( p[1:] ) for p in holed ]
+            results.append( ( holed, areas, [ sorted(g) for g in graph ], parent, all_parents ) )
+        self.assertEqual( results[0], results[1] )
+        self.assertEqual( results[0], results[2] )
+        self.assertEqual( sum( len(p) - 1 for p in results[1][0] if p is not None ), 3 )
+        self.assertRaises( ValueError, polygons.topology_relations, polys, conn, dual, points, engine="rtree" )
+        
+        # Squares inside squares, two holes in the outer one, the left one with
+        # three levels of holes, and clusters in the innermost and the right one.
+        points = []
+        edges = []
+        def square( x0, y0, x1, y1 ):
+            n = len(points)
+            points.extend( [ (x0, y0), (x1, y0), (x1, y1), (x0, y1) ] )
+            edges.extend( (n+i, n+(i+1)%4) for i in range(4) )
+        for corners in [ (0, 0, 300, 300), (20, 20, 140, 140), (160, 20, 280, 140), (40, 40, 120, 120), (60, 60, 100, 100), (400, 0, 500, 100) ]:
+            square( *corners )
+        for x, y in [ (70, 70), (180, 40) ]:
+            cluster = nprnd.uniform(0.0, 20.0, (20,2)) + (x, y)
+            edges += [ (a+len(points), b+len(points)) for a, b in graphs.delaunay_graph( cluster ).tolist() ]
+            points += list(map( tuple, cluster ))
+        points = np.array( points, dtype=float )
+        # The prepared engine runs again as with shapely before 2.
+        results = []
+        bulk = polygons.BULK_QUERY
+        try:
+            for holes, polygons.BULK_QUERY in [ ( "shapely", bulk ), ( "prepared", bulk ), ( "rays", bulk ), ( "prepared", False ) ]:
+                holed, graph, pts = polygons.obtain_polygons( edges, points, holes=holes )
+                results.append( canonical_graph( holed, [0]*len(holed), pts, graph ) )
+                pts = np.array( pts )
+                shapes = [ Polygon( pts[p[0]], [ pts[r] for r in p[1:] ] ) for p in holed ]
+                self.assertTrue( all( s.is_valid for s in shapes ) )
+                self.assertAlmostEqual( sum( s.area for s in shapes ), 300.0**2 + 100.0**2 )
+                self.assertEqual( sorted( len(p) - 1 for p in holed if len(p) > 1 ), [ 1, 1, 1, 1, 2 ] )
+        finally:
+            polygons.BULK_QUERY = bulk
+        self.assertEqual( results[0], results[1] )
+        self.assertEqual( results[0], results[2] )
+        self.assertEqual( results[0], results[3] )
+        self.assertRaises( ValueError, polygons.obtain_polygons, edges, points, holes="rtree" )
+    
+    def test_reduce_arrays( self ):
+        # Clusters inside the cells of a square, some of them holes.
+        points = [ (x, y) for x in [0, 100, 200] for y in [0, 100, 200] ]
+        edges = [ (0, 1), (1, 2), (3, 4), (4, 5), (6, 7), (7, 8), (0, 3), (3, 6), (1, 4), (4, 7), (2, 5), (5, 8) ]
+        for x, y in [ (10, 10), (110, 110), (250, 250) ]:
+            cluster = nprnd.uniform(0.0, 80.0, (40,2)) + (x, y)
+            edges += [ (a+len(points), b+len(points)) for a, b in graphs.relative_neighborhood_graph( cluster ) ]
+            points += list(map( tuple, cluster ))
+        # A point that no polygon uses.
+        points = np.array( points + [ (-50, -50) ] )
+        polys, conn, dual = polygons.tie_polygons( polygons.separate_lines( set(edges) ), points )
+        relations = polygons.topology_relations( polys, conn, dual, points )
+        holed, areas, graph, parent, parent_info, pts = polygons.reduce_everything( *( copy.deepcopy( relations ) + ( points, ) ) )
+        aholed, aareas, agraph, aparent, aparent_info, apts = polygons.reduce_everything( *( copy.deepcopy( relations ) + ( points, ) ), engine="arrays" )
+        self.assertEqual( aholed, holed )
+        self.assertEqual( ( aareas, aparent, aparent_info ), ( areas, parent, parent_info ) )
+        self.assertEqual( agraph, list(map( sorted, graph )) )
+        self.assertEqual( apts.tolist(), np.array( pts ).tolist() )
+        self.assertRaises( ValueError, polygons.reduce_everything, *( relations + ( points, ) ), engine="sets" )
+    
+    def test_measures( self ):
+        points = nprnd.uniform(0.0, 512.0, (300,2))
+        edges = graphs.relative_neighborhood_graph( points )
+        # A square with a square hole, and a triangle in it.
+        n = len(points)
+        points = np.vstack( ( points, [ (600, 0), (700, 0), (700, 100), (600, 100), (630, 30), (670, 30), (670, 70), (630, 70), (640, 40), (660, 40), (650, 60) ] ) )
+        edges += [ (n+i, n+(i+1)%4) for i in range(4) ] + [ (n+4+i, n+4+(i+1)%4) for i in range(4) ] + [ (n+8, n+9), (n+9, n+10), (n+10, n+8) ]
+        holed, graph, pts, ( areas, bounds, perimeters, centroids ) = polygons.obtain_polygons( edges, points, measures=True, engine="arrays" )
+        pts = np.array( pts )
+        self.assertEqual( max( len(p) for p in holed ), 2 )
+        for i, p in enumerate(holed):
+            shape = Polygon( pts[p[0]], [ pts[r] for r in p[1:] ] )
+            self.assertAlmostEqual( areas[i], shape.area )
+            self.assertTrue( np.allclose( bounds[i], shape.bounds ) )
+            self.assertAlmostEqual( perimeters[i], shape.length )
+            self.assertTrue( np.allclose( centroids[i], shape.centroid.coords[0] ) )
+        arrays, graph, pts, measures = polygons.obtain_polygons( edges, points, output="arrays", measures=True )
+        self.assertTrue( np.allclose( measures[0], areas ) )
+        sub = polygons.obtain_polygons( edges, points, output="subdivision", measures=True, engine="arrays" )
+        self.assertTrue( np.allclose( sub.measures[3], centroids ) )
+    
+    def test_polygons_tiled( self ):
+        def canonical( holed, graph, points ):
+            # The rings as coordinates in their smallest rotation, a point can be twice
+            # around a bridge, with the holes sorted, and the graph as pairs of them.
+            keys = []
+            for p in holed:
+                rings = [ [ tuple(map( float, points[i] )) for i in r ] for r in p ]
+                rings = [ min( tuple( r[i:] + r[:i] ) for i in range(len(r)) ) for r in rings ]
+                keys.append( ( rings[0], tuple(sorted(rings[1:])) ) )
+            return sorted(keys), sorted( ( keys[i], keys[j] ) for i, g in enumerate(graph) for j in g )
+        
+        for i in range(3):
+            # A triangulation cut in bands around the center, one inside the other.
+            points = nprnd.uniform(0.0, 1.0, (600,2))
+            edges = set()
+            for s in Delaunay( points ).simplices:
+                edges.update( ( min(a, b), max(a, b) ) for a, b in [ (s[0], s[1]), (s[1], s[2]), (s[0], s[2]) ] )
+            band = np.digitize( la.norm( points - 0.5, axis=1 ), [0.12, 0.25] )
+            edges = [ e for e in sorted(edges) if band[e[0]] == band[e[1]] and nprnd.rand() > 0.3 ]
+            holed, graph, pts = polygons.obtain_polygons( edges, points )
+            
+            # The edges come in chunks, some repeated, and the points from a file.
+            directory = tempfile.mkdtemp()
+            fname = os.path.join( directory, "points.npy" )
+            np.save( fname, points )
+            chunks = np.array_split( np.array( edges + edges[:10] ), 7 )
+            arrays, tgraph, tpts = polygons.obtain_polygons_tiled( iter(chunks), fname, os.path.join( directory, "out" ), tile=20, chunk=100 )
+            poffsets, roffsets, indices = arrays
+            tholed = [ [ indices[roffsets[j]:roffsets[j+1]].tolist() for j in range( poffsets[k], poffsets[k+1] ) ] for k in range( len(poffsets) - 1 ) ]
+            tgraph = [ tgraph[1][tgraph[0][k]:tgraph[0][k+1]].tolist() for k in range( len(tgraph[0]) - 1 ) ]
+            self.assertEqual( canonical( tholed, tgraph, tpts ), canonical( holed, graph, pts ) )
+            self.assertTrue( any( len(p) > 1 for p in tholed ) )
+            self.assertEqual( sorted( map( tuple, np.asarray( tpts ).tolist() ) ), sorted( map( tuple, pts ) ) )
+    
+def benchmark_containments( size=100000 ):
+    """
+    Times the engines of topology_relations in a grid of square cells, each one with
+    a triangle inside, about size polygons in all. Run with -b.
+    """
+    k = int( math.sqrt( size/2 ) )
+    x, y = np.meshgrid( np.arange( k+1 ), np.arange( k+1 ) )
+    grid = np.column_stack( ( x.ravel(), y.ravel() ) ).astype(float)
+    idx = np.arange( (k+1)*(k+1) ).reshape( (k+1, k+1) )
+    edges = np.concatenate( ( np.column_stack( ( idx[:,:-1].ravel(), idx[:,1:].ravel() ) ), np.column_stack( ( idx[:-1,:].ravel(), idx[1:,:].ravel() ) ) ) )
+    corners = ( np.column_stack( ( x[:-1,:-1].ravel(), y[:-1,:-1].ravel() ) ) + nprnd.uniform( 0.2, 0.4, (k*k, 2) ) )
+    triangles = np.concatenate( ( corners, corners + (0.3, 0.0), corners + (0.0, 0.3) ) )
+    t = np.arange( k*k ) + len(grid)
+    edges = np.concatenate( ( edges, np.column_stack( ( t, t + k*k ) ), np.column_stack( ( t + k*k, t + 2*k*k ) ), np.column_stack( ( t + 2*k*k, t ) ) ) )
+    points = np.concatenate( ( grid, triangles ) )
+    
+    offsets, indices = polygons.separate_lines( edges, engine="arrays" )
+    indices = indices.tolist()
+    lines = [ indices[offsets[i]:offsets[i+1]] for i in range(len(offsets)-1) ]
+    polys, conn, dual = polygons.tie_polygons( lines, points, engine="halfedge" )
+    print( "%d polygons" % len(polys), file=sys.stderr )
+    for engine in [ "shapely", "prepared", "rays" ]:
+        start = time.time()
+        polygons.topology_relations( polys, conn, dual, points, engine=engine )
+        print( "%s: %.2fs" % ( engine, time.time() - start ), file=sys.stderr )
+    
 def main(args=None):
     unittest.main()
 
 if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == "-b":
+        benchmark_containments()
+        sys.exit()
     if len(sys.argv) > 1 and sys.argv[1] == "-p":
         del sys.argv[1]
         PROFILE = True